@@ -8,7 +8,13 @@ import sys
 # Add the parent directory to the path so we can import from the root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app as application
+# The process is frozen between requests, so job worker threads can't run here;
+# run due jobs with "flask run-jobs" from a scheduler instead
+os.environ.setdefault("JOB_WORKERS", "0")
+
+from app import create_app
+
+application = create_app()
 
 # This is the handler that Vercel serverless functions use
 def handler(event, context):
@@ -1,54 +1,311 @@
 import os
-import logging
+import itertools
+import threading
+
+import click
 
 from flask import Flask
+from flask.cli import with_appcontext
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from extensions import db
+from sqlalchemy import event
+
+from extensions import db, configure_sqlite
+from services.metrics import init_request_timing
+from services.log_config import configure_logging
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-# Configure logging with more verbose format
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+def create_app():
+    """
+    Create and configure the Flask application.
+    
+    Nothing here touches the database or imports the OpenRouter and gTTS
+    clients, so a cold start only pays for Flask and SQLAlchemy. The schema
+    is set up by init_db(), before the first request or from "flask db-upgrade".
+    
+    Returns:
+        Flask: The configured application
+    """
+    # Logging: level, JSON or text lines, the share of DEBUG records kept, and the bound on queued records
+    log_config = {
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "INFO").upper(),
+        "LOG_FORMAT": os.environ.get("LOG_FORMAT", "json").lower(),
+        "LOG_DEBUG_SAMPLE_RATE": float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01")),
+        "LOG_LIBRARY_LEVEL": os.environ.get("LOG_LIBRARY_LEVEL", "WARNING").upper(),
+        "LOG_QUEUE_SIZE": int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+    }
+    configure_logging(log_config)
+    
+    # Create Flask app
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)  # needed for url_for to generate with https, and client IPs for rate limiting
+    
+    # Configure database - Using SQLite for development, but will use PostgreSQL in Vercel production
+    db_url = os.environ.get("DATABASE_URL", "sqlite:///language_bot.db")
+
+    # Handle PostgreSQL format from Vercel/Heroku which starts with postgres://
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.update(log_config)
+
+    # OpenRouter API configuration - used for both chatbot and translation functionality
+    app.config["OPENROUTER_API_KEY"] = os.environ.get("OPENROUTER_API_KEY", "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")
+    app.config["OPENROUTER_MODEL"] = os.environ.get("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
+
+    # Models for each task, comma-separated in fallback order (default: OPENROUTER_MODEL).
+    # Each call goes to the fastest healthy model by latency EWMA, falling back down the list
+    app.config["MODEL_ROUTES"] = {
+        task: [model.strip() for model in os.environ.get(f"OPENROUTER_{task.upper()}_MODELS", "").split(",") if model.strip()]
+        for task in ("chat", "translation", "error_detection", "summary")
+    }
+    app.config["MODEL_EWMA_ALPHA"] = float(os.environ.get("MODEL_EWMA_ALPHA", "0.2"))
+    app.config["MODEL_MAX_ERROR_RATE"] = float(os.environ.get("MODEL_MAX_ERROR_RATE", "0.5"))
+    app.config["MODEL_ERROR_HALF_LIFE"] = float(os.environ.get("MODEL_ERROR_HALF_LIFE", "60"))  # Seconds for an unused model's error EWMA to halve
+
+    # Shared OpenRouter client settings: connection pool, timeouts (seconds) and retry backoff
+    app.config["OPENROUTER_BASE_URL"] = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    app.config["OPENROUTER_TIMEOUT"] = float(os.environ.get("OPENROUTER_TIMEOUT", "60"))
+    app.config["OPENROUTER_TOTAL_TIMEOUT"] = float(os.environ.get("OPENROUTER_TOTAL_TIMEOUT", "90"))  # Across every attempt, retry and fallback of one call
+    app.config["OPENROUTER_CONNECT_TIMEOUT"] = float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", "5"))
+    app.config["OPENROUTER_MAX_CONNECTIONS"] = int(os.environ.get("OPENROUTER_MAX_CONNECTIONS", "20"))
+    app.config["OPENROUTER_MAX_KEEPALIVE"] = int(os.environ.get("OPENROUTER_MAX_KEEPALIVE", "10"))
+    app.config["OPENROUTER_MAX_RETRIES"] = int(os.environ.get("OPENROUTER_MAX_RETRIES", "2"))
+    app.config["OPENROUTER_RETRY_BACKOFF"] = float(os.environ.get("OPENROUTER_RETRY_BACKOFF", "0.5"))
+    app.config["OPENROUTER_RETRY_BACKOFF_MAX"] = float(os.environ.get("OPENROUTER_RETRY_BACKOFF_MAX", "8"))
+
+    # Translation cache: in-process LRU (size in entries, TTL in seconds) backed by the database
+    app.config["TRANSLATION_CACHE_SIZE"] = int(os.environ.get("TRANSLATION_CACHE_SIZE", "2048"))
+    app.config["TRANSLATION_CACHE_TTL"] = float(os.environ.get("TRANSLATION_CACHE_TTL", "86400"))
+    app.config["TRANSLATION_CACHE_PERSIST"] = os.environ.get("TRANSLATION_CACHE_PERSIST", "true").lower() == "true"
+
+    # Pre-generated conversation openers: openers kept per combination, and uses before one is retired
+    app.config["OPENER_POOL_SIZE"] = int(os.environ.get("OPENER_POOL_SIZE", "5"))
+    app.config["OPENER_MAX_USES"] = int(os.environ.get("OPENER_MAX_USES", "20"))
+
+    # Text-to-speech audio cache (defaults to a directory under the system temp dir)
+    app.config["TTS_CACHE_DIR"] = os.environ.get("TTS_CACHE_DIR")
+    app.config["TTS_CACHE_MAX_BYTES"] = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+    app.config["TTS_PRERENDER"] = os.environ.get("TTS_PRERENDER", "true").lower() == "true"
+    app.config["TTS_MAX_WORKERS"] = int(os.environ.get("TTS_MAX_WORKERS", "4"))  # Sentences synthesized at once, across all requests
+    app.config["TTS_MIN_CHUNK_CHARS"] = int(os.environ.get("TTS_MIN_CHUNK_CHARS", "20"))  # Shorter sentences are joined to the next one
 
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+    # Conversation history pagination (messages per page)
+    app.config["HISTORY_PAGE_SIZE"] = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+    app.config["HISTORY_MAX_PAGE_SIZE"] = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "200"))
 
-# Configure database - Using SQLite for development, but will use PostgreSQL in Vercel production
-db_url = os.environ.get("DATABASE_URL", "sqlite:///language_bot.db")
+    # Cached user profiles and conversation metadata (entries per cache, TTL in seconds)
+    app.config["PROFILE_CACHE_SIZE"] = int(os.environ.get("PROFILE_CACHE_SIZE", "10000"))
+    app.config["PROFILE_CACHE_TTL"] = float(os.environ.get("PROFILE_CACHE_TTL", "300"))
 
-# Handle PostgreSQL format from Vercel/Heroku which starts with postgres://
-if db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
+    # Conversation context sent with each turn: token budget, message window and rolling summary size
+    app.config["CONTEXT_TOKEN_BUDGET"] = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+    app.config["CONTEXT_CHARS_PER_TOKEN"] = int(os.environ.get("CONTEXT_CHARS_PER_TOKEN", "4"))  # Used to estimate token counts
+    app.config["CONTEXT_MAX_MESSAGES"] = int(os.environ.get("CONTEXT_MAX_MESSAGES", "40"))
+    app.config["CONTEXT_SUMMARY_WORDS"] = int(os.environ.get("CONTEXT_SUMMARY_WORDS", "120"))
+    app.config["CONTEXT_SUMMARY_BATCH"] = int(os.environ.get("CONTEXT_SUMMARY_BATCH", "40"))
 
-app.config["SQLALCHEMY_DATABASE_URI"] = db_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Error detection pre-screen: result cache (entries, TTL in seconds) and the local clean-phrase check
+    app.config["ERROR_CACHE_SIZE"] = int(os.environ.get("ERROR_CACHE_SIZE", "4096"))
+    app.config["ERROR_CACHE_TTL"] = float(os.environ.get("ERROR_CACHE_TTL", "86400"))
+    app.config["ERROR_PRESCREEN_MAX_WORDS"] = int(os.environ.get("ERROR_PRESCREEN_MAX_WORDS", "6"))
+    app.config["ERROR_PRESCREEN_CONFIDENCE"] = float(os.environ.get("ERROR_PRESCREEN_CONFIDENCE", "1.0"))
 
-# Initialize the database with the app
-db.init_app(app)
+    # Micro-batching of concurrent error detections (max wait in seconds), off by default
+    app.config["ERROR_BATCH_ENABLED"] = os.environ.get("ERROR_BATCH_ENABLED", "false").lower() == "true"
+    app.config["ERROR_BATCH_MAX_SIZE"] = int(os.environ.get("ERROR_BATCH_MAX_SIZE", "8"))
+    app.config["ERROR_BATCH_MAX_WAIT"] = float(os.environ.get("ERROR_BATCH_MAX_WAIT", "0.03"))
 
-# OpenRouter API configuration - used for both chatbot and translation functionality
-app.config["OPENROUTER_API_KEY"] = os.environ.get("OPENROUTER_API_KEY", "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")
-app.config["OPENROUTER_MODEL"] = "google/gemini-2.0-flash-exp:free"
+    # Example errors shown per error type in a conversation review
+    app.config["REVIEW_EXAMPLES_PER_TYPE"] = int(os.environ.get("REVIEW_EXAMPLES_PER_TYPE", "10"))
 
-with app.app_context():
-    # Import models to ensure they're registered with SQLAlchemy
-    import models  # noqa: F401
+    # Rate limits on API routes that call OpenRouter or gTTS (tokens per second and burst size)
+    app.config["RATE_LIMIT_ENABLED"] = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    app.config["RATE_LIMIT_SESSION_RATE"] = float(os.environ.get("RATE_LIMIT_SESSION_RATE", "0.5"))
+    app.config["RATE_LIMIT_SESSION_BURST"] = float(os.environ.get("RATE_LIMIT_SESSION_BURST", "10"))
+    app.config["RATE_LIMIT_IP_RATE"] = float(os.environ.get("RATE_LIMIT_IP_RATE", "2"))
+    app.config["RATE_LIMIT_IP_BURST"] = float(os.environ.get("RATE_LIMIT_IP_BURST", "40"))
+
+    # OpenRouter and gTTS calls allowed in flight at once, and the queue in front of them (timeouts in seconds).
+    # This protects the upstream services, so it is switched separately from the per-client rate limits.
+    app.config["UPSTREAM_GATE_ENABLED"] = os.environ.get("UPSTREAM_GATE_ENABLED", "true").lower() == "true"
+    app.config["UPSTREAM_MAX_CONCURRENT"] = int(os.environ.get("UPSTREAM_MAX_CONCURRENT", "32"))
+    app.config["UPSTREAM_MAX_QUEUE"] = int(os.environ.get("UPSTREAM_MAX_QUEUE", "64"))
+    app.config["UPSTREAM_QUEUE_TIMEOUT"] = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))
+    app.config["UPSTREAM_RETRY_AFTER"] = float(os.environ.get("UPSTREAM_RETRY_AFTER", "2"))
+
+    # Circuit breakers on each model's OpenRouter calls: open on a high failure or slow-call rate (times in seconds)
+    app.config["CIRCUIT_BREAKER_ENABLED"] = os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    app.config["CIRCUIT_WINDOW"] = float(os.environ.get("CIRCUIT_WINDOW", "60"))
+    app.config["CIRCUIT_MIN_CALLS"] = int(os.environ.get("CIRCUIT_MIN_CALLS", "10"))
+    app.config["CIRCUIT_FAILURE_RATE"] = float(os.environ.get("CIRCUIT_FAILURE_RATE", "0.5"))
+    app.config["CIRCUIT_SLOW_CALL_SECONDS"] = float(os.environ.get("CIRCUIT_SLOW_CALL_SECONDS", "20"))
+    app.config["CIRCUIT_SLOW_CALL_RATE"] = float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+    app.config["CIRCUIT_OPEN_SECONDS"] = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+    app.config["CIRCUIT_HALF_OPEN_CALLS"] = int(os.environ.get("CIRCUIT_HALF_OPEN_CALLS", "3"))
+
+    # Concurrency settings for independent upstream calls (timeouts in seconds)
+    app.config["ORCHESTRATOR_MAX_WORKERS"] = int(os.environ.get("ORCHESTRATOR_MAX_WORKERS", "16"))
+    app.config["ERROR_DETECTION_TIMEOUT"] = float(os.environ.get("ERROR_DETECTION_TIMEOUT", "15"))
+    app.config["BOT_RESPONSE_TIMEOUT"] = float(os.environ.get("BOT_RESPONSE_TIMEOUT", "45"))
     
-    # Create all tables
-    db.create_all()
+    # Background jobs: worker threads per process, and when to poll, retry and reclaim a stuck job (seconds)
+    app.config["JOBS_ENABLED"] = os.environ.get("JOBS_ENABLED", "true").lower() == "true"
+    app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", "2"))
+    app.config["JOB_POLL_INTERVAL"] = float(os.environ.get("JOB_POLL_INTERVAL", "5"))
+    app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+    app.config["JOB_RETRY_DELAY"] = float(os.environ.get("JOB_RETRY_DELAY", "10"))
+    app.config["JOB_LEASE_SECONDS"] = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+    app.config["JOB_RETENTION_DAYS"] = float(os.environ.get("JOB_RETENTION_DAYS", "7"))  # Failed jobs older than this are deleted
+    app.config["JOB_PRUNE_INTERVAL"] = float(os.environ.get("JOB_PRUNE_INTERVAL", "3600"))
+    
+    # Prometheus metrics at /metrics, and an optional per-request Server-Timing breakdown
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    app.config["SERVER_TIMING_ENABLED"] = os.environ.get("SERVER_TIMING_ENABLED", "false").lower() == "true"
+    
+    # Set up the schema before the first request rather than at import time
+    app.config["DB_AUTO_INIT"] = os.environ.get("DB_AUTO_INIT", "true").lower() == "true"
+    
+    # Initialize the database with the app
+    db.init_app(app)
+    
+    with app.app_context():
+        # Import models to ensure they're registered with SQLAlchemy
+        import models  # noqa: F401
+        
+        # Enable WAL and a busy timeout on SQLite so concurrent writers wait instead of failing
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", configure_sqlite)
+    
+    if app.config["DB_AUTO_INIT"]:
+        _init_db_before_first_request(app)
     
     # Import and register routes
     from routes import register_routes
     register_routes(app)
+    
+    init_request_timing(app)
+    
+    from services.rate_limiter import init_rate_limiting
+    init_rate_limiting(app)
+    
+    from services.job_queue import init_job_workers
+    init_job_workers(app)
+    
+    for command in (warm_openers, db_upgrade, db_check_plans, run_jobs, recount_progress):
+        app.cli.add_command(command)
+    
+    return app
+
+
+def init_db():
+    """
+    Create all tables, then bring an existing database up to the current schema.
+    
+    Must be called inside an app context.
+    
+    Returns:
+        list: The migration versions applied by this call
+    """
+    from migrations import upgrade
+    
+    db.create_all()
+    return upgrade(db.engine)
+
+
+def _init_db_before_first_request(app):
+    """Run init_db() once, when the first request arrives."""
+    lock = threading.Lock()
+    done = False
+    
+    @app.before_request
+    def ensure_schema():
+        nonlocal done
+        if done:
+            return
+        with lock:
+            if not done:
+                init_db()
+                done = True
+
+
+@click.command("warm-openers")
+@click.option("--scenario", multiple=True, help="Scenario IDs to warm (default: all)")
+@click.option("--target", multiple=True, help="Target languages to warm (default: all)")
+@click.option("--native", multiple=True, help="Native languages to warm (default: all)")
+@click.option("--level", multiple=True, help="Proficiency levels to warm (default: all)")
+@with_appcontext
+def warm_openers(scenario, target, native, level):
+    """Fill the opener pool for the selected scenario and language combinations."""
+    from routes import LANGUAGES, PROFICIENCY_LEVELS, SCENARIOS
+    from services.opener_pool import refill_pool
+    
+    init_db()
+    
+    scenarios = scenario or [s["id"] for s in SCENARIOS]
+    for combination in itertools.product(scenarios, target or LANGUAGES, native or LANGUAGES, level or PROFICIENCY_LEVELS):
+        if combination[1] == combination[2]:
+            continue
+        added = refill_pool(*combination)
+        click.echo(f"{' / '.join(combination)}: {added} openers added")
+
+
+@click.command("db-upgrade")
+@with_appcontext
+def db_upgrade():
+    """Create missing tables and apply pending schema migrations."""
+    applied = init_db()
+    click.echo(f"Applied migrations: {', '.join(applied)}" if applied else "Database is up to date")
+
+
+@click.command("db-check-plans")
+@with_appcontext
+def db_check_plans():
+    """Exit non-zero if a hot query's plan scans instead of searching an index, e.g. from CI."""
+    from migrations import check_query_plans
+    
+    problems = check_query_plans(db.engine)
+    for problem in problems:
+        click.echo(f"Hot query not served by an index: {problem}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("All hot queries use an index")
+
+
+@click.command("run-jobs")
+@click.option("--max-jobs", type=int, default=None, help="Stop after this many jobs (default: until none are due)")
+@with_appcontext
+def run_jobs(max_jobs):
+    """Run due background jobs in the foreground, e.g. from cron where worker threads can't run, then prune old failed jobs."""
+    from services.job_queue import run_pending, prune_failed_jobs
+    
+    init_db()
+    click.echo(f"Ran {run_pending(max_jobs)} jobs")
+    click.echo(f"Pruned {prune_failed_jobs()} failed jobs")
+
+
+@click.command("recount-progress")
+@click.option("--user", "user_ids", type=int, multiple=True, help="User IDs to recount (default: all)")
+@with_appcontext
+def recount_progress(user_ids):
+    """Queue jobs that rebuild users' error count aggregates from their saved errors."""
+    from models import User
+    from services.job_queue import enqueue
+    
+    init_db()
+    
+    user_ids = user_ids or db.session.execute(db.select(User.id)).scalars().all()
+    for user_id in user_ids:
+        enqueue("progress.recount", user_id=user_id)
+    db.session.commit()
+    click.echo(f"Queued recounts for {len(user_ids)} users")
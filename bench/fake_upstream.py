@@ -0,0 +1,194 @@
+"""
+Stand-in for OpenRouter and Google's TTS endpoint, for benchmarks without a network.
+
+Serves the OpenRouter chat completions API (plain and streamed) and the
+Google Translate RPC that gTTS calls, with configurable latency, jitter and
+error rate. Responses are canned but shaped like the real thing, so every
+code path in the app runs: error detection (single and batched) returns
+JSON errors, translation returns one line, and TTS returns MP3-sized audio.
+
+Point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:<port>/api/v1.
+gTTS has no URL setting, so bench/serve.py patches it to use this server.
+
+Usage:
+    python bench/fake_upstream.py [--port 8765] [--latency 0.3] [--jitter 0.1] [--error-rate 0]
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Path gTTS posts to, relative to the Google Translate host
+TTS_PATH = "/_/TranslateWebserverUi/data/batchexecute"
+
+CHAT_REPLIES = [
+    "¡Hola! ¿Qué desea tomar hoy? Tenemos café, té y chocolate caliente.",
+    "Muy bien. ¿Lo quiere con leche o solo? También tenemos pasteles frescos.",
+    "Perfecto, son tres euros con cincuenta. ¿Va a pagar con tarjeta o en efectivo?",
+    "¡Claro que sí! Aquí tiene su pedido. ¡Que tenga un buen día!",
+]
+
+TRANSLATIONS = [
+    "Hello! What would you like to have today? We have coffee, tea and hot chocolate.",
+    "Very well. Would you like it with milk or black? We also have fresh pastries.",
+]
+
+# Bytes of fake MP3 audio per character of the request's encoded text, roughly what gTTS produces
+AUDIO_BYTES_PER_CHAR = 80
+
+
+def completion_text(system_prompt, user_content, rng):
+    """Pick a canned response that fits the request, judged by its system prompt."""
+    if "independent messages" in system_prompt:
+        items = json.loads(user_content)["messages"]
+        return json.dumps({"results": [
+            {"id": item["id"], "errors": detected_errors(item["text"], rng)} for item in items
+        ]})
+    if "language tutor" in system_prompt:
+        return json.dumps({"errors": detected_errors(user_content, rng)})
+    if "translator" in system_prompt:
+        return rng.choice(TRANSLATIONS)
+    if "running summary" in system_prompt:
+        return "The student ordered a coffee with milk and asked about pastries. They plan to pay by card."
+    return rng.choice(CHAT_REPLIES)
+
+
+def detected_errors(text, rng):
+    """Report an error in about half the messages, using one of the message's own words."""
+    words = re.findall(r"\w+", text)
+    if not words or rng.random() < 0.5:
+        return []
+    word = rng.choice(words)
+    return [{"error_text": word, "correction": word + "s", "error_type": rng.choice(["grammar", "vocabulary", "syntax"])}]
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = None  # set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        rng = random.Random()
+
+        if self.path.startswith(TTS_PATH):
+            self._wait(self.settings.tts_latency)
+            if rng.random() < self.settings.error_rate:
+                return self._send(503, "text/plain", b"Service unavailable")
+            return self._send_speech(body)
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            request = json.loads(body)
+            self._wait(self.settings.latency)
+            if rng.random() < self.settings.error_rate:
+                error = json.dumps({"error": {"message": "Upstream overloaded", "code": 503}}).encode()
+                return self._send(503, "application/json", error)
+
+            messages = request["messages"]
+            text = completion_text(messages[0]["content"], messages[-1]["content"], rng)
+            if request.get("stream"):
+                return self._send_stream(request["model"], text)
+            return self._send_completion(request["model"], messages, text)
+
+        self._send(404, "text/plain", b"Not found")
+
+    def _wait(self, latency):
+        """Sleep for the base latency plus uniform jitter."""
+        jitter = self.settings.jitter
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def _send(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_completion(self, model, messages, text):
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        completion = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": (prompt_chars + len(text)) // 4
+            }
+        }
+        self._send(200, "application/json", json.dumps(completion).encode())
+
+    def _send_stream(self, model, text):
+        """Stream the text word by word as server-sent events, in chunked encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for index, word in enumerate(text.split(" ")):
+            if index:
+                time.sleep(self.settings.token_interval)
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if not index else " " + word}, "finish_reason": None}]
+            }
+            write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        write_chunk(b"data: [DONE]\n\n")
+        write_chunk(b"")
+
+    def _send_speech(self, body):
+        """Answer a gTTS RPC with fake MP3 audio, sized by the text's length."""
+        form = dict(pair.split("=", 1) for pair in body.decode().split("&") if "=" in pair)
+        text_length = len(form.get("f.req", ""))
+        audio = b"ID3" + b"\x00" * (text_length * AUDIO_BYTES_PER_CHAR)
+        encoded = base64.b64encode(audio).decode()
+        payload = ")]}'\n\n" + json.dumps(
+            [["wrb.fr", "jQ1olc", json.dumps([encoded]), None, None, None, "generic"]],
+            separators=(",", ":")  # gTTS matches the RPC name and payload without spaces
+        )
+        self._send(200, "application/json; charset=utf-8", payload.encode())
+
+
+def serve(settings):
+    """Run the fake upstream server until interrupted."""
+    FakeUpstreamHandler.settings = settings
+    server = ThreadingHTTPServer((settings.host, settings.port), FakeUpstreamHandler)
+    server.daemon_threads = True
+    print(f"Fake upstream listening on http://{settings.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before each completion starts")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform jitter added to every latency, in seconds")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="Seconds between streamed words")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="Seconds before each TTS response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    serve(parse_args())
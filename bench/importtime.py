@@ -0,0 +1,104 @@
+"""
+Check the cold start time of the app against a budget.
+
+Runs "python -X importtime" in a fresh interpreter that imports the app and
+calls create_app(), the same work a serverless cold start does before the
+first request. Prints the slowest imports and exits with status 1 if the
+total import time or create_app() time is over budget, or if a module that
+should load lazily (the OpenRouter and gTTS clients) was imported.
+
+Usage:
+    python bench/importtime.py [--budget-ms 700] [--create-budget-ms 150] [--top 15]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only needed once a request calls OpenRouter or gTTS
+LAZY_MODULES = ("openai", "httpx", "gtts", "requests")
+
+# Imports the app and times create_app() separately from the imports.
+# The marker separates interpreter startup from the app's own imports.
+COLD_START = """
+import sys, time
+sys.stderr.write("cold-start\\n")
+sys.stderr.flush()
+from app import create_app
+started = time.perf_counter()
+create_app()
+print(f"create_app_us={int((time.perf_counter() - started) * 1e6)}")
+"""
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure():
+    """
+    Run a cold start in a fresh interpreter.
+
+    Returns:
+        tuple: (imports, loaded, create_app_us), where imports lists
+               (cumulative_us, module) for every top-level import and loaded
+               is the set of every module imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    imports = []
+    loaded = set()
+    lines = result.stderr.splitlines()
+    for line in lines[lines.index("cold-start") + 1:]:
+        match = _IMPORT_LINE.match(line)
+        # Only top-level imports, so nested modules aren't counted twice
+        if not match:
+            continue
+        loaded.add(match.group(4))
+        if len(match.group(3)) == 1:
+            imports.append((int(match.group(2)), match.group(4)))
+
+    create_app_us = int(re.search(r"create_app_us=(\d+)", result.stdout).group(1))
+    return imports, loaded, create_app_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", "700")),
+                        help="Maximum total import time in milliseconds")
+    parser.add_argument("--create-budget-ms", type=float, default=float(os.environ.get("CREATE_APP_BUDGET_MS", "150")),
+                        help="Maximum create_app() time in milliseconds")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    imports, loaded, create_app_us = measure()
+    total_ms = sum(us for us, _ in imports) / 1000
+    create_app_ms = create_app_us / 1000
+
+    print(f"{'ms':>9}  module")
+    for us, module in sorted(imports, reverse=True)[:args.top]:
+        print(f"{us / 1000:9.1f}  {module}")
+    print()
+    print(f"Imports:      {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"create_app(): {create_app_ms:.1f} ms (budget {args.create_budget_ms:.0f} ms)")
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"Imported at cold start but should load lazily: {', '.join(eager)}", file=sys.stderr)
+
+    over_budget = total_ms > args.budget_ms or create_app_ms > args.create_budget_ms
+    if over_budget:
+        print("Cold start is over budget", file=sys.stderr)
+    return 1 if over_budget or eager else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Load test the app end to end, without a network.
+
+Starts bench/fake_upstream.py and bench/serve.py on free local ports, then
+runs scripted user sessions against the app: setup, start_conversation,
+N x send_message, history, review, then the last reply's speech through the
+TTS chunk endpoints. Reports throughput and p50/p95/p99 latency per
+endpoint, and exits with status 1 if the error rate or any endpoint's p95 is
+over budget, so it can gate CI.
+
+With --stream, messages go through the streaming endpoint and the time to
+the first token is reported as the "first_token" endpoint. Replies the app
+fell back to because an upstream call failed count as errors, even though
+they come with a 200.
+
+Usage:
+    python bench/loadtest.py [--sessions 20] [--concurrency 4] [--messages 5] [--stream]
+                             [--latency 0.3] [--jitter 0.1] [--error-rate 0]
+                             [--budget send_message=1500 ...] [--max-error-rate 0.01] [--json report.json]
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, "bench")
+sys.path.insert(0, ROOT)
+
+from services.ai_service import FALLBACK_RESPONSE, DEGRADED_RESPONSE, MISSING_KEY_RESPONSE  # noqa: E402
+
+# Endpoints in the order a session calls them, for the report
+ENDPOINTS = ("setup", "start_conversation", "send_message", "first_token", "history", "review", "tts_chunks", "tts_chunk")
+
+# Bot replies the app sends instead of a generated one when an upstream call fails
+FALLBACK_REPLIES = {FALLBACK_RESPONSE[0], DEGRADED_RESPONSE[0], MISSING_KEY_RESPONSE[0]}
+
+LANGUAGES = ("Spanish", "French", "German", "Italian")
+SCENARIOS = ("cafe", "shopping", "airport", "meeting", "doctor")
+MESSAGES = (
+    "Hola, quiero un cafe con leche por favor",
+    "Cuanto cuesta el pastel de chocolate",
+    "Yo tener mucho hambre hoy",
+    "Gracias",
+    "Me gustaria pagar con tarjeta si es posible",
+    "Donde esta el baño",
+    "Quiero dos croissants y un zumo de naranja",
+)
+
+
+def free_port():
+    """Ask the OS for a free local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=30.0):
+    """Poll a URL until it answers, or raise after the timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not start within {timeout:.0f}s")
+            time.sleep(0.2)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, rank - 1)]
+
+
+class Recorder:
+    """Collects the latency and outcome of every request, across threads."""
+
+    def __init__(self):
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        """Summarize the recorded requests as a dict of per-endpoint stats and totals."""
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            values = sorted(self.samples[endpoint])
+            if not values:
+                continue
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors[endpoint],
+                "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        requests = sum(stats["requests"] for stats in endpoints.values())
+        errors = sum(stats["errors"] for stats in endpoints.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class Session:
+    """One simulated user, with its own cookie jar."""
+
+    def __init__(self, base_url, recorder, rng):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _open(self, path, data=None, json_body=None):
+        """Open a request to the app; the caller reads the response."""
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            data = urllib.parse.urlencode(data).encode()
+        return self.opener.open(urllib.request.Request(self.base_url + path, data=data, headers=headers), timeout=120)
+
+    def request(self, endpoint, path, data=None, json_body=None, check=None):
+        """
+        Send one timed request and return its body, or None if it failed.
+
+        check, if given, is called with the parsed JSON body and returns whether
+        the response is good, e.g. not a fallback reply.
+        """
+        started = time.perf_counter()
+        body, ok = None, False
+        try:
+            with self._open(path, data, json_body) as response:
+                body = response.read()
+                ok = check is None or check(json.loads(body))
+        except (urllib.error.URLError, OSError, ValueError):
+            pass
+        self.recorder.record(endpoint, time.perf_counter() - started, ok)
+        return body
+
+    def stream(self, endpoint, path, json_body):
+        """
+        Send one timed request to a server-sent events endpoint, recording the
+        time to its first token as "first_token".
+
+        Returns:
+            dict: The data of each event by name, or None if the request failed
+        """
+        started = time.perf_counter()
+        events, event, first_token = {}, None, None
+        try:
+            with self._open(path, json_body=json_body) as response:
+                for line in response:
+                    line = line.decode().rstrip("\n")
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event is not None:
+                        if event == "token" and first_token is None:
+                            first_token = time.perf_counter() - started
+                        events[event] = json.loads(line[len("data: "):])
+        except (urllib.error.URLError, OSError, ValueError):
+            events = None
+
+        elapsed = time.perf_counter() - started
+        ok = events is not None and "done" in events and is_generated(events.get("bot_message", {}))
+        if first_token is not None:
+            self.recorder.record("first_token", first_token, True)
+        self.recorder.record(endpoint, elapsed, ok)
+        return events
+
+    def play_speech(self, message_id):
+        """Fetch a message's speech the way the chat page does: the chunk list, then each chunk in order."""
+        body = self.request("tts_chunks", f"/api/tts/{message_id}/chunks",
+                            check=lambda manifest: bool(manifest.get("chunks")))
+        if body is None:
+            return
+        for chunk in json.loads(body)["chunks"]:
+            if self.request("tts_chunk", chunk["url"]) is None:
+                return
+
+    def run(self, messages, stream):
+        """Play one scripted session from setup to text-to-speech."""
+        target = self.rng.choice(LANGUAGES)
+        if self.request("setup", "/setup", data={
+            "native_language": "English",
+            "target_language": target,
+            "proficiency_level": self.rng.choice(("Beginner", "Intermediate", "Advanced")),
+        }) is None:
+            return
+
+        body = self.request("start_conversation", "/api/start_conversation",
+                            json_body={"scenario": self.rng.choice(SCENARIOS)},
+                            check=lambda reply: is_generated(reply.get("message", {})))
+        if body is None:
+            return
+        bot_message_id = json.loads(body)["message"]["id"]
+
+        for _ in range(messages):
+            message = {"message": self.rng.choice(MESSAGES)}
+            if stream:
+                events = self.stream("send_message", "/api/send_message/stream", message)
+                if events and "bot_message" in events:
+                    bot_message_id = events["bot_message"]["id"]
+            else:
+                body = self.request("send_message", "/api/send_message", json_body=message,
+                                    check=lambda reply: is_generated(reply.get("bot_message", {})))
+                if body is not None:
+                    bot_message_id = json.loads(body)["bot_message"]["id"]
+
+        self.request("history", "/api/history")
+        self.request("review", "/api/review")
+        self.play_speech(bot_message_id)
+
+
+def is_generated(message):
+    """Check that a bot message in a response is a generated reply rather than a fallback."""
+    return message.get("content") not in FALLBACK_REPLIES
+
+
+def start(command, ready_url):
+    """Start a helper process and wait until it answers."""
+    process = subprocess.Popen([sys.executable] + command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        wait_for(ready_url)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def print_report(report):
+    print(f"{'endpoint':<20}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<20}{stats['requests']:>9}{stats['errors']:>8}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    print()
+    print(f"{report['requests']} requests in {report['elapsed_s']:.2f}s: {report['throughput_rps']:.1f} req/s, "
+          f"error rate {report['error_rate']:.2%}")
+
+
+def check_budgets(report, budgets, max_error_rate):
+    """Return a message for every endpoint over its p95 budget, and for too many errors."""
+    problems = []
+    for endpoint, budget_ms in budgets.items():
+        stats = report["endpoints"].get(endpoint)
+        if stats is None:
+            problems.append(f"{endpoint}: no requests recorded")
+        elif stats["p95_ms"] > budget_ms:
+            problems.append(f"{endpoint}: p95 {stats['p95_ms']:.1f} ms is over its {budget_ms:.0f} ms budget")
+    if report["error_rate"] > max_error_rate:
+        problems.append(f"error rate {report['error_rate']:.2%} is over {max_error_rate:.2%}")
+    return problems
+
+
+def parse_budget(value):
+    endpoint, _, budget = value.partition("=")
+    if endpoint not in ENDPOINTS or not budget:
+        raise argparse.ArgumentTypeError(f"expected ENDPOINT=MS with ENDPOINT one of {', '.join(ENDPOINTS)}")
+    return endpoint, float(budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions to run in total")
+    parser.add_argument("--concurrency", type=int, default=4, help="Sessions running at once")
+    parser.add_argument("--messages", type=int, default=5, help="Messages sent per session")
+    parser.add_argument("--stream", action="store_true", help="Send messages through the streaming endpoint")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the scripted choices")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Fake upstream latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake upstream requests that fail")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[], metavar="ENDPOINT=MS",
+                        help="Fail if the endpoint's p95 latency is over this many milliseconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Fail if more requests than this fail")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    upstream_url = f"http://127.0.0.1:{free_port()}"
+    app_port = free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    upstream = start([os.path.join(BENCH, "fake_upstream.py"), "--port", upstream_url.rsplit(":", 1)[1],
+                      "--latency", str(args.latency), "--jitter", str(args.jitter),
+                      "--error-rate", str(args.error_rate)], upstream_url)
+    app = None
+    try:
+        app = start([os.path.join(BENCH, "serve.py"), "--port", str(app_port), "--upstream", upstream_url], app_url)
+
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        sessions = [Session(app_url, recorder, random.Random(rng.random())) for _ in range(args.sessions)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for future in [executor.submit(session.run, args.messages, args.stream) for session in sessions]:
+                future.result()
+        report = recorder.report(time.perf_counter() - started)
+    finally:
+        for process in (app, upstream):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("budget", "json")}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    problems = check_budgets(report, dict(args.budget), args.max_error_rate)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
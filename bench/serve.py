@@ -0,0 +1,62 @@
+"""
+Serve the app against bench/fake_upstream.py instead of OpenRouter and Google.
+
+Points OpenRouter calls at the fake server through OPENROUTER_BASE_URL, and
+patches gTTS, which has no URL setting, to send its requests there too. The
+database and TTS cache go in a fresh temporary directory unless
+DATABASE_URL or TTS_CACHE_DIR are set. The per-client rate limits are off
+unless --rate-limit is given, so a load test measures the app rather than the
+limiter. The upstream concurrency gate stays on, as in production.
+
+Usage:
+    python bench/serve.py [--port 5001] [--upstream http://127.0.0.1:8765] [--rate-limit]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--upstream", default="http://127.0.0.1:8765", help="Base URL of bench/fake_upstream.py")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the per-session and per-IP rate limits on")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="linguabot-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("TTS_CACHE_DIR", os.path.join(workdir, "tts"))
+    os.environ["OPENROUTER_BASE_URL"] = f"{args.upstream}/api/v1"
+    os.environ["OPENROUTER_API_KEY"] = "bench"
+    os.environ["RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    os.environ["LOG_LEVEL"] = args.log_level
+
+    # gTTS always builds https://translate.google.<tld>/<path>, so send it to the fake server instead
+    import gtts.tts
+    gtts.tts._translate_url = lambda tld="com", path="": f"{args.upstream}/{path}"
+
+    sys.path.insert(0, ROOT)
+    from app import create_app
+
+    app = create_app()
+    logging.getLogger("werkzeug").setLevel(args.log_level)
+
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f"App listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
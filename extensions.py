@@ -3,13 +3,48 @@ Shared extensions and configurations for the application.
 This helps avoid circular imports by placing shared objects in a separate file.
 """
 
+from contextlib import contextmanager
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
+from services.metrics import span
+
 
 class Base(DeclarativeBase):
     pass
 
 
 # Create the database extension
-db = SQLAlchemy(model_class=Base)
\ No newline at end of file
+db = SQLAlchemy(model_class=Base)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Group a request's writes into a single transaction.
+    
+    Commits once when the block finishes, or rolls everything back if it raises.
+    Objects added inside the block can be flushed to get their IDs before the commit.
+    """
+    try:
+        yield db.session
+        with span('db.commit'):
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def configure_sqlite(dbapi_connection, connection_record):
+    """
+    Tune SQLite connections for concurrent requests.
+    
+    WAL lets readers work alongside a writer, and busy_timeout makes writers
+    wait for the lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
@@ -1,13 +1,6 @@
-import logging
-from app import app
-from dotenv import load_dotenv
-load_dotenv()
+from app import create_app
 
-# Configure logging to see detailed logs
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,222 @@
+"""
+Schema migrations for databases created by earlier versions of the models.
+
+db.create_all() creates missing tables but never changes existing ones, so
+columns and indexes added to a model don't reach a database that already
+has the table. Each migration below brings such a database up to date
+without dropping data. Applied versions are recorded in the
+schema_migrations table, so every migration runs once per database.
+
+Migrations must be idempotent: on a fresh database create_all() has already
+built the current schema, and the migration only records its version.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select, insert, delete, func, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from models import BackgroundJob, Conversation, ConversationErrorCount, DailyErrorCount, LanguageError, Message
+
+logger = logging.getLogger(__name__)
+
+# Kept out of db.metadata so create_all() and the models never depend on it
+_migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", String(32), primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Ordered list of (version, description, function)
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function, which receives an open connection."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def _create_indexes(connection, model, names):
+    """Create a model's named indexes if they don't exist yet."""
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def _add_column(connection, model, column_name):
+    """Add a model's column to an existing table if it is missing."""
+    table = model.__table__
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    if column_name in existing:
+        return
+
+    column = table.columns[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    preparer = connection.dialect.identifier_preparer
+    connection.execute(text(
+        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+    ))
+
+
+@migration("0001", "Add indexes for history, review and conversation lookups")
+def add_lookup_indexes(connection):
+    _create_indexes(connection, Message, ["ix_message_conversation_id_id", "ix_message_conversation_id_timestamp"])
+    _create_indexes(connection, LanguageError, ["ix_language_error_message_id", "ix_language_error_user_id_conversation_id"])
+    _create_indexes(connection, Conversation, ["ix_conversation_user_id"])
+
+
+@migration("0002", "Backfill error count aggregates from existing errors")
+def backfill_error_counts(connection):
+    # Recompute from scratch so the migration is safe to rerun
+    connection.execute(delete(ConversationErrorCount))
+    connection.execute(delete(DailyErrorCount))
+
+    connection.execute(insert(ConversationErrorCount).from_select(
+        ["user_id", "conversation_id", "error_type", "count"],
+        select(
+            LanguageError.user_id,
+            LanguageError.conversation_id,
+            LanguageError.error_type,
+            func.count(LanguageError.id)
+        ).group_by(LanguageError.user_id, LanguageError.conversation_id, LanguageError.error_type)
+    ))
+
+    day = func.date(LanguageError.timestamp)
+    connection.execute(insert(DailyErrorCount).from_select(
+        ["user_id", "error_type", "day", "count"],
+        select(
+            LanguageError.user_id,
+            LanguageError.error_type,
+            day,
+            func.count(LanguageError.id)
+        ).group_by(LanguageError.user_id, LanguageError.error_type, day)
+    ))
+
+
+@migration("0003", "Add rolling summary columns to conversations")
+def add_conversation_summary(connection):
+    _add_column(connection, Conversation, "summary")
+    _add_column(connection, Conversation, "summary_through_id")
+
+
+def upgrade(engine):
+    """
+    Apply every migration that hasn't run on this database yet.
+
+    Each migration runs in its own transaction. If two processes race, the
+    loser's version insert fails on the primary key and is ignored, which is
+    safe because migrations are idempotent.
+
+    Returns:
+        list: The versions applied by this call
+    """
+    _migration_metadata.create_all(engine, checkfirst=True)
+
+    with engine.connect() as connection:
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+    newly_applied = []
+    for version, description, func in MIGRATIONS:
+        if version in applied:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        try:
+            with engine.begin() as connection:
+                func(connection)
+                connection.execute(insert(schema_migrations).values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            logger.info(f"Migration {version} was applied by another process")
+            continue
+
+        newly_applied.append(version)
+
+    return newly_applied
+
+
+def hot_queries():
+    """
+    Build the queries that must be served from an index.
+
+    Returns:
+        dict: Maps a description to a select statement
+    """
+    return {
+        "history page": select(Message)
+            .where(Message.conversation_id == 1, Message.id < 100)
+            .order_by(Message.id.desc())
+            .limit(51),
+        "errors for messages": select(LanguageError)
+            .where(LanguageError.message_id.in_([1, 2, 3])),
+        "review errors": select(LanguageError)
+            .where(LanguageError.user_id == 1, LanguageError.conversation_id == 1),
+        "user conversations": select(Conversation)
+            .where(Conversation.user_id == 1),
+        "due jobs": select(BackgroundJob.id, BackgroundJob.attempts)
+            .where(BackgroundJob.status.in_(["pending", "running"]), BackgroundJob.run_after <= "2024-01-01")
+            .order_by(BackgroundJob.run_after)
+            .limit(5),
+    }
+
+
+def explain(connection, query):
+    """
+    Get SQLite's query plan for a statement.
+
+    Returns:
+        list: The plan's steps, e.g. "SEARCH message USING INDEX ix_message_conversation_id_id (...)"
+    """
+    sql = str(query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def plan_problem(plan):
+    """
+    Find what is wrong with a hot query's plan, if anything.
+
+    Returns:
+        str: The offending steps if the plan scans a table or index, or uses
+             no index at all, otherwise None
+    """
+    scans = [step for step in plan if step.startswith("SCAN")]
+    if scans:
+        return "; ".join(scans)
+    if not any("USING INDEX" in step or "USING COVERING INDEX" in step for step in plan):
+        return f"no index used ({'; '.join(plan)})"
+    return None
+
+
+def check_query_plans(engine):
+    """
+    Check that the hot queries search an index instead of scanning.
+
+    Only SQLite is checked, since its planner picks indexes deterministically.
+    Other databases may prefer a sequential scan on small tables.
+
+    Returns:
+        list: Descriptions of queries whose plan scans or uses no index
+    """
+    if engine.dialect.name != "sqlite":
+        logger.info(f"Query plan check skipped for {engine.dialect.name}")
+        return []
+
+    problems = []
+    with engine.connect() as connection:
+        for name, query in hot_queries().items():
+            problem = plan_problem(explain(connection, query))
+            if problem:
+                problems.append(f"{name}: {problem}")
+
+    return problems
@@ -21,9 +21,11 @@ class User(db.Model):
 class Conversation(db.Model):
     """Model for storing conversation data."""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     scenario = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    summary = db.Column(db.Text, nullable=True)  # Rolling summary of turns that no longer fit in the prompt
+    summary_through_id = db.Column(db.Integer, nullable=True)  # ID of the last message folded into the summary
     
     # Relationships
     messages = db.relationship('Message', backref='conversation', lazy=True)
@@ -41,6 +43,12 @@ class Message(db.Model):
     translated_content = db.Column(db.Text, nullable=True)  # For storing translations
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # History pages filter by conversation and walk back by ID
+        db.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+        db.Index('ix_message_conversation_id_timestamp', 'conversation_id', 'timestamp'),
+    )
+    
     def __repr__(self):
         sender = "User" if self.is_user else "Bot"
         return f'<Message {self.id} from {sender}: {self.content[:20]}...>'
@@ -51,7 +59,7 @@ class LanguageError(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
-    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False)
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False, index=True)
     error_text = db.Column(db.Text, nullable=False)
     correction = db.Column(db.Text, nullable=False)
     error_type = db.Column(db.String(50), nullable=False)  # e.g., grammar, vocabulary, syntax
@@ -61,5 +69,87 @@ class LanguageError(db.Model):
     conversation = db.relationship('Conversation', backref='errors')
     message = db.relationship('Message', backref='errors')
     
+    __table_args__ = (
+        # Review looks up a user's errors within one conversation
+        db.Index('ix_language_error_user_id_conversation_id', 'user_id', 'conversation_id'),
+    )
+    
     def __repr__(self):
         return f'<Error {self.id}: {self.error_type} - {self.error_text[:20]}...>'
+
+
+class TranslationCache(db.Model):
+    """Model for caching translations across processes and restarts."""
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # Hash of normalized text, language pair and model
+    source_language = db.Column(db.String(50), nullable=False)
+    target_language = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    source_text = db.Column(db.Text, nullable=False)
+    translated_text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TranslationCache {self.id}: {self.source_language} -> {self.target_language}>'
+
+
+class ScenarioOpener(db.Model):
+    """Model for pre-generated opening messages, served when a conversation starts."""
+    id = db.Column(db.Integer, primary_key=True)
+    scenario = db.Column(db.String(100), nullable=False)
+    target_language = db.Column(db.String(50), nullable=False)
+    native_language = db.Column(db.String(50), nullable=False)
+    proficiency_level = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    translated_content = db.Column(db.Text, nullable=False)
+    uses = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_scenario_opener_combination', 'scenario', 'target_language', 'native_language', 'proficiency_level'),
+    )
+    
+    def __repr__(self):
+        return f'<ScenarioOpener {self.id}: {self.scenario} in {self.target_language}>'
+
+
+class ConversationErrorCount(db.Model):
+    """Model for running error counts per user, conversation and error type."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), primary_key=True)
+    error_type = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ConversationErrorCount {self.conversation_id}: {self.error_type} x{self.count}>'
+
+
+class DailyErrorCount(db.Model):
+    """Model for running error counts per user, error type and day."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    error_type = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyErrorCount {self.user_id} on {self.day}: {self.error_type} x{self.count}>'
+
+
+class BackgroundJob(db.Model):
+    """Model for deferred work, run by the worker threads in services/job_queue.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Name of the registered handler, e.g. tts.prerender
+    payload = db.Column(db.Text, nullable=False)  # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running or failed; finished jobs are deleted
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # When a pending job is due, or a running job's lease runs out
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Workers claim the oldest due job
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.id}: {self.kind} ({self.status})>'
@@ -1,28 +1,108 @@
 import uuid
 import json
-from flask import render_template, request, jsonify, session, redirect, url_for
-from extensions import db
+from datetime import datetime
+from flask import render_template, request, jsonify, session, redirect, url_for, current_app, Response, stream_with_context, send_file
+from sqlalchemy.orm import selectinload
+from extensions import db, unit_of_work
 from models import User, Conversation, Message, LanguageError
-from services.ai_service import generate_bot_response
-from services.tts_service import generate_speech
-from services.translation_service import translate_text
-from services.error_detector import detect_errors
+from services.ai_service import agenerate_bot_response, stream_bot_response, FALLBACK_RESPONSE
+from services.tts_service import (generate_speech, get_speech_file, speech_cache_key, split_sentences,
+                                  start_chunk_synthesis, get_chunk_file, needs_synthesis)
+from services.translation_service import atranslate_text, is_cacheable_translation
+from services.error_detector import adetect_errors
+from services.orchestrator import start_branches, collect_branches, is_branch_ready
+from services.opener_pool import get_opener
+from services.context_builder import build_context
+from services.progress_service import record_error_counts, get_conversation_error_counts, get_progress
+from services.rate_limiter import rate_limited, check_rate_limit
+from services.circuit_breaker import get_circuit_stats
+from services.model_router import get_model_stats, is_degraded
+from services.metrics import span, render_metrics
+from services.profile_cache import cache_user, cache_conversation, get_user_profile, get_conversation_info
+from services.job_queue import enqueue
+
+LANGUAGES = [
+    "English", "Spanish", "French", "German", "Italian", 
+    "Portuguese", "Chinese", "Japanese", "Korean", "Russian",
+    "Arabic", "Hindi", "Dutch", "Swedish", "Polish", "Turkish"
+]
+
+PROFICIENCY_LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+SCENARIOS = [
+    {"id": "cafe", "name": "At a Café", "icon": "coffee"},
+    {"id": "shopping", "name": "Shopping at a Mall", "icon": "shopping-bag"},
+    {"id": "airport", "name": "Traveling at the Airport", "icon": "plane"},
+    {"id": "meeting", "name": "Meeting New People", "icon": "users"},
+    {"id": "doctor", "name": "Visiting a Doctor", "icon": "activity"}
+]
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def save_errors(errors, user_id, conversation_id, message):
+    """
+    Add detected errors for a user message to the database session, and
+    update the error count aggregates in the same transaction.
+    
+    The message may not be flushed yet; errors are linked to it through the relationship.
+    
+    Returns:
+        list: The errors formatted for the API response
+    """
+    error_data = []
+    for error in errors:
+        language_error = LanguageError(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message=message,
+            error_text=error['error_text'],
+            correction=error['correction'],
+            error_type=error['error_type']
+        )
+        db.session.add(language_error)
+        error_data.append({
+            'error_text': error['error_text'],
+            'correction': error['correction'],
+            'error_type': error['error_type']
+        })
+    
+    # Keep the review and progress aggregates in step with the saved errors
+    if error_data:
+        record_error_counts(
+            user_id,
+            conversation_id,
+            [error['error_type'] for error in error_data],
+            message.timestamp.date()
+        )
+    return error_data
+
+
+def schedule_message_jobs(message, target_language, native_language):
+    """
+    Queue follow-up work for a new bot message, to run after the transaction commits.
+    
+    Its audio is rendered ahead of the first play, and a failed translation
+    is retried until it succeeds. The message must be flushed to have an ID.
+    """
+    if current_app.config.get('TTS_PRERENDER', True):
+        enqueue('tts.prerender', message_id=message.id, language_code=target_language)
+    
+    if not is_cacheable_translation(message.translated_content):
+        enqueue('translation.backfill', message_id=message.id,
+                source_language=target_language, target_language=native_language)
+
 
 def register_routes(app):
     @app.route('/', methods=['GET'])
     def index():
         """Render the homepage with language selection form."""
-        languages = [
-            "English", "Spanish", "French", "German", "Italian", 
-            "Portuguese", "Chinese", "Japanese", "Korean", "Russian",
-            "Arabic", "Hindi", "Dutch", "Swedish", "Polish", "Turkish"
-        ]
-        
-        proficiency_levels = ["Beginner", "Intermediate", "Advanced"]
-        
         return render_template('index.html', 
-                               languages=languages,
-                               proficiency_levels=proficiency_levels)
+                               languages=LANGUAGES,
+                               proficiency_levels=PROFICIENCY_LEVELS)
 
     @app.route('/setup', methods=['POST'])
     def setup():
@@ -47,10 +127,12 @@ def register_routes(app):
         )
         
         db.session.add(new_user)
-        db.session.commit()
+        with span('db.commit'):
+            db.session.commit()
         
-        # Store user ID in session
+        # Store user ID in session, and prime the profile cache for the requests that follow
         session['user_id'] = new_user.id
+        cache_user(new_user)
         
         return redirect(url_for('chat'))
 
@@ -61,24 +143,17 @@ def register_routes(app):
             return redirect(url_for('index'))
         
         user_id = session['user_id']
-        user = User.query.get(user_id)
+        user = get_user_profile(user_id)
         
         if not user:
             return redirect(url_for('index'))
         
-        scenarios = [
-            {"id": "cafe", "name": "At a Café", "icon": "coffee"},
-            {"id": "shopping", "name": "Shopping at a Mall", "icon": "shopping-bag"},
-            {"id": "airport", "name": "Traveling at the Airport", "icon": "plane"},
-            {"id": "meeting", "name": "Meeting New People", "icon": "users"},
-            {"id": "doctor", "name": "Visiting a Doctor", "icon": "activity"}
-        ]
-        
         return render_template('chat.html', 
                                user=user,
-                               scenarios=scenarios)
+                               scenarios=SCENARIOS)
 
     @app.route('/api/start_conversation', methods=['POST'])
+    @rate_limited
     def start_conversation():
         """Start a new conversation with the selected scenario."""
         if 'user_id' not in session:
@@ -90,54 +165,61 @@ def register_routes(app):
         if not scenario:
             return jsonify({'error': 'Scenario is required'}), 400
         
-        # Create a new conversation
-        conversation = Conversation(
-            user_id=user_id,
-            scenario=scenario
-        )
-        
-        db.session.add(conversation)
-        db.session.commit()
-        
         # Get user information for context
-        user = User.query.get(user_id)
+        user = get_user_profile(user_id)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        # Generate initial bot message based on scenario
-        response, translated = generate_bot_response(
-            None, 
+        # Get initial bot message for the scenario, from the warmed pool when possible
+        response, translated = get_opener(
             scenario, 
             user.target_language, 
             user.native_language,
-            user.proficiency_level,
-            is_initial=True
-        )
-        
-        # Save bot message to database
-        bot_message = Message(
-            conversation_id=conversation.id,
-            is_user=False,
-            content=response,
-            translated_content=translated
+            user.proficiency_level
         )
         
-        db.session.add(bot_message)
-        db.session.commit()
-        
-        # Store conversation ID in session
-        session['conversation_id'] = conversation.id
-        
-        return jsonify({
-            'conversation_id': conversation.id,
-            'message': {
+        # Save the conversation and its first message in one transaction
+        with unit_of_work():
+            conversation = Conversation(
+                user_id=user_id,
+                scenario=scenario
+            )
+            bot_message = Message(
+                conversation=conversation,
+                is_user=False,
+                content=response,
+                translated_content=translated,
+                timestamp=datetime.utcnow()
+            )
+            
+            db.session.add(conversation)
+            db.session.add(bot_message)
+            db.session.flush()
+            schedule_message_jobs(bot_message, user.target_language, user.native_language)
+            
+            conversation_id = conversation.id
+            message_data = {
                 'id': bot_message.id,
                 'content': bot_message.content,
                 'translated': bot_message.translated_content,
                 'is_user': bot_message.is_user,
                 'timestamp': bot_message.timestamp.isoformat()
             }
+        
+        # Cache the conversation only once it is saved, so a failed commit can't leave it cached
+        cache_conversation(conversation)
+        
+        # Store conversation ID in session
+        session['conversation_id'] = conversation_id
+        
+        return jsonify({
+            'conversation_id': conversation_id,
+            'message': message_data
         })
 
     @app.route('/api/send_message', methods=['POST'])
+    @rate_limited
     def send_message():
         """Process a user message and generate a bot response."""
         if 'user_id' not in session or 'conversation_id' not in session:
@@ -151,88 +233,228 @@ def register_routes(app):
         if not message_content:
             return jsonify({'error': 'Message content is required'}), 400
         
-        # Get user and conversation info
-        user = User.query.get(user_id)
-        conversation = Conversation.query.get(conversation_id)
+        # Get user and conversation info, from the profile cache when possible
+        user = get_user_profile(user_id)
+        conversation = get_conversation_info(conversation_id)
         
         if not user or not conversation:
             return jsonify({'error': 'User or conversation not found'}), 404
+        
+        # Recent turns that fit the token budget, plus the rolling summary of older ones
+        summary, history = build_context(conversation, user.target_language)
+        
+        # Error detection and response generation don't depend on each other,
+        # so run them concurrently on the shared event loop, each bounded by its own timeout
+        branches = start_branches({
+            'errors': {
+                'func': adetect_errors,
+                'args': (message_content, user.target_language, user.proficiency_level),
+                'timeout': current_app.config.get('ERROR_DETECTION_TIMEOUT'),
+                'fallback': []
+            },
+            'response': {
+                'func': agenerate_bot_response,
+                'args': (
+                    message_content,
+                    conversation.scenario,
+                    user.target_language,
+                    user.native_language,
+                    user.proficiency_level
+                ),
+                'kwargs': {'history': history, 'summary': summary},
+                'timeout': current_app.config.get('BOT_RESPONSE_TIMEOUT'),
+                'fallback': FALLBACK_RESPONSE
+            }
+        })
             
-        # Save user message
+        # Build the user message now so its timestamp reflects when it arrived,
+        # but hold the write until the response is ready
         user_message = Message(
             conversation_id=conversation_id,
             is_user=True,
-            content=message_content
+            content=message_content,
+            timestamp=datetime.utcnow()
         )
         
-        db.session.add(user_message)
-        db.session.commit()
+        results = collect_branches(branches)
+        errors = results['errors']
+        response, translated = results['response']
         
-        # Detect language errors in the user's message
-        errors = detect_errors(
-            message_content, 
-            user.target_language, 
-            user.proficiency_level
-        )
-        
-        # Save detected errors
-        error_data = []
-        for error in errors:
-            language_error = LanguageError(
-                user_id=user_id,
+        # Save the user message, its errors and the bot response in one transaction
+        with unit_of_work():
+            db.session.add(user_message)
+            error_data = save_errors(errors, user_id, conversation_id, user_message)
+            
+            bot_message = Message(
                 conversation_id=conversation_id,
-                message_id=user_message.id,
-                error_text=error['error_text'],
-                correction=error['correction'],
-                error_type=error['error_type']
+                is_user=False,
+                content=response,
+                translated_content=translated,
+                timestamp=datetime.utcnow()
             )
-            db.session.add(language_error)
-            error_data.append({
-                'error_text': error['error_text'],
-                'correction': error['correction'],
-                'error_type': error['error_type']
-            })
+            db.session.add(bot_message)
+            db.session.flush()
+            schedule_message_jobs(bot_message, user.target_language, user.native_language)
+            
+            response_data = {
+                'user_message': {
+                    'id': user_message.id,
+                    'content': user_message.content,
+                    'is_user': True,
+                    'timestamp': user_message.timestamp.isoformat(),
+                    'errors': error_data
+                },
+                'bot_message': {
+                    'id': bot_message.id,
+                    'content': bot_message.content,
+                    'translated': bot_message.translated_content,
+                    'is_user': False,
+                    'timestamp': bot_message.timestamp.isoformat()
+                }
+            }
         
-        db.session.commit()
+        return jsonify(response_data)
+
+    @app.route('/api/send_message/stream', methods=['POST'])
+    @rate_limited
+    def send_message_stream():
+        """Process a user message and stream the bot response as Server-Sent Events."""
+        if 'user_id' not in session or 'conversation_id' not in session:
+            return jsonify({'error': 'Session data not found'}), 401
         
-        # Generate bot response
-        response, translated = generate_bot_response(
-            message_content,
-            conversation.scenario,
-            user.target_language,
-            user.native_language,
-            user.proficiency_level
-        )
+        user_id = session['user_id']
+        conversation_id = session['conversation_id']
         
-        # Save bot response
-        bot_message = Message(
-            conversation_id=conversation_id,
-            is_user=False,
-            content=response,
-            translated_content=translated
-        )
+        message_content = request.json.get('message')
         
-        db.session.add(bot_message)
-        db.session.commit()
+        if not message_content:
+            return jsonify({'error': 'Message content is required'}), 400
         
-        return jsonify({
-            'user_message': {
-                'id': user_message.id,
-                'content': user_message.content,
-                'is_user': True,
-                'timestamp': user_message.timestamp.isoformat(),
-                'errors': error_data
-            },
-            'bot_message': {
-                'id': bot_message.id,
-                'content': bot_message.content,
-                'translated': bot_message.translated_content,
-                'is_user': False,
-                'timestamp': bot_message.timestamp.isoformat()
+        # Get user and conversation info, from the profile cache when possible
+        user = get_user_profile(user_id)
+        conversation = get_conversation_info(conversation_id)
+        
+        if not user or not conversation:
+            return jsonify({'error': 'User or conversation not found'}), 404
+        
+        # Recent turns that fit the token budget, plus the rolling summary of older ones
+        summary, history = build_context(conversation, user.target_language)
+        
+        # Detect errors in the background while the response streams
+        detection = start_branches({
+            'errors': {
+                'func': adetect_errors,
+                'args': (message_content, user.target_language, user.proficiency_level),
+                'timeout': current_app.config.get('ERROR_DETECTION_TIMEOUT'),
+                'fallback': []
             }
         })
+        
+        # Copy what the stream needs into plain values
+        received_at = datetime.utcnow()
+        scenario = conversation.scenario
+        target_language = user.target_language
+        native_language = user.native_language
+        proficiency_level = user.proficiency_level
+        
+        @stream_with_context
+        def generate():
+            errors = None
+            
+            def corrections_event():
+                return sse_event('corrections', {'errors': [
+                    {
+                        'error_text': error['error_text'],
+                        'correction': error['correction'],
+                        'error_type': error['error_type']
+                    } for error in errors
+                ]})
+            
+            # Relay tokens as they arrive, sending corrections as soon as they're ready
+            chunks = []
+            with span('generation'):
+                for chunk in stream_bot_response(message_content, scenario, target_language, proficiency_level,
+                                                 history=history, summary=summary):
+                    chunks.append(chunk)
+                    yield sse_event('token', {'text': chunk})
+                    
+                    if errors is None and is_branch_ready(detection, 'errors'):
+                        errors = collect_branches(detection)['errors']
+                        yield corrections_event()
+            
+            response = ''.join(chunks).strip()
+            if not response:
+                response = FALLBACK_RESPONSE[0]
+                yield sse_event('token', {'text': response})
+            
+            # Translate the finished response while waiting on any pending corrections
+            translation = start_branches({
+                'translated': {
+                    'func': atranslate_text,
+                    'args': (response, target_language, native_language),
+                    'timeout': current_app.config.get('BOT_RESPONSE_TIMEOUT'),
+                    'fallback': FALLBACK_RESPONSE[1]
+                }
+            })
+            
+            if errors is None:
+                errors = collect_branches(detection)['errors']
+                yield corrections_event()
+            
+            translated = collect_branches(translation)['translated']
+            yield sse_event('translation', {'translated': translated})
+            
+            # Save the user message, its errors and the bot response in one transaction
+            with unit_of_work():
+                user_message = Message(
+                    conversation_id=conversation_id,
+                    is_user=True,
+                    content=message_content,
+                    timestamp=received_at
+                )
+                db.session.add(user_message)
+                save_errors(errors, user_id, conversation_id, user_message)
+                
+                bot_message = Message(
+                    conversation_id=conversation_id,
+                    is_user=False,
+                    content=response,
+                    translated_content=translated,
+                    timestamp=datetime.utcnow()
+                )
+                db.session.add(bot_message)
+                db.session.flush()
+                schedule_message_jobs(bot_message, target_language, native_language)
+                
+                user_message_data = {
+                    'id': user_message.id,
+                    'content': user_message.content,
+                    'is_user': True,
+                    'timestamp': user_message.timestamp.isoformat()
+                }
+                bot_message_data = {
+                    'id': bot_message.id,
+                    'content': bot_message.content,
+                    'translated': bot_message.translated_content,
+                    'is_user': False,
+                    'timestamp': bot_message.timestamp.isoformat()
+                }
+            
+            yield sse_event('user_message', user_message_data)
+            yield sse_event('bot_message', bot_message_data)
+            yield sse_event('done', {})
+        
+        return Response(
+            generate(),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
 
     @app.route('/api/get_tts', methods=['POST'])
+    @rate_limited
     def get_tts():
         """Generate text-to-speech for a message."""
         message_id = request.json.get('message_id')
@@ -251,7 +473,7 @@ def register_routes(app):
         if not user_id:
             return jsonify({'error': 'User not found'}), 401
             
-        user = User.query.get(user_id)
+        user = get_user_profile(user_id)
         
         # Generate speech audio
         speech_data = generate_speech(message.content, user.target_language)
@@ -260,6 +482,118 @@ def register_routes(app):
             'audio_data': speech_data
         })
 
+    @app.route('/api/tts/<int:message_id>', methods=['GET'])
+    @rate_limited
+    def get_tts_audio(message_id):
+        """Serve text-to-speech audio for a message as an MP3 file."""
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User not found'}), 401
+        
+        # Get the message
+        message = Message.query.get(message_id)
+        
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        
+        user = get_user_profile(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 401
+        
+        # Audio is cached by content, so repeat plays don't synthesize again
+        audio_path = get_speech_file(message.content, user.target_language)
+        
+        if not audio_path:
+            return jsonify({'error': 'Could not generate audio'}), 502
+        
+        # send_file handles Range requests and If-None-Match against the content hash
+        return send_file(
+            audio_path,
+            mimetype='audio/mpeg',
+            conditional=True,
+            etag=speech_cache_key(message.content, user.target_language),
+            max_age=86400
+        )
+
+    @app.route('/api/tts/<int:message_id>/chunks', methods=['GET'])
+    @rate_limited
+    def get_tts_chunks(message_id):
+        """
+        List a message's speech as sentence chunks, and start synthesizing them in parallel.
+        
+        The client plays the chunks in order from their URLs, so playback starts
+        as soon as the first sentence is ready. Sentences shared with other
+        messages come from the cache.
+        """
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User not found'}), 401
+        
+        message = Message.query.get(message_id)
+        
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        
+        user = get_user_profile(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 401
+        
+        chunks = split_sentences(message.content)
+        start_chunk_synthesis(chunks, user.target_language)
+        
+        return jsonify({
+            'language': user.target_language,
+            'chunks': [{
+                'index': index,
+                'text': chunk,
+                'url': url_for('get_tts_chunk', message_id=message_id, index=index)
+            } for index, chunk in enumerate(chunks)]
+        })
+
+    @app.route('/api/tts/<int:message_id>/chunks/<int:index>', methods=['GET'])
+    def get_tts_chunk(message_id, index):
+        """
+        Serve one sentence of a message's speech as an MP3 file.
+        
+        Chunks already cached or being synthesized, e.g. after the chunks were
+        listed, are free; only a chunk that needs a new gTTS call is rate
+        limited.
+        """
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User not found'}), 401
+        
+        message = Message.query.get(message_id)
+        
+        if not message:
+            return jsonify({'error': 'Message not found'}), 404
+        
+        user = get_user_profile(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 401
+        
+        chunks = split_sentences(message.content)
+        if index >= len(chunks):
+            return jsonify({'error': 'Chunk not found'}), 404
+        
+        if needs_synthesis(chunks[index], user.target_language):
+            limited = check_rate_limit()
+            if limited is not None:
+                return limited
+        
+        audio_path = get_chunk_file(chunks[index], user.target_language)
+        
+        if not audio_path:
+            return jsonify({'error': 'Could not generate audio'}), 502
+        
+        return send_file(
+            audio_path,
+            mimetype='audio/mpeg',
+            conditional=True,
+            etag=speech_cache_key(chunks[index], user.target_language),
+            max_age=86400
+        )
+
     @app.route('/api/review', methods=['GET'])
     def get_review():
         """Get a review of the conversation, including error summary."""
@@ -269,38 +603,40 @@ def register_routes(app):
         user_id = session['user_id']
         conversation_id = session['conversation_id']
         
-        # Get all errors for this conversation
-        errors = LanguageError.query.filter_by(
-            user_id=user_id,
-            conversation_id=conversation_id
-        ).all()
+        # Counts come from the aggregate table, so this doesn't grow with the number of errors
+        error_counts = get_conversation_error_counts(user_id, conversation_id)
+        total_errors = sum(error_counts.values())
         
-        # Group errors by type
+        # Show the most recent examples of each error type
+        examples_per_type = current_app.config.get('REVIEW_EXAMPLES_PER_TYPE', 10)
         error_summary = {}
-        for error in errors:
-            if error.error_type not in error_summary:
-                error_summary[error.error_type] = []
-                
-            error_summary[error.error_type].append({
+        for error_type in error_counts:
+            examples = LanguageError.query.filter_by(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                error_type=error_type
+            ).order_by(LanguageError.id.desc()).limit(examples_per_type).all()
+            
+            error_summary[error_type] = [{
                 'error_text': error.error_text,
                 'correction': error.correction
-            })
+            } for error in examples]
         
         # Generate improvement suggestions
         suggestions = []
         
         # Count errors by type for targeted suggestions
-        if 'grammar' in error_summary and len(error_summary['grammar']) >= 2:
+        if error_counts.get('grammar', 0) >= 2:
             suggestions.append("Focus on improving your grammar skills, particularly with sentence structure.")
             
-        if 'vocabulary' in error_summary and len(error_summary['vocabulary']) >= 2:
+        if error_counts.get('vocabulary', 0) >= 2:
             suggestions.append("Work on expanding your vocabulary in this context.")
             
-        if 'syntax' in error_summary and len(error_summary['syntax']) >= 2:
+        if error_counts.get('syntax', 0) >= 2:
             suggestions.append("Pay attention to word order and syntax rules.")
         
         # If few errors, provide positive reinforcement
-        if len(errors) < 3:
+        if total_errors < 3:
             suggestions.append("Great job! You made very few mistakes in this conversation.")
         
         # Add a generic suggestion if no specific ones were generated
@@ -309,34 +645,59 @@ def register_routes(app):
         
         return jsonify({
             'error_summary': error_summary,
+            'error_counts': error_counts,
             'suggestions': suggestions,
-            'total_errors': len(errors)
+            'total_errors': total_errors
         })
 
+    @app.route('/api/progress', methods=['GET'])
+    def get_progress_report():
+        """Get the user's error counts across all conversations, with a daily breakdown."""
+        if 'user_id' not in session:
+            return jsonify({'error': 'User not found'}), 401
+        
+        days = request.args.get('days', 30, type=int)
+        days = max(1, min(days, 365))
+        
+        return jsonify(get_progress(session['user_id'], days))
+
     @app.route('/api/history', methods=['GET'])
     def get_history():
-        """Get the conversation history."""
+        """
+        Get the conversation history, one page at a time.
+        
+        Query parameters:
+            before_id (int): Only return messages older than this message ID
+            limit (int): Maximum number of messages to return
+        
+        Messages come back oldest first. When has_more is true, pass
+        next_before_id as before_id to load the previous page.
+        """
         if 'conversation_id' not in session:
             return jsonify({'error': 'No active conversation'}), 401
             
         conversation_id = session['conversation_id']
         
-        # Get all messages for this conversation
-        messages = Message.query.filter_by(
+        max_page_size = current_app.config.get('HISTORY_MAX_PAGE_SIZE', 200)
+        limit = request.args.get('limit', type=int) or current_app.config.get('HISTORY_PAGE_SIZE', 50)
+        limit = max(1, min(limit, max_page_size))
+        before_id = request.args.get('before_id', type=int)
+        
+        # Load one page of messages with their errors in a single extra query
+        query = Message.query.options(
+            selectinload(Message.errors)
+        ).filter_by(
             conversation_id=conversation_id
-        ).order_by(Message.timestamp).all()
+        )
         
-        # Get all errors for user messages
-        error_map = {}
-        for message in messages:
-            if message.is_user:
-                errors = LanguageError.query.filter_by(message_id=message.id).all()
-                if errors:
-                    error_map[message.id] = [{
-                        'error_text': error.error_text,
-                        'correction': error.correction,
-                        'error_type': error.error_type
-                    } for error in errors]
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        
+        # Fetch one extra row to learn whether older messages remain
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        messages.reverse()
         
         # Format messages for the response
         message_history = []
@@ -350,11 +711,40 @@ def register_routes(app):
             }
             
             # Add errors if this is a user message with errors
-            if message.id in error_map:
-                message_data['errors'] = error_map[message.id]
+            if message.is_user and message.errors:
+                message_data['errors'] = [{
+                    'error_text': error.error_text,
+                    'correction': error.correction,
+                    'error_type': error.error_type
+                } for error in message.errors]
                 
             message_history.append(message_data)
         
         return jsonify({
-            'messages': message_history
+            'messages': message_history,
+            'has_more': has_more,
+            'next_before_id': messages[0].id if has_more and messages else None
         })
+
+    @app.route('/api/upstream_status', methods=['GET'])
+    def get_upstream_status():
+        """
+        Get the state of the upstream circuit breakers and per-model latency figures.
+        
+        degraded is true when some task has no model left to call, e.g. to show a
+        degraded-service notice. models holds each model's latency and error EWMAs
+        and latency histogram, by task, for tuning the routing table.
+        """
+        return jsonify({
+            'degraded': is_degraded(),
+            'circuits': get_circuit_stats(),
+            'models': get_model_stats()
+        })
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Expose span, upstream and cache metrics in the Prometheus text format."""
+        if not current_app.config.get('METRICS_ENABLED', True):
+            return jsonify({'error': 'Metrics are disabled'}), 404
+        
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -2,37 +2,39 @@ import os
 import json
 import logging
 from flask import current_app
-from openai import OpenAI
-from services.translation_service import translate_text
+from services.openrouter_client import create_chat_completion, acreate_chat_completion
+from services.circuit_breaker import CircuitOpenError
+from services.rate_limiter import UpstreamBusyError
+from services.metrics import traced
+from services.translation_service import translate_text, atranslate_text
 
 logger = logging.getLogger(__name__)
 
-def generate_bot_response(user_message, scenario, target_language, native_language, proficiency_level, is_initial=False):
+# Returned when a response can't be generated, e.g. on upstream errors or timeouts
+FALLBACK_RESPONSE = ("I'm sorry, I encountered an error while generating a response.", "Error occurred")
+
+# Returned at once while OpenRouter's circuit breaker is open
+DEGRADED_RESPONSE = ("I'm having trouble reaching the language service right now. Please try again in a minute.", "Service temporarily unavailable")
+
+# Returned when no OpenRouter API key is configured
+MISSING_KEY_RESPONSE = ("I'm sorry, I can't generate a response right now. API key is missing.", "Error: API key missing")
+
+def build_prompt_messages(user_message, scenario, target_language, proficiency_level, is_initial=False, history=None, summary=None):
     """
-    Generate a response from the AI chatbot based on the user's message and scenario.
+    Build the chat messages sent to the model for a bot response.
     
     Args:
         user_message (str): The message from the user, or None if this is the initial message
         scenario (str): The conversation scenario (e.g., "cafe", "shopping")
         target_language (str): The language the user is learning
-        native_language (str): The user's native language
         proficiency_level (str): The user's proficiency level (Beginner, Intermediate, Advanced)
         is_initial (bool): Whether this is the initial message in the conversation
+        history (list): Earlier turns as chat messages, oldest first
+        summary (str): Summary of turns older than the history
         
     Returns:
-        tuple: (response_text, translated_text)
+        list: Chat messages in the OpenAI format
     """
-    api_key = current_app.config.get('OPENROUTER_API_KEY')
-    if not api_key:
-        logger.error("OpenRouter API key is not set")
-        return "I'm sorry, I can't generate a response right now. API key is missing.", "Error: API key missing"
-    
-    # Initialize OpenAI client with OpenRouter endpoint
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
-    )
-    
     # Define scenario descriptions
     scenario_descriptions = {
         "cafe": "a conversation in a café where the user is ordering food and drinks",
@@ -72,21 +74,47 @@ GUIDELINES:
     else:
         user_prompt = user_message
     
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
+    
+    messages.extend(history or [])
+    messages.append({"role": "user", "content": user_prompt})
+    
+    return messages
+
+
+@traced('generation')
+def generate_bot_response(user_message, scenario, target_language, native_language, proficiency_level, is_initial=False, history=None, summary=None):
+    """
+    Generate a response from the AI chatbot based on the user's message and scenario.
+    
+    Args:
+        user_message (str): The message from the user, or None if this is the initial message
+        scenario (str): The conversation scenario (e.g., "cafe", "shopping")
+        target_language (str): The language the user is learning
+        native_language (str): The user's native language
+        proficiency_level (str): The user's proficiency level (Beginner, Intermediate, Advanced)
+        is_initial (bool): Whether this is the initial message in the conversation
+        history (list): Earlier turns as chat messages, oldest first
+        summary (str): Summary of turns older than the history
+        
+    Returns:
+        tuple: (response_text, translated_text)
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        return MISSING_KEY_RESPONSE
+    
+    messages = build_prompt_messages(user_message, scenario, target_language, proficiency_level, is_initial, history, summary)
+    
     try:
-        # Get the model from the config or use the default one
-        model = current_app.config.get('OPENROUTER_MODEL', 'google/gemini-2.5-pro-exp-03-25:free')
-        
-        # Make the API request using the OpenAI client
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": "https://linguabot.replit.app", 
-                "X-Title": "LinguaBot Language Learning Assistant",
-            },
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+        # Make the API request on the fastest healthy chat model
+        completion = create_chat_completion(
+            task='chat',
+            messages=messages
         )
         
         bot_message = completion.choices[0].message.content.strip()
@@ -96,6 +124,150 @@ GUIDELINES:
         
         return bot_message, translated_text
         
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping bot response: {str(e)}")
+        return DEGRADED_RESPONSE
     except Exception as e:
         logger.error(f"Error generating bot response: {str(e)}")
-        return "I'm sorry, I encountered an error while generating a response.", "Error occurred"
+        return FALLBACK_RESPONSE
+
+
+@traced('generation')
+async def agenerate_bot_response(user_message, scenario, target_language, native_language, proficiency_level, is_initial=False, history=None, summary=None):
+    """
+    Async version of generate_bot_response.
+    
+    Args:
+        user_message (str): The message from the user, or None if this is the initial message
+        scenario (str): The conversation scenario (e.g., "cafe", "shopping")
+        target_language (str): The language the user is learning
+        native_language (str): The user's native language
+        proficiency_level (str): The user's proficiency level (Beginner, Intermediate, Advanced)
+        is_initial (bool): Whether this is the initial message in the conversation
+        history (list): Earlier turns as chat messages, oldest first
+        summary (str): Summary of turns older than the history
+        
+    Returns:
+        tuple: (response_text, translated_text)
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        return MISSING_KEY_RESPONSE
+    
+    messages = build_prompt_messages(user_message, scenario, target_language, proficiency_level, is_initial, history, summary)
+    
+    try:
+        completion = await acreate_chat_completion(
+            task='chat',
+            messages=messages
+        )
+        
+        bot_message = completion.choices[0].message.content.strip()
+        
+        translated_text = await atranslate_text(bot_message, target_language, native_language)
+        
+        return bot_message, translated_text
+        
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping bot response: {str(e)}")
+        return DEGRADED_RESPONSE
+    except Exception as e:
+        logger.error(f"Error generating bot response: {str(e)}")
+        return FALLBACK_RESPONSE
+
+
+def stream_bot_response(user_message, scenario, target_language, proficiency_level, is_initial=False, history=None, summary=None):
+    """
+    Stream a response from the AI chatbot as it is generated.
+    
+    Unlike generate_bot_response, this does not translate the response; callers
+    translate the assembled text once the stream is finished.
+    
+    Args:
+        user_message (str): The message from the user, or None if this is the initial message
+        scenario (str): The conversation scenario (e.g., "cafe", "shopping")
+        target_language (str): The language the user is learning
+        proficiency_level (str): The user's proficiency level (Beginner, Intermediate, Advanced)
+        is_initial (bool): Whether this is the initial message in the conversation
+        history (list): Earlier turns as chat messages, oldest first
+        summary (str): Summary of turns older than the history
+        
+    Yields:
+        str: Pieces of the response text as they arrive
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        yield MISSING_KEY_RESPONSE[0]
+        return
+    
+    messages = build_prompt_messages(user_message, scenario, target_language, proficiency_level, is_initial, history, summary)
+    
+    try:
+        stream = create_chat_completion(
+            task='chat',
+            messages=messages,
+            stream=True
+        )
+        
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping bot response: {str(e)}")
+        yield DEGRADED_RESPONSE[0]
+    except Exception as e:
+        logger.error(f"Error streaming bot response: {str(e)}")
+
+
+@traced('summary')
+def summarize_conversation(previous_summary, turns, target_language):
+    """
+    Fold older conversation turns into a short rolling summary.
+    
+    Args:
+        previous_summary (str): The existing summary, or None
+        turns (list): (is_user, content) tuples for the turns to fold in, oldest first
+        target_language (str): The language the conversation is in
+        
+    Returns:
+        str: The updated summary, or None if it couldn't be generated
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        return None
+    
+    transcript = "\n".join(f"{'Student' if is_user else 'Assistant'}: {content}" for is_user, content in turns)
+    max_words = current_app.config.get('CONTEXT_SUMMARY_WORDS', 120)
+    
+    system_prompt = f"""You maintain a running summary of a {target_language} language practice conversation.
+Combine the existing summary with the new turns into one updated summary.
+Keep facts the assistant needs to stay consistent: names, orders, choices, plans and open questions.
+Write in English, in at most {max_words} words. Return only the summary.
+"""
+    user_prompt = f"""Existing summary:
+{previous_summary or "(none)"}
+
+New turns:
+{transcript}"""
+    
+    try:
+        completion = create_chat_completion(
+            task='summary',
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        )
+        
+        return completion.choices[0].message.content.strip()
+        
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping conversation summary: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Error summarizing conversation: {str(e)}")
+        return None
@@ -0,0 +1,228 @@
+import time
+import logging
+import threading
+from collections import deque
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream service while its circuit is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream service while it is failing or too slow.
+
+    Outcomes of recent calls are kept over a sliding time window. The circuit
+    opens when, over at least min_calls calls, the share of failures or of
+    slow calls reaches its threshold. While open, calls fail at once with
+    CircuitOpenError. After open_seconds the circuit is half-open and lets a
+    few probe calls through: if they all succeed it closes, and if any fails
+    it opens again.
+    """
+
+    def __init__(self, name, window=60.0, min_calls=10, failure_rate=0.5,
+                 slow_call_seconds=20.0, slow_call_rate=0.8, open_seconds=30.0, half_open_calls=3):
+        """
+        Args:
+            name (str): Name used in logs and errors
+            window (float): Seconds of call outcomes considered
+            min_calls (int): Calls needed in the window before the circuit can open
+            failure_rate (float): Share of failed calls that opens the circuit
+            slow_call_seconds (float): Calls taking longer than this count as slow
+            slow_call_rate (float): Share of slow calls that opens the circuit
+            open_seconds (float): Seconds the circuit stays open before probing
+            half_open_calls (int): Successful probes needed to close the circuit
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (finished_at, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """
+        Check that a call may go ahead.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all probes in flight
+        """
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._set_state(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probes += 1
+
+    def record(self, latency, failed):
+        """
+        Record the outcome of a call let through by before_call().
+
+        Args:
+            latency (float): Seconds the call took
+            failed (bool): Whether the call failed in a way that reflects upstream health
+        """
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now, 'probe failed' if failed else f'probe took {latency:.1f}s')
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._set_state(CLOSED)
+                return
+
+            if self._state == OPEN:
+                # A call started before the circuit opened; its outcome is already stale
+                return
+
+            self._outcomes.append((now, failed, slow))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+
+            failures = sum(1 for _, f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, _, s in self._outcomes if s)
+            if failures / calls >= self.failure_rate:
+                self._open(now, f'{failures} of {calls} calls failed')
+            elif slow_calls / calls >= self.slow_call_rate:
+                self._open(now, f'{slow_calls} of {calls} calls took over {self.slow_call_seconds:.0f}s')
+
+    def release(self):
+        """
+        Give back a call let through by before_call() whose outcome says nothing
+        about upstream health, e.g. one that raised an unexpected local error.
+
+        The call isn't counted, so an aborted half-open probe neither closes
+        nor reopens the circuit; it only frees its probe slot.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _open(self, now, reason):
+        """Open the circuit. Must be called with the lock held."""
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+        self._set_state(OPEN)
+        self._opened_at = now
+        self.opened += 1
+
+    def _set_state(self, state):
+        """Move to a new state and reset its counters. Must be called with the lock held."""
+        if state == CLOSED:
+            logger.info(f"Circuit '{self.name}' closed")
+        self._state = state
+        self._outcomes.clear()
+        self._probes = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self):
+        """The current state: "closed", "open" or "half_open"."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._opened_at + self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def stats(self):
+        """
+        Get the circuit's state and counters.
+
+        Returns:
+            dict: State, seconds until probing (when open), recent calls and failures,
+                  and how often the circuit opened and rejected calls
+        """
+        state = self.state
+        with self._lock:
+            retry_after = max(0.0, self._opened_at + self.open_seconds - time.monotonic()) if state == OPEN else 0.0
+            return {
+                'state': state,
+                'retry_after': round(retry_after, 1),
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(1 for _, f, _ in self._outcomes if f),
+                'recent_slow_calls': sum(1 for _, _, s in self._outcomes if s),
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+
+
+# Breakers by name, created on first use and shared by every thread
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Get the shared circuit breaker for an upstream service, creating it on first use.
+
+    Args:
+        name (str): The upstream service, e.g. "openrouter"
+
+    Returns:
+        CircuitBreaker: The breaker, configured from the CIRCUIT_* app config
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                config = current_app.config
+                breaker = CircuitBreaker(
+                    name,
+                    window=config.get('CIRCUIT_WINDOW', 60.0),
+                    min_calls=config.get('CIRCUIT_MIN_CALLS', 10),
+                    failure_rate=config.get('CIRCUIT_FAILURE_RATE', 0.5),
+                    slow_call_seconds=config.get('CIRCUIT_SLOW_CALL_SECONDS', 20.0),
+                    slow_call_rate=config.get('CIRCUIT_SLOW_CALL_RATE', 0.8),
+                    open_seconds=config.get('CIRCUIT_OPEN_SECONDS', 30.0),
+                    half_open_calls=config.get('CIRCUIT_HALF_OPEN_CALLS', 3)
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def get_circuit_stats():
+    """
+    Get the state of every circuit breaker created so far.
+
+    Returns:
+        dict: Each breaker's stats, by name
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
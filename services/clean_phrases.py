@@ -0,0 +1,108 @@
+# Short everyday phrases known to be correct, per target language.
+# Messages made up entirely of these phrases are judged clean without an LLM call.
+# Phrases are lowercase and keep their accents, since a missing accent can be an error.
+CLEAN_PHRASES = {
+    "English": [
+        "yes", "no", "yes please", "no thanks", "no thank you", "thanks", "thank you",
+        "thank you very much", "hello", "hi", "good morning", "good afternoon",
+        "good evening", "good night", "goodbye", "bye", "see you later", "please",
+        "sorry", "excuse me", "of course", "okay", "ok", "sure", "great", "perfect",
+        "me too", "i see", "you're welcome", "how are you", "i'm fine", "i'm good",
+    ],
+    "Spanish": [
+        "sí", "no", "sí por favor", "no gracias", "gracias", "muchas gracias",
+        "hola", "buenos días", "buenas tardes", "buenas noches", "adiós",
+        "hasta luego", "hasta mañana", "por favor", "perdón", "lo siento",
+        "de nada", "claro", "claro que sí", "vale", "perfecto", "muy bien",
+        "está bien", "yo también", "entiendo", "qué tal", "cómo estás", "estoy bien",
+    ],
+    "French": [
+        "oui", "non", "oui merci", "non merci", "merci", "merci beaucoup",
+        "bonjour", "bonsoir", "bonne nuit", "salut", "au revoir", "à bientôt",
+        "à demain", "s'il vous plaît", "s'il te plaît", "pardon", "désolé",
+        "désolée", "de rien", "bien sûr", "d'accord", "parfait", "très bien",
+        "moi aussi", "je comprends", "ça va", "comment ça va",
+    ],
+    "German": [
+        "ja", "nein", "ja bitte", "nein danke", "danke", "danke schön",
+        "vielen dank", "hallo", "guten morgen", "guten tag", "guten abend",
+        "gute nacht", "tschüss", "auf wiedersehen", "bis später", "bis morgen",
+        "bitte", "entschuldigung", "es tut mir leid", "gern geschehen",
+        "natürlich", "genau", "perfekt", "sehr gut", "ich auch", "wie geht's",
+        "mir geht es gut",
+    ],
+    "Italian": [
+        "sì", "no", "sì grazie", "no grazie", "grazie", "grazie mille", "ciao",
+        "buongiorno", "buonasera", "buonanotte", "arrivederci", "a presto",
+        "a domani", "per favore", "scusa", "scusi", "mi dispiace", "prego",
+        "certo", "va bene", "perfetto", "molto bene", "anch'io", "come stai",
+        "sto bene",
+    ],
+    "Portuguese": [
+        "sim", "não", "sim por favor", "não obrigado", "não obrigada", "obrigado",
+        "obrigada", "muito obrigado", "muito obrigada", "olá", "oi", "bom dia",
+        "boa tarde", "boa noite", "tchau", "adeus", "até logo", "até amanhã",
+        "por favor", "desculpe", "com licença", "de nada", "claro", "tudo bem",
+        "perfeito", "muito bem", "eu também", "como vai",
+    ],
+    "Dutch": [
+        "ja", "nee", "ja graag", "nee dank je", "dank je", "dank je wel",
+        "dank u wel", "bedankt", "hallo", "hoi", "goedemorgen", "goedemiddag",
+        "goedenavond", "welterusten", "dag", "tot ziens", "tot straks",
+        "alsjeblieft", "alstublieft", "sorry", "pardon", "graag gedaan",
+        "natuurlijk", "prima", "oké", "heel goed", "ik ook", "hoe gaat het",
+    ],
+    "Swedish": [
+        "ja", "nej", "ja tack", "nej tack", "tack", "tack så mycket", "hej",
+        "hej hej", "god morgon", "god kväll", "god natt", "hej då", "vi ses",
+        "ursäkta", "förlåt", "varsågod", "självklart", "okej", "perfekt",
+        "mycket bra", "jag också", "hur mår du",
+    ],
+    "Polish": [
+        "tak", "nie", "tak proszę", "nie dziękuję", "dziękuję", "dziękuję bardzo",
+        "cześć", "dzień dobry", "dobry wieczór", "dobranoc", "do widzenia",
+        "do zobaczenia", "proszę", "przepraszam", "nie ma za co", "oczywiście",
+        "dobrze", "w porządku", "świetnie", "ja też", "jak się masz",
+    ],
+    "Turkish": [
+        "evet", "hayır", "teşekkürler", "teşekkür ederim", "çok teşekkürler",
+        "merhaba", "selam", "günaydın", "iyi akşamlar", "iyi geceler",
+        "hoşça kal", "görüşürüz", "lütfen", "özür dilerim", "affedersiniz",
+        "rica ederim", "tabii", "tamam", "harika", "çok iyi", "ben de",
+        "nasılsın", "iyiyim",
+    ],
+    "Russian": [
+        "да", "нет", "да пожалуйста", "нет спасибо", "спасибо", "большое спасибо",
+        "привет", "здравствуйте", "доброе утро", "добрый день", "добрый вечер",
+        "спокойной ночи", "пока", "до свидания", "до завтра", "пожалуйста",
+        "извините", "простите", "конечно", "хорошо", "отлично", "я тоже",
+        "как дела",
+    ],
+    "Arabic": [
+        "نعم", "لا", "شكرا", "شكرا جزيلا", "مرحبا", "السلام عليكم", "صباح الخير",
+        "مساء الخير", "مع السلامة", "من فضلك", "آسف", "عفوا", "طبعا", "حسنا",
+        "ممتاز", "وأنا أيضا", "كيف حالك",
+    ],
+    "Hindi": [
+        "हाँ", "नहीं", "धन्यवाद", "शुक्रिया", "बहुत धन्यवाद", "नमस्ते", "सुप्रभात",
+        "शुभ रात्रि", "फिर मिलेंगे", "कृपया", "माफ़ कीजिए", "ज़रूर", "ठीक है",
+        "बहुत अच्छा", "आप कैसे हैं",
+    ],
+    "Chinese": [
+        "是", "不是", "好", "好的", "谢谢", "谢谢你", "非常感谢", "你好", "早上好",
+        "晚上好", "晚安", "再见", "请", "对不起", "不客气", "当然", "没问题",
+        "太好了", "我也是", "你好吗", "我很好",
+    ],
+    "Japanese": [
+        "はい", "いいえ", "ありがとう", "ありがとうございます", "どうもありがとう",
+        "こんにちは", "おはよう", "おはようございます", "こんばんは", "おやすみなさい",
+        "さようなら", "またね", "お願いします", "すみません", "ごめんなさい",
+        "どういたしまして", "もちろん", "大丈夫です", "いいですね", "元気です",
+    ],
+    "Korean": [
+        "네", "예", "아니요", "감사합니다", "고맙습니다", "정말 감사합니다",
+        "안녕하세요", "안녕히 가세요", "안녕히 계세요", "좋은 아침이에요",
+        "잘 자요", "또 만나요", "주세요", "죄송합니다", "미안해요", "천만에요",
+        "물론이죠", "괜찮아요", "좋아요", "저도요",
+    ],
+}
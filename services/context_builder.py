@@ -0,0 +1,145 @@
+import logging
+import threading
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Conversation, Message
+from services.ai_service import summarize_conversation
+from services.orchestrator import submit_background
+from services.metrics import traced
+from services.profile_cache import invalidate_conversation
+
+logger = logging.getLogger(__name__)
+
+# Conversations with a summary refresh running in this process
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens in a text from its length."""
+    if not text:
+        return 0
+    return len(text) // current_app.config.get('CONTEXT_CHARS_PER_TOKEN', 4) + 1
+
+
+@traced('context')
+def build_context(conversation, target_language):
+    """
+    Build the conversation context for the next bot response.
+
+    Takes the most recent turns that fit in CONTEXT_TOKEN_BUDGET, after the
+    rolling summary. Turns that no longer fit are folded into the summary in
+    the background, so this request never waits on summarization and prompt
+    size stays bounded however long the conversation gets.
+
+    Args:
+        conversation (Conversation or ConversationInfo): The conversation being continued
+        target_language (str): The language the conversation is in
+
+    Returns:
+        tuple: (summary, history) where summary is a string or None and
+               history is a list of chat messages, oldest first
+    """
+    budget = current_app.config.get('CONTEXT_TOKEN_BUDGET', 1500)
+    max_messages = current_app.config.get('CONTEXT_MAX_MESSAGES', 40)
+
+    summary = conversation.summary
+    summarized_through = conversation.summary_through_id or 0
+    remaining = budget - estimate_tokens(summary)
+
+    # Newest first, so the budget is spent on the latest turns
+    recent = Message.query.filter(
+        Message.conversation_id == conversation.id,
+        Message.id > summarized_through
+    ).order_by(Message.id.desc()).limit(max_messages).all()
+
+    history = []
+    overflow_through = None
+    for message in recent:
+        tokens = estimate_tokens(message.content)
+        if tokens > remaining:
+            overflow_through = message.id
+            break
+        history.append({
+            'role': 'user' if message.is_user else 'assistant',
+            'content': message.content
+        })
+        remaining -= tokens
+
+    # Older turns may also lie beyond the message window
+    if overflow_through is None and len(recent) == max_messages:
+        overflow_through = recent[-1].id - 1
+
+    history.reverse()
+    logger.debug("Context for conversation %s: %d turns, ~%d of %d tokens", conversation.id, len(history), budget - remaining, budget)
+
+    if overflow_through is not None and overflow_through > summarized_through:
+        schedule_summary_refresh(conversation.id, overflow_through, target_language)
+
+    return summary, history
+
+
+def refresh_summary(conversation_id, through_id, target_language):
+    """
+    Fold every turn up to and including through_id into the conversation's summary.
+
+    Turns are summarized in batches of CONTEXT_SUMMARY_BATCH, and progress is
+    saved after each batch. Stops at the first failed summarization.
+    """
+    batch_size = current_app.config.get('CONTEXT_SUMMARY_BATCH', 40)
+
+    with Session(db.engine) as summary_session:
+        conversation = summary_session.get(Conversation, conversation_id)
+        if conversation is None:
+            return
+
+        while (conversation.summary_through_id or 0) < through_id:
+            messages = summary_session.execute(
+                select(Message.id, Message.is_user, Message.content)
+                .where(
+                    Message.conversation_id == conversation_id,
+                    Message.id > (conversation.summary_through_id or 0),
+                    Message.id <= through_id
+                )
+                .order_by(Message.id)
+                .limit(batch_size)
+            ).all()
+            if not messages:
+                break
+
+            summary = summarize_conversation(
+                conversation.summary,
+                [(is_user, content) for _, is_user, content in messages],
+                target_language
+            )
+            if summary is None:
+                break
+
+            conversation.summary = summary
+            conversation.summary_through_id = messages[-1].id
+            summary_session.commit()
+
+            # The cached copy still has the old summary
+            invalidate_conversation(conversation_id)
+
+
+def _refresh_in_background(conversation_id, through_id, target_language):
+    """Refresh a summary, marking the conversation so only one refresh runs at a time."""
+    try:
+        refresh_summary(conversation_id, through_id, target_language)
+    except Exception as e:
+        logger.error(f"Error refreshing summary for conversation {conversation_id}: {str(e)}")
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(conversation_id)
+
+
+def schedule_summary_refresh(conversation_id, through_id, target_language):
+    """Start a background summary refresh unless one is already running for the conversation."""
+    with _summarizing_lock:
+        if conversation_id in _summarizing:
+            return
+        _summarizing.add(conversation_id)
+    submit_background(_refresh_in_background, conversation_id, through_id, target_language)
@@ -1,14 +1,168 @@
+import re
 import json
+import hashlib
 import logging
+import threading
 from flask import current_app
-from openai import OpenAI
+from services.circuit_breaker import CircuitOpenError
+from services.rate_limiter import UpstreamBusyError
+from services.clean_phrases import CLEAN_PHRASES
+from services.json_salvage import extract_json_objects
+from services.metrics import traced, annotate
+from services.micro_batcher import MicroBatcher
+from services.model_router import get_primary_model
+from services.openrouter_client import acreate_chat_completion
+from services.translation_service import normalize_text
+from services.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-def detect_errors(message, target_language, proficiency_level):
+# Error types the app groups corrections by; anything else is filed under grammar
+ERROR_TYPES = ('grammar', 'vocabulary', 'syntax')
+
+# Clause boundaries and word tokens for the local pre-screen
+_CLAUSE_SPLIT = re.compile(r"[.,;:!?¡¿…。、，！？；：]+")
+_WORD = re.compile(r"[\w']+")
+
+# Phrase n-grams per language, built from CLEAN_PHRASES on first use
+_lexicons = {}
+
+# Detection results for texts already judged, created on first use
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+# Combines concurrent detections into one upstream request, created on first use
+_batcher = None
+_batcher_lock = threading.Lock()
+
+# How each message was handled: skipped locally or escalated to the LLM
+_stats = {'checked': 0, 'too_short': 0, 'cache_hits': 0, 'lexicon_clean': 0, 'escalated': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _get_result_cache():
+    """Return the in-process detection result cache, creating it on first use."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = TTLCache(
+                    max_size=current_app.config.get('ERROR_CACHE_SIZE', 4096),
+                    ttl=current_app.config.get('ERROR_CACHE_TTL', 86400)
+                )
+    return _result_cache
+
+
+def error_cache_key(message, target_language, proficiency_level, model):
+    """
+    Build the cache key for a detection result.
+
+    Returns:
+        str: A SHA-256 hex digest of the normalized text, language, level and model
+    """
+    parts = [normalize_text(message), target_language, proficiency_level, model]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _tokenize(text):
+    """Split text into clauses of lowercase word tokens."""
+    clauses = _CLAUSE_SPLIT.split(text.lower().replace('’', "'"))
+    return [tokens for tokens in (_WORD.findall(clause) for clause in clauses) if tokens]
+
+
+def _get_lexicon(target_language):
+    """Return the known-clean phrase n-grams for a language and the longest n-gram length."""
+    lexicon = _lexicons.get(target_language)
+    if lexicon is None:
+        phrases = set()
+        for phrase in CLEAN_PHRASES.get(target_language, []):
+            for tokens in _tokenize(phrase):
+                phrases.add(tuple(tokens))
+        lexicon = (phrases, max((len(phrase) for phrase in phrases), default=0))
+        _lexicons[target_language] = lexicon
+    return lexicon
+
+
+def prescreen_confidence(message, target_language):
+    """
+    Estimate how confident we can be that a short message has no errors.
+
+    Each clause is matched greedily against the language's known-clean phrases,
+    longest first. Phrases never span punctuation, so only whole expressions
+    count. Numbers count as clean.
+
+    Args:
+        message (str): The user's message text
+        target_language (str): The language the user is learning
+
+    Returns:
+        float: The share of words covered by known phrases, from 0 to 1
+    """
+    phrases, longest = _get_lexicon(target_language)
+    clauses = _tokenize(message)
+    total = sum(len(tokens) for tokens in clauses)
+    if not phrases or total == 0:
+        return 0.0
+
+    covered = 0
+    for tokens in clauses:
+        i = 0
+        while i < len(tokens):
+            for n in range(min(longest, len(tokens) - i), 0, -1):
+                if tuple(tokens[i:i + n]) in phrases:
+                    covered += n
+                    i += n
+                    break
+            else:
+                if tokens[i].isdigit():
+                    covered += 1
+                i += 1
+
+    return covered / total
+
+
+def _prescreen(message, target_language):
+    """Check whether a message is clean enough to skip the LLM detector."""
+    max_words = current_app.config.get('ERROR_PRESCREEN_MAX_WORDS', 6)
+    if len(message.split()) > max_words:
+        return False
+
+    threshold = current_app.config.get('ERROR_PRESCREEN_CONFIDENCE', 1.0)
+    return prescreen_confidence(message, target_language) >= threshold
+
+
+def get_prescreen_stats():
+    """
+    Get the pre-screen counters.
+
+    Returns:
+        dict: How many messages were checked, skipped for each reason and
+              escalated to the LLM, plus the overall skip rate
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    skipped = stats['too_short'] + stats['cache_hits'] + stats['lexicon_clean']
+    stats['skip_rate'] = skipped / stats['checked'] if stats['checked'] else 0.0
+    stats['result_cache'] = _result_cache.stats() if _result_cache is not None else None
+    return stats
+
+
+@traced('detection')
+async def adetect_errors(message, target_language, proficiency_level):
     """
     Detect and analyze language errors in the user's message.
     
+    Messages are pre-screened locally first. Very short messages, texts that
+    were already judged, and messages made entirely of known-correct phrases
+    are answered without calling the LLM. With ERROR_BATCH_ENABLED, the
+    remaining messages are batched with concurrent ones for the same
+    language and level.
+    
     Args:
         message (str): The user's message text
         target_language (str): The language the user is learning
@@ -18,24 +172,181 @@ def detect_errors(message, target_language, proficiency_level):
         list: A list of dictionaries containing error details:
              [{"error_text": "...", "correction": "...", "error_type": "..."}]
     """
-    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    cache_key, model, errors = _check_locally(message, target_language, proficiency_level)
+    if errors is not None:
+        return errors
     
-    if not api_key:
-        logger.error("OpenRouter API key is not set")
-        return []
+    _count('escalated')
+    if current_app.config.get('ERROR_BATCH_ENABLED', False):
+        errors = await _get_batcher().submit((target_language, proficiency_level, model), message)
+    else:
+        errors = await _detect_upstream(message, target_language, proficiency_level)
+    
+    return _remember(cache_key, errors)
+
+
+def _check_locally(message, target_language, proficiency_level):
+    """
+    Run the local pre-screen for a message.
+    
+    Returns:
+        tuple: (cache_key, model, errors), where errors is the answer if the
+               pre-screen settled the message, or None if the LLM is needed
+    """
+    _count('checked')
     
     # If the message is too short, it's hard to find meaningful errors
     if len(message.split()) < 2:
+        _count('too_short')
+        annotate(cache='too_short')
+        return None, None, []
+    
+    # Key the cache on the primary detection model, whichever model ends up serving the call
+    model = get_primary_model('error_detection')
+    
+    cache_key = error_cache_key(message, target_language, proficiency_level, model)
+    cached = _get_result_cache().get(cache_key)
+    if cached is not None:
+        _count('cache_hits')
+        annotate(cache='hit')
+        return cache_key, model, [dict(error) for error in cached]
+    
+    if _prescreen(message, target_language):
+        _count('lexicon_clean')
+        annotate(cache='prescreen')
+        logger.debug("Pre-screen judged message clean without the LLM: %r", message)
+        return cache_key, model, []
+    
+    annotate(cache='miss')
+    return cache_key, model, None
+
+
+def _remember(cache_key, errors):
+    """Cache a successful LLM result and return a copy for the caller."""
+    if errors is None:
         return []
     
-    # Initialize OpenAI client with OpenRouter endpoint
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
-    )
+    _get_result_cache().set(cache_key, errors)
+    return [dict(error) for error in errors]
+
+
+def validate_error(item):
+    """
+    Check a detected error against the expected schema.
+    
+    Args:
+        item: One entry from the model's "errors" list
+    
+    Returns:
+        dict: The error with stripped text and a known error type, or None if
+              it lacks the error text or correction
+    """
+    if not isinstance(item, dict):
+        return None
+    
+    error_text = item.get('error_text')
+    correction = item.get('correction')
+    if not isinstance(error_text, str) or not isinstance(correction, str):
+        return None
+    
+    error_text = error_text.strip()
+    correction = correction.strip()
+    if not error_text or not correction or error_text == correction:
+        return None
+    
+    error_type = item.get('error_type')
+    error_type = error_type.strip().lower() if isinstance(error_type, str) else ''
+    if error_type not in ERROR_TYPES:
+        error_type = 'grammar'
+    
+    return {'error_text': error_text, 'correction': correction, 'error_type': error_type}
+
+
+def _validate_errors(items):
+    """Keep the valid errors from a list, logging how many were dropped."""
+    errors = [error for error in map(validate_error, items) if error is not None]
+    if len(errors) < len(items):
+        logger.warning(f"Dropped {len(items) - len(errors)} malformed errors from detector output")
+    return errors
+
+
+def parse_errors(content):
+    """
+    Parse the detector's response for one message.
+    
+    Valid JSON is parsed directly. Otherwise, for example when the output is
+    fenced, wrapped in prose or cut off, every complete error object is
+    salvaged from it.
+    
+    Args:
+        content (str): The model's response text
+    
+    Returns:
+        list: The valid errors, or None if the response contains nothing usable
+    """
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict) and isinstance(data.get('errors'), list):
+            return _validate_errors(data['errors'])
+    except json.JSONDecodeError:
+        pass
+    
+    items = None
+    for obj in extract_json_objects(content):
+        if isinstance(obj.get('errors'), list):
+            items = (items or []) + obj['errors']
+        elif 'error_text' in obj:
+            items = (items or []) + [obj]
+    
+    if items is None:
+        return None
+    
+    logger.info(f"Salvaged {len(items)} errors from malformed detector output")
+    return _validate_errors(items)
+
+
+def parse_batch_errors(content):
+    """
+    Parse the detector's response for a batch of messages.
+    
+    Like parse_errors, salvages every complete per-message result from
+    output that isn't valid JSON.
+    
+    Args:
+        content (str): The model's response text
     
-    # System prompt for error detection
-    system_prompt = f"""You are a language tutor analyzing text in {target_language} from a {proficiency_level.lower()} level student.
+    Returns:
+        dict: Maps each message id to its valid errors, or None if the
+              response contains nothing usable
+    """
+    results = None
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            results = data['results']
+    except json.JSONDecodeError:
+        pass
+    
+    if results is None:
+        for obj in extract_json_objects(content):
+            if isinstance(obj.get('results'), list):
+                results = (results or []) + obj['results']
+            elif 'id' in obj and 'errors' in obj:
+                results = (results or []) + [obj]
+    
+    if results is None:
+        return None
+    
+    errors_by_id = {}
+    for result in results:
+        if isinstance(result, dict) and isinstance(result.get('id'), int) and isinstance(result.get('errors'), list):
+            errors_by_id[result['id']] = _validate_errors(result['errors'])
+    return errors_by_id
+
+
+def _system_prompt(target_language, proficiency_level):
+    """Build the error detection system prompt for one message."""
+    return f"""You are a language tutor analyzing text in {target_language} from a {proficiency_level.lower()} level student.
 Your task is to identify grammar, vocabulary, and syntax errors in their message.
 For each error:
 1. Identify the specific error text
@@ -56,35 +367,167 @@ FORMAT YOUR RESPONSE AS JSON:
 If there are no errors, return an empty array for "errors".
 ONLY RETURN VALID JSON. Do not include any explanations or text before or after the JSON.
 """
+
+
+def _batch_system_prompt(target_language, proficiency_level):
+    """Build the error detection system prompt for several independent messages."""
+    return f"""You are a language tutor analyzing texts in {target_language} from {proficiency_level.lower()} level students.
+You will receive a JSON object with a list of independent messages, each with an "id".
+Analyze each message separately and identify its grammar, vocabulary, and syntax errors.
+For each error:
+1. Identify the specific error text
+2. Provide the correct form
+3. Classify the error type (grammar, vocabulary, syntax)
+
+FORMAT YOUR RESPONSE AS JSON:
+{{
+  "results": [
+    {{
+      "id": [id of the message],
+      "errors": [
+        {{
+          "error_text": "[text with error]",
+          "correction": "[corrected text]",
+          "error_type": "[grammar|vocabulary|syntax]"
+        }}
+      ]
+    }}
+  ]
+}}
+
+Return exactly one result for every message id. If a message has no errors, return an empty array for its "errors".
+ONLY RETURN VALID JSON. Do not include any explanations or text before or after the JSON.
+"""
+
+
+async def _detect_upstream(message, target_language, proficiency_level):
+    """
+    Ask the LLM to find errors in a message.
+    
+    Returns:
+        list: The detected errors, or None if detection failed
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        return None
     
     try:
-        # Get the model from the config or use the default one
-        model = current_app.config.get('OPENROUTER_MODEL', 'google/gemini-2.5-pro-exp-03-25:free')
+        completion = await acreate_chat_completion(
+            task='error_detection',
+            messages=_detection_messages(message, target_language, proficiency_level),
+            response_format={"type": "json_object"}
+        )
+        return _parse_detection(completion)
         
-        # Make the API request using the OpenAI client
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": "https://linguabot.replit.app", 
-                "X-Title": "LinguaBot Language Learning Assistant",
-            },
-            model=model,
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping error detection: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Error detecting language errors: {str(e)}")
+        return None
+
+
+def _detection_messages(message, target_language, proficiency_level):
+    """Build the chat messages for detecting errors in one message."""
+    return [
+        {"role": "system", "content": _system_prompt(target_language, proficiency_level)},
+        {"role": "user", "content": message}
+    ]
+
+
+def _parse_detection(completion):
+    """Extract the valid errors from a completion, or None if it has nothing usable."""
+    content = completion.choices[0].message.content.strip()
+    
+    # Parse the JSON response, salvaging what we can from malformed output
+    errors = parse_errors(content)
+    if errors is None:
+        logger.error(f"Error parsing JSON from API - Content: {content}")
+    return errors
+
+
+async def _detect_upstream_batch(messages, target_language, proficiency_level):
+    """
+    Ask the LLM to find errors in several messages with one request.
+    
+    Returns:
+        list: The detected errors for each message, in order, with None for
+              messages the response left out, or None if detection failed
+    """
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    
+    if not api_key:
+        logger.error("OpenRouter API key is not set")
+        return None
+    
+    payload = {"messages": [{"id": i, "text": message} for i, message in enumerate(messages)]}
+    
+    try:
+        completion = await acreate_chat_completion(
+            task='error_detection',
             messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
+                {"role": "system", "content": _batch_system_prompt(target_language, proficiency_level)},
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
             ],
             response_format={"type": "json_object"}
         )
         
         content = completion.choices[0].message.content.strip()
         
-        # Parse the JSON response
-        try:
-            error_data = json.loads(content)
-            return error_data.get('errors', [])
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing JSON from API: {str(e)} - Content: {content}")
-            return []
+        errors_by_id = parse_batch_errors(content)
+        if errors_by_id is None:
+            logger.error(f"Error parsing batch JSON from API - Content: {content}")
+            return None
+        
+        missing = len(messages) - sum(1 for i in range(len(messages)) if i in errors_by_id)
+        if missing:
+            logger.warning(f"Batch error detection left out {missing} of {len(messages)} messages")
         
+        return [errors_by_id.get(i) for i in range(len(messages))]
+        
+    except (CircuitOpenError, UpstreamBusyError) as e:
+        logger.warning(f"Skipping error detection: {str(e)}")
+        return None
     except Exception as e:
-        logger.error(f"Error detecting language errors: {str(e)}")
-        return []
+        logger.error(f"Error detecting language errors in batch: {str(e)}")
+        return None
+
+
+async def _process_batch(key, messages):
+    """Run error detection for a batch of messages that share a language, level and model."""
+    target_language, proficiency_level, _ = key
+    
+    if len(messages) == 1:
+        return [await _detect_upstream(messages[0], target_language, proficiency_level)]
+    
+    results = await _detect_upstream_batch(messages, target_language, proficiency_level)
+    if results is None:
+        return [None] * len(messages)
+    return results
+
+
+def _get_batcher():
+    """Return the error detection batcher, creating it on first use."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _process_batch,
+                    max_batch_size=current_app.config.get('ERROR_BATCH_MAX_SIZE', 8),
+                    max_wait=current_app.config.get('ERROR_BATCH_MAX_WAIT', 0.03),
+                    timeout=current_app.config.get('ERROR_DETECTION_TIMEOUT')
+                )
+    return _batcher
+
+
+def get_batch_stats():
+    """
+    Get the error detection batcher counters.
+    
+    Returns:
+        dict: The batcher's counters, or None if batching hasn't been used
+    """
+    return _batcher.stats() if _batcher is not None else None
@@ -0,0 +1,311 @@
+import json
+import time
+import atexit
+import logging
+import importlib
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, func, event
+from sqlalchemy.orm import Session
+from extensions import db, unit_of_work
+from models import BackgroundJob
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+FAILED = 'failed'
+
+# Modules that register job handlers, imported before any job runs
+HANDLER_MODULES = ('services.tts_service', 'services.translation_service', 'services.progress_service')
+
+# Maps a job kind to the function that runs it
+JOB_HANDLERS = {}
+
+# Worker threads for this process, started on the first request
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+_stopping = threading.Event()
+
+# When this process last pruned old failed jobs, in time.monotonic() seconds
+_last_pruned = None
+_prune_lock = threading.Lock()
+
+_stats = {'enqueued': 0, 'succeeded': 0, 'retried': 0, 'failed': 0, 'pruned': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind. It receives the job's payload as keyword arguments."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """
+    Add a job to the current database session.
+
+    The job is saved by the caller's commit, so it only runs if the work that
+    asked for it is saved too, and workers are woken once that commit lands.
+
+    Args:
+        kind (str): The job kind, as registered with job_handler()
+        **payload: JSON-serializable keyword arguments for the handler
+
+    Returns:
+        BackgroundJob: The new job, or None if JOBS_ENABLED is off
+    """
+    if not current_app.config.get('JOBS_ENABLED', True):
+        return None
+
+    job = BackgroundJob(kind=kind, payload=json.dumps(payload), status=PENDING, run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    _count('enqueued')
+    return job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    """Wake idle workers when a transaction that enqueued jobs commits."""
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def _import_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def _claim_next():
+    """
+    Claim the oldest due job: a pending job whose time has come, or a running
+    job whose lease ran out because its worker died.
+
+    The claim is a compare-and-set on the attempt count, so workers in other
+    threads or processes can't claim the same job twice.
+
+    Returns:
+        int: The claimed job's ID, or None if no job is due
+    """
+    now = datetime.utcnow()
+    lease = timedelta(seconds=current_app.config.get('JOB_LEASE_SECONDS', 120))
+
+    candidates = db.session.execute(
+        select(BackgroundJob.id, BackgroundJob.attempts)
+        .where(BackgroundJob.status.in_((PENDING, RUNNING)), BackgroundJob.run_after <= now)
+        .order_by(BackgroundJob.run_after)
+        .limit(5)
+    ).all()
+
+    for job_id, attempts in candidates:
+        claimed = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.attempts == attempts)
+            .values(status=RUNNING, attempts=attempts + 1, run_after=now + lease)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+
+    db.session.rollback()
+    return None
+
+
+def _record_failure(job_id, error, retry=True):
+    """Schedule a failed job's retry with exponential backoff, or mark it failed for good."""
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None:
+        return
+
+    max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', 5)
+    job.last_error = str(error)[:1000]
+    if retry and job.attempts < max_attempts:
+        delay = current_app.config.get('JOB_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+        job.status = PENDING
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        _count('retried')
+        logger.warning(f"Job {job_id} ({job.kind}) failed, retrying in {delay:g}s: {str(error)}")
+    else:
+        job.status = FAILED
+        _count('failed')
+        logger.error(f"Job {job_id} ({job.kind}) failed after {job.attempts} attempts: {str(error)}")
+    db.session.commit()
+
+
+def run_next():
+    """
+    Claim and run one due job.
+
+    The handler's database changes and the job's removal commit in one
+    transaction, so a job is only gone once its work is saved. Must be called
+    inside an app context.
+
+    Returns:
+        bool: True if a job ran, whether or not it succeeded
+    """
+    _import_handlers()
+
+    job_id = _claim_next()
+    if job_id is None:
+        return False
+
+    job = db.session.get(BackgroundJob, job_id)
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        _record_failure(job_id, f"No handler registered for job kind '{job.kind}'", retry=False)
+        return True
+
+    try:
+        with span(f'job.{job.kind}'):
+            with unit_of_work():
+                handler(**json.loads(job.payload))
+                db.session.execute(delete(BackgroundJob).where(BackgroundJob.id == job_id))
+        _count('succeeded')
+    except Exception as e:
+        _record_failure(job_id, e)
+    return True
+
+
+def run_pending(max_jobs=None):
+    """
+    Run due jobs until none are left, e.g. from a cron job where worker threads can't run.
+
+    Args:
+        max_jobs (int, optional): Stop after this many jobs
+
+    Returns:
+        int: The number of jobs run
+    """
+    ran = 0
+    while (max_jobs is None or ran < max_jobs) and run_next():
+        ran += 1
+    return ran
+
+
+def prune_failed_jobs():
+    """
+    Delete failed jobs older than JOB_RETENTION_DAYS, so the table doesn't grow without bound.
+
+    Finished jobs are deleted as they finish, so only failed ones pile up. A
+    failed job's age is measured from its last attempt. Must be called inside
+    an app context.
+
+    Returns:
+        int: The number of jobs deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('JOB_RETENTION_DAYS', 7))
+    pruned = db.session.execute(
+        delete(BackgroundJob).where(BackgroundJob.status == FAILED, BackgroundJob.run_after < cutoff)
+    ).rowcount
+    db.session.commit()
+
+    if pruned:
+        with _stats_lock:
+            _stats['pruned'] += pruned
+        logger.info(f"Pruned {pruned} failed jobs")
+    return pruned
+
+
+def _prune_if_due():
+    """Prune old failed jobs at most once per JOB_PRUNE_INTERVAL seconds in this process."""
+    global _last_pruned
+    now = time.monotonic()
+    with _prune_lock:
+        if _last_pruned is not None and now - _last_pruned < current_app.config.get('JOB_PRUNE_INTERVAL', 3600):
+            return
+        _last_pruned = now
+    prune_failed_jobs()
+
+
+def _worker_loop(app):
+    """Run jobs as they become due, sleeping until woken or the poll interval passes."""
+    poll_interval = app.config.get('JOB_POLL_INTERVAL', 5)
+    while not _stopping.is_set():
+        # A fresh app context per job, so each job gets its own database session
+        with app.app_context():
+            try:
+                ran = run_next()
+                if not ran:
+                    _prune_if_due()
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+                ran = False
+        if not ran:
+            _wakeup.wait(poll_interval)
+            _wakeup.clear()
+
+
+def _start_workers(app):
+    """Start this process's worker threads, once."""
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(app.config.get('JOB_WORKERS', 2)):
+            worker = threading.Thread(target=_worker_loop, args=(app,), name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def init_job_workers(app):
+    """
+    Start the worker threads on the app's first request.
+
+    Workers aren't started by create_app(), so CLI commands and cold starts
+    don't pay for them. Jobs left over from an earlier process are picked up
+    once the workers start. Set JOB_WORKERS to 0 to only run jobs with
+    "flask run-jobs", e.g. on serverless hosts, where the process is frozen
+    between requests and a running job's lease would run out.
+    """
+    if not app.config.get('JOBS_ENABLED', True) or app.config.get('JOB_WORKERS', 2) <= 0:
+        return
+
+    @app.before_request
+    def start_job_workers():
+        _start_workers(app)
+
+
+def _stop_workers():
+    """Let worker threads finish their current job and exit."""
+    _stopping.set()
+    _wakeup.set()
+
+
+atexit.register(_stop_workers)
+
+
+def get_job_stats():
+    """
+    Get the job counters, and the number of queued jobs by status.
+
+    Must be called inside an app context.
+
+    Returns:
+        dict: Enqueued, succeeded, retried, failed and pruned counts for this process,
+              and "queued" mapping each status to its number of jobs
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    rows = db.session.execute(
+        select(BackgroundJob.status, func.count(BackgroundJob.id)).group_by(BackgroundJob.status)
+    ).all()
+    stats['queued'] = {status: count for status, count in rows}
+    return stats
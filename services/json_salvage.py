@@ -0,0 +1,36 @@
+import json
+
+_decoder = json.JSONDecoder()
+
+
+def extract_json_objects(text):
+    """
+    Extract every complete JSON object from text that may not be valid JSON.
+
+    Handles model output wrapped in code fences or prose, and output cut off
+    part way through. Scanning starts at each "{" in turn. When an object
+    decodes, scanning resumes after it, so only the outermost complete objects
+    are returned. Inside a truncated object, the complete objects nested in it
+    are still found.
+
+    Args:
+        text (str): The text to scan, e.g. a partial or fenced model response
+
+    Returns:
+        list: The decoded objects (dicts), in the order they appear
+    """
+    objects = []
+    index = text.find('{')
+    while index != -1:
+        try:
+            value, end = _decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find('{', index + 1)
+            continue
+
+        if isinstance(value, dict):
+            objects.append(value)
+        index = text.find('{', end)
+
+    return objects
+
@@ -0,0 +1,157 @@
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+# Third-party loggers that log every request at DEBUG or INFO
+NOISY_LOGGERS = ('httpx', 'httpcore', 'openai', 'urllib3', 'gtts', 'sqlalchemy.engine')
+
+# Attributes every LogRecord has; anything else was passed through "extra"
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+# The running listener, so reconfiguring replaces it instead of adding another
+_listener = None
+_listener_lock = threading.Lock()
+
+# The installed queue handler, and records dropped by the handlers it replaced
+_handler = None
+_dropped_by_replaced = 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including any fields passed through "extra"."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Let through only a random share of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the listener thread without ever blocking the caller.
+
+    Filters run before the record is formatted, so sampled-out records cost
+    almost nothing. When the queue is full, records are dropped and counted
+    rather than making a request thread wait on log I/O.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Merge the message arguments and render the traceback before the record
+        changes threads, leaving everything else to the listener's formatter.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Called under the handler's lock, so the count needs no lock of its own
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(config):
+    """
+    Set up logging from the app config.
+
+    Records go through a bounded queue to a listener thread that formats and
+    writes them to stderr, as JSON lines (LOG_FORMAT=json) or plain text.
+    Only LOG_DEBUG_SAMPLE_RATE of DEBUG records are kept, and the noisy
+    third-party loggers are held at LOG_LIBRARY_LEVEL. Calling this again
+    replaces the previous setup.
+
+    Args:
+        config (dict): The app config with the LOG_* settings
+    """
+    global _listener, _handler, _dropped_by_replaced
+
+    if config.get('LOG_FORMAT', 'json') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=config.get('LOG_QUEUE_SIZE', 10000)))
+    handler.addFilter(DebugSampler(config.get('LOG_DEBUG_SAMPLE_RATE', 0.01)))
+
+    root = logging.getLogger()
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+        for existing in root.handlers[:]:
+            if isinstance(existing, DroppingQueueHandler):
+                root.removeHandler(existing)
+                _dropped_by_replaced += existing.dropped
+
+        root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+        root.addHandler(handler)
+        _handler = handler
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+
+    library_level = config.get('LOG_LIBRARY_LEVEL', 'WARNING')
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(library_level)
+
+
+def get_dropped_log_records():
+    """
+    Get the number of log records dropped because the log queue was full.
+
+    Returns:
+        int: Records dropped since the process started, across reconfigurations
+    """
+    with _listener_lock:
+        return _dropped_by_replaced + (_handler.dropped if _handler is not None else 0)
+
+
+def _stop_listener():
+    """Flush queued records when the process exits."""
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+
+
+atexit.register(_stop_listener)
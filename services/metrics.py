@@ -0,0 +1,364 @@
+import time
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    """Format a dict of labels as {name="value",...}, or an empty string."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_metric(name, documentation, metric_type, samples):
+    """Format one metric family: HELP and TYPE lines, then one line per (suffix, labels, value) sample."""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{suffix}{_format_labels(labels)} {value}' for suffix, labels, value in samples)
+    return lines
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Record one observation for a label combination."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """Format the histogram's series, with cumulative buckets as Prometheus expects."""
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+
+        samples = []
+        for label_values, values in sorted(series.items()):
+            labels = dict(zip(self.label_names, label_values))
+            for bound, count in zip(self.buckets, values):
+                samples.append(('_bucket', {**labels, 'le': bound}, count))
+            samples.append(('_bucket', {**labels, 'le': '+Inf'}, values[-1]))
+            samples.append(('_sum', labels, round(values[-2], 6)))
+            samples.append(('_count', labels, values[-1]))
+        return _format_metric(self.name, self.documentation, 'histogram', samples)
+
+
+class Counter:
+    """A Prometheus counter with a fixed set of label names."""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        """Add an amount to a label combination's count."""
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        """Format the counter's series."""
+        with self._lock:
+            series = dict(self._series)
+        samples = [('', dict(zip(self.label_names, labels)), value) for labels, value in sorted(series.items())]
+        return _format_metric(self.name, self.documentation, 'counter', samples)
+
+
+SPAN_SECONDS = Histogram(
+    'linguabot_span_seconds',
+    'Time spent in instrumented service calls and database commits',
+    ('span', 'outcome')
+)
+UPSTREAM_SECONDS = Histogram(
+    'linguabot_upstream_request_seconds',
+    'OpenRouter request latency by task, model and response status',
+    ('task', 'model', 'status')
+)
+UPSTREAM_TOKENS = Counter(
+    'linguabot_upstream_tokens_total',
+    'Prompt and completion tokens reported by OpenRouter',
+    ('task', 'model', 'kind')
+)
+
+_METRICS = (SPAN_SECONDS, UPSTREAM_SECONDS, UPSTREAM_TOKENS)
+
+
+class Span:
+    """One timed operation, with attributes such as cache outcome, upstream status and token counts."""
+
+    def __init__(self, name):
+        self.name = name
+        self.attributes = {}
+        self.duration = None
+
+
+# The innermost open span, and the spans finished so far in this request (None outside a timed request)
+_current_span = contextvars.ContextVar('current_span', default=None)
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+@contextmanager
+def span(name):
+    """
+    Time a block and record it in the span histogram.
+
+    The span is also added to the current request's Server-Timing breakdown,
+    when that is enabled. Code running inside the block can attach
+    attributes to it with annotate().
+
+    Args:
+        name (str): The operation, e.g. "translation" or "db.commit"
+
+    Yields:
+        Span: The span being timed
+    """
+    current = Span(name)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield current
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        SPAN_SECONDS.observe(current.duration, name, outcome)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append(current)
+
+
+def traced(name):
+    """
+    Decorate a function or coroutine function so every call runs in a span.
+
+    Args:
+        name (str): The span name
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def annotate(**attributes):
+    """Attach attributes to the innermost open span, if there is one. Numeric attributes are summed."""
+    current = _current_span.get()
+    if current is None:
+        return
+    for key, value in attributes.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key in current.attributes:
+            current.attributes[key] += value
+        else:
+            current.attributes[key] = value
+
+
+def record_upstream_call(task, model, status, latency):
+    """
+    Record one OpenRouter request.
+
+    Args:
+        task (str): The task the request was for
+        model (str): The model it went to
+        status: The HTTP status, or a short reason such as "connection_error"
+        latency (float): Seconds the request took
+    """
+    UPSTREAM_SECONDS.observe(latency, task, model, str(status))
+    annotate(model=model, upstream_status=status)
+
+
+def record_upstream_tokens(task, model, prompt_tokens, completion_tokens):
+    """Record the token counts OpenRouter reported for one completion."""
+    UPSTREAM_TOKENS.inc(prompt_tokens, task, model, 'prompt')
+    UPSTREAM_TOKENS.inc(completion_tokens, task, model, 'completion')
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def _server_timing(spans):
+    """Format finished spans as a Server-Timing header value."""
+    entries = []
+    for finished in spans:
+        entry = f'{finished.name};dur={finished.duration * 1000:.1f}'
+        if finished.attributes:
+            description = ' '.join(f'{key}={value}' for key, value in finished.attributes.items())
+            entry += f';desc="{_escape(description)}"'
+        entries.append(entry)
+    return ', '.join(entries)
+
+
+def init_request_timing(app):
+    """
+    Add a Server-Timing header to responses when SERVER_TIMING_ENABLED is set.
+
+    The header lists every span finished while the view ran, including spans
+    in branches started on the orchestrator. Spans that finish while a
+    streamed response is being sent come too late for the header, but are
+    still recorded in the histograms.
+    """
+    @app.before_request
+    def start_request_timing():
+        _request_spans.set([] if current_app.config.get('SERVER_TIMING_ENABLED', False) else None)
+
+    @app.after_request
+    def add_server_timing(response):
+        spans = _request_spans.get()
+        if spans:
+            response.headers['Server-Timing'] = _server_timing(spans)
+        return response
+
+    @app.teardown_request
+    def end_request_timing(error=None):
+        _request_spans.set(None)
+
+
+def _service_metrics():
+    """Format the counters kept by the services as gauges and counters."""
+    from services.circuit_breaker import get_circuit_stats
+    from services.error_detector import get_prescreen_stats, get_batch_stats
+    from services.job_queue import get_job_stats
+    from services.log_config import get_dropped_log_records
+    from services.model_router import get_model_stats
+    from services.profile_cache import get_profile_cache_stats
+    from services.rate_limiter import get_rate_limit_stats
+    from services.translation_service import get_translation_cache_stats
+    from services.tts_service import get_tts_cache_stats
+
+    lines = []
+
+    translation = get_translation_cache_stats()
+    profiles = get_profile_cache_stats()
+    prescreen = get_prescreen_stats()
+    caches = {
+        'translation_memory': translation['memory'],
+        'translation_database': translation['database'],
+        'profile_users': profiles['users'],
+        'profile_conversations': profiles['conversations'],
+        'tts_audio': get_tts_cache_stats()
+    }
+    if prescreen['result_cache'] is not None:
+        caches['error_results'] = prescreen['result_cache']
+
+    for outcome in ('hits', 'misses', 'evictions'):
+        lines += _format_metric(
+            f'linguabot_cache_{outcome}_total', f'Cache {outcome} by cache', 'counter',
+            [('', {'cache': cache}, stats[outcome]) for cache, stats in caches.items() if outcome in stats]
+        )
+
+    lines += _format_metric(
+        'linguabot_error_prescreen_total', 'Error detection requests by how they were answered', 'counter',
+        [('', {'result': key}, prescreen[key]) for key in ('too_short', 'cache_hits', 'lexicon_clean', 'escalated')]
+    )
+
+    batch = get_batch_stats()
+    if batch is not None:
+        lines += _format_metric('linguabot_error_batches_total', 'Error detection batches sent upstream', 'counter',
+                                [('', {}, batch['batches'])])
+        lines += _format_metric('linguabot_error_batch_items_total', 'Messages sent upstream in error detection batches',
+                                'counter', [('', {}, batch['items'])])
+
+    circuits = get_circuit_stats()
+    states = {'closed': 0, 'half_open': 1, 'open': 2}
+    lines += _format_metric(
+        'linguabot_circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', 'gauge',
+        [('', {'circuit': name}, states[stats['state']]) for name, stats in circuits.items()]
+    )
+    lines += _format_metric(
+        'linguabot_circuit_rejected_total', 'Calls rejected by an open circuit', 'counter',
+        [('', {'circuit': name}, stats['rejected']) for name, stats in circuits.items()]
+    )
+
+    models = [(task, model, stats) for task, by_model in get_model_stats().items() for model, stats in by_model.items()]
+    lines += _format_metric(
+        'linguabot_model_latency_ewma_seconds', 'Latency EWMA used for model routing', 'gauge',
+        [('', {'task': task, 'model': model}, stats['latency_ewma'] or 0) for task, model, stats in models]
+    )
+    lines += _format_metric(
+        'linguabot_model_error_ewma', 'Error rate EWMA used for model routing', 'gauge',
+        [('', {'task': task, 'model': model}, stats['error_ewma']) for task, model, stats in models]
+    )
+
+    jobs = get_job_stats()
+    lines += _format_metric(
+        'linguabot_jobs_total', 'Background jobs by outcome, in this process', 'counter',
+        [('', {'result': key}, jobs[key]) for key in ('enqueued', 'succeeded', 'retried', 'failed', 'pruned')]
+    )
+    lines += _format_metric('linguabot_jobs_queued', 'Background jobs in the queue by status', 'gauge',
+                            [('', {'status': status}, count) for status, count in sorted(jobs['queued'].items())])
+
+    gate = get_rate_limit_stats()
+    if gate is not None:
+        lines += _format_metric('linguabot_upstream_gate_active', 'OpenRouter and gTTS calls holding an upstream slot', 'gauge',
+                                [('', {}, gate['active'])])
+        lines += _format_metric('linguabot_upstream_gate_waiting', 'OpenRouter and gTTS calls queued for an upstream slot', 'gauge',
+                                [('', {}, gate['waiting'])])
+        lines += _format_metric(
+            'linguabot_upstream_gate_rejected_total', 'OpenRouter and gTTS calls turned away by the upstream gate', 'counter',
+            [('', {'reason': 'queue_full'}, gate['rejected']), ('', {'reason': 'timeout'}, gate['timeouts'])]
+        )
+
+    lines += _format_metric('linguabot_log_records_dropped_total', 'Log records dropped because the log queue was full',
+                            'counter', [('', {}, get_dropped_log_records())])
+
+    return lines
+
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Must be called inside an app context.
+
+    Returns:
+        str: The metrics page
+    """
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    try:
+        lines += _service_metrics()
+    except Exception as e:
+        logger.error(f"Error collecting service metrics: {str(e)}")
+    return '\n'.join(lines) + '\n'
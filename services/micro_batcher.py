@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    """Items collected for one key, with a future for each item's result."""
+
+    def __init__(self, loop):
+        self.items = []
+        self.futures = []
+        self.loop = loop
+        self.full = asyncio.Event()
+
+
+class MicroBatcher:
+    """
+    Combine concurrent calls with the same key into one batched call.
+
+    The first caller for a key opens a batch, which runs as its own task on
+    that caller's event loop. The task waits up to max_wait seconds for other
+    callers to join, or until max_batch_size items are collected, then
+    awaits process_batch once for all of them. Callers await their item's
+    future, so waiting for a batch holds no thread.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait=0.03, timeout=None):
+        """
+        Args:
+            process_batch (callable): Coroutine function called as process_batch(key, items).
+                Must return a list with one result per item, in the same order
+            max_batch_size (int): Items that trigger an immediate flush
+            max_wait (float): Seconds a batch waits for more items
+            timeout (float): Seconds a caller waits for its result, or None to wait forever
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._pending = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.timeouts = 0
+
+    async def submit(self, key, item):
+        """
+        Add an item to the batch for its key and wait for the item's result.
+
+        Returns:
+            The item's result, or None if the batch failed or the wait timed out
+        """
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = _Batch(asyncio.get_running_loop())
+                self._pending[key] = batch
+                task = batch.loop.create_task(self._run(key, batch))
+                # The loop only keeps weak references to tasks
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_batch_size:
+                del self._pending[key]
+                batch.loop.call_soon_threadsafe(batch.full.set)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            return None
+
+    async def _run(self, key, batch):
+        """Wait for the batch to fill or its time to run out, then process it and hand out the results."""
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+
+        with self._lock:
+            # Close the batch so later callers start a new one
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+            items = list(batch.items)
+            futures = list(batch.futures)
+            self.batches += 1
+            self.items += len(items)
+
+        try:
+            results = await self.process_batch(key, items)
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(items)}: {str(e)}")
+            results = [None] * len(items)
+
+        for future, result in zip(futures, results):
+            try:
+                future.set_result(result)
+            except InvalidStateError:
+                # The caller timed out and stopped waiting
+                pass
+
+    def stats(self):
+        """
+        Get the batcher counters.
+
+        Returns:
+            dict: Batches run, items processed, the average batch size and caller timeouts
+        """
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'average_batch_size': self.items / self.batches if self.batches else 0.0,
+                'timeouts': self.timeouts
+            }
@@ -0,0 +1,186 @@
+import time
+import bisect
+import logging
+import threading
+from flask import current_app
+from services.circuit_breaker import get_breaker, OPEN
+
+logger = logging.getLogger(__name__)
+
+# Tasks that send requests to OpenRouter, each with its own list of models
+TASKS = ('chat', 'translation', 'error_detection', 'summary')
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+
+class ModelStats:
+    """Live latency and error figures for one model on one task."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.updated_at = time.monotonic()
+
+    def error_rate(self, half_life, now=None):
+        """
+        The error EWMA, decayed by the time since the last call.
+
+        A model benched for its errors gets no calls to bring its EWMA down,
+        so the EWMA halves every half_life seconds instead, until the model
+        is healthy enough to be tried again.
+        """
+        if not half_life:
+            return self.error_ewma
+        elapsed = (now if now is not None else time.monotonic()) - self.updated_at
+        return self.error_ewma * 0.5 ** (elapsed / half_life)
+
+    def record(self, latency, failed, alpha, half_life=None):
+        """Fold one call into the averages and the histogram."""
+        now = time.monotonic()
+        self.calls += 1
+        self.failures += failed
+        self.latency_ewma = latency if self.latency_ewma is None else alpha * latency + (1 - alpha) * self.latency_ewma
+        self.error_ewma = alpha * failed + (1 - alpha) * self.error_rate(half_life, now)
+        self.updated_at = now
+        self.latency_sum += latency
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def to_dict(self, half_life=None):
+        """Return the figures, with the error EWMA decayed to now and the histogram keyed by each bucket's upper bound."""
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'latency_ewma': round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            'error_ewma': round(self.error_rate(half_life), 3),
+            'latency_sum': round(self.latency_sum, 3),
+            'latency_histogram': dict(zip(bounds, self.buckets))
+        }
+
+
+# Stats by (task, model), shared by every thread
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_task_models(task):
+    """
+    Get the models configured for a task, in fallback order.
+
+    Args:
+        task (str): One of TASKS
+
+    Returns:
+        list: Model IDs, falling back to OPENROUTER_MODEL when the task has none
+    """
+    routes = current_app.config.get('MODEL_ROUTES') or {}
+    return routes.get(task) or [current_app.config.get('OPENROUTER_MODEL', 'google/gemini-2.5-pro-exp-03-25:free')]
+
+
+def get_primary_model(task):
+    """
+    Get the first model configured for a task.
+
+    Cache keys use this model rather than the one a call was routed to, so a
+    fallback during an outage doesn't split the cache.
+
+    Args:
+        task (str): One of TASKS
+
+    Returns:
+        str: The model ID
+    """
+    return get_task_models(task)[0]
+
+
+def model_circuit(model):
+    """Return the circuit breaker for one model's OpenRouter calls."""
+    return get_breaker(f'openrouter:{model}')
+
+
+def choose_models(task):
+    """
+    Rank a task's models for the next call.
+
+    Healthy models come first, fastest first by latency EWMA. A model is
+    healthy when its circuit isn't open and its error EWMA is below
+    MODEL_MAX_ERROR_RATE. The error EWMA decays with MODEL_ERROR_HALF_LIFE,
+    so a model benched for a burst of errors is tried again once they are
+    old. Models with no calls yet rank as fastest, so each is tried at least
+    once. Unhealthy models follow in configured order, as a last resort.
+
+    Args:
+        task (str): One of TASKS
+
+    Returns:
+        list: Model IDs to try, in order
+    """
+    models = get_task_models(task)
+    if len(models) == 1:
+        return models
+
+    max_error_rate = current_app.config.get('MODEL_MAX_ERROR_RATE', 0.5)
+    half_life = current_app.config.get('MODEL_ERROR_HALF_LIFE', 60.0)
+    healthy, unhealthy = [], []
+    with _stats_lock:
+        for position, model in enumerate(models):
+            stats = _stats.get((task, model))
+            if model_circuit(model).state == OPEN or (stats is not None and stats.error_rate(half_life) >= max_error_rate):
+                unhealthy.append(model)
+            else:
+                latency = stats.latency_ewma if stats is not None and stats.latency_ewma is not None else 0.0
+                healthy.append((latency, position, model))
+
+    return [model for _, _, model in sorted(healthy)] + unhealthy
+
+
+def record_model_call(task, model, latency, failed):
+    """
+    Record the outcome of one call to a model.
+
+    Args:
+        task (str): One of TASKS
+        model (str): The model the call went to
+        latency (float): Seconds the call took
+        failed (bool): Whether the call failed in a way that reflects the model's health
+    """
+    alpha = current_app.config.get('MODEL_EWMA_ALPHA', 0.2)
+    half_life = current_app.config.get('MODEL_ERROR_HALF_LIFE', 60.0)
+    with _stats_lock:
+        stats = _stats.get((task, model))
+        if stats is None:
+            stats = _stats[(task, model)] = ModelStats()
+        stats.record(latency, failed, alpha, half_life)
+
+
+def get_model_stats():
+    """
+    Get the live figures and latency histogram of every model called so far.
+
+    Returns:
+        dict: Stats by task, then by model
+    """
+    half_life = current_app.config.get('MODEL_ERROR_HALF_LIFE', 60.0)
+    result = {}
+    with _stats_lock:
+        for (task, model), stats in _stats.items():
+            result.setdefault(task, {})[model] = stats.to_dict(half_life)
+    return result
+
+
+def is_degraded():
+    """
+    Check whether any task has no model with a closed or probing circuit.
+
+    Returns:
+        bool: True if some task can only get degraded responses
+    """
+    return any(
+        all(model_circuit(model).state == OPEN for model in get_task_models(task))
+        for task in TASKS
+    )
@@ -0,0 +1,194 @@
+import random
+import logging
+import threading
+from flask import current_app
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+from extensions import db
+from models import ScenarioOpener
+from services.ai_service import generate_bot_response, FALLBACK_RESPONSE, DEGRADED_RESPONSE, MISSING_KEY_RESPONSE
+from services.translation_service import is_cacheable_translation
+from services.orchestrator import submit_background
+from services.metrics import traced, annotate
+
+logger = logging.getLogger(__name__)
+
+# Combinations with a background refill running in this process
+_refilling = set()
+_refilling_lock = threading.Lock()
+
+
+def _combination_filter(scenario, target_language, native_language, proficiency_level):
+    """Build the WHERE clause selecting the openers for one combination."""
+    return (
+        (ScenarioOpener.scenario == scenario)
+        & (ScenarioOpener.target_language == target_language)
+        & (ScenarioOpener.native_language == native_language)
+        & (ScenarioOpener.proficiency_level == proficiency_level)
+    )
+
+
+def _is_poolable(response, translated):
+    """Check that an opener is a real response worth serving to other users."""
+    if (response, translated) in (FALLBACK_RESPONSE, DEGRADED_RESPONSE, MISSING_KEY_RESPONSE):
+        return False
+    return is_cacheable_translation(translated)
+
+
+def _count_openers(key):
+    """Count the openers currently pooled for a combination."""
+    with Session(db.engine) as pool_session:
+        return pool_session.execute(
+            select(func.count(ScenarioOpener.id)).where(_combination_filter(*key))
+        ).scalar_one()
+
+
+def _add_opener(key, response, translated):
+    """Add an opener to the pool for a combination."""
+    scenario, target_language, native_language, proficiency_level = key
+    with Session(db.engine) as pool_session:
+        pool_session.add(ScenarioOpener(
+            scenario=scenario,
+            target_language=target_language,
+            native_language=native_language,
+            proficiency_level=proficiency_level,
+            content=response,
+            translated_content=translated,
+            uses=0
+        ))
+        pool_session.commit()
+
+
+def _take_opener(key, max_uses):
+    """
+    Pick a random pooled opener for a combination and record the use.
+
+    Openers that reach max_uses are removed from the pool.
+
+    Returns:
+        tuple: (opener, remaining) where opener is (response_text, translated_text)
+               or None if the pool is empty, and remaining is the pool size afterwards
+    """
+    with Session(db.engine) as pool_session:
+        rows = pool_session.execute(
+            select(ScenarioOpener.id, ScenarioOpener.content, ScenarioOpener.translated_content)
+            .where(_combination_filter(*key))
+        ).all()
+        if not rows:
+            return None, 0
+
+        opener_id, content, translated_content = random.choice(rows)
+        pool_session.execute(
+            update(ScenarioOpener)
+            .where(ScenarioOpener.id == opener_id)
+            .values(uses=ScenarioOpener.uses + 1)
+        )
+        retired = pool_session.execute(
+            delete(ScenarioOpener)
+            .where(ScenarioOpener.id == opener_id, ScenarioOpener.uses >= max_uses)
+        ).rowcount
+        pool_session.commit()
+
+    return (content, translated_content), len(rows) - retired
+
+
+def refill_pool(scenario, target_language, native_language, proficiency_level):
+    """
+    Generate openers until the pool for a combination is full.
+
+    Stops early if generation fails, so an upstream outage doesn't
+    turn into a tight retry loop.
+
+    Returns:
+        int: The number of openers added
+    """
+    key = (scenario, target_language, native_language, proficiency_level)
+    missing = current_app.config.get('OPENER_POOL_SIZE', 5) - _count_openers(key)
+
+    added = 0
+    while added < missing:
+        response, translated = generate_bot_response(
+            None,
+            scenario,
+            target_language,
+            native_language,
+            proficiency_level,
+            is_initial=True
+        )
+        if not _is_poolable(response, translated):
+            logger.warning(f"Stopped refilling opener pool for {key}: generation failed")
+            break
+
+        _add_opener(key, response, translated)
+        added += 1
+
+    return added
+
+
+def _refill_in_background(key):
+    """Refill the pool for a combination, marking it so only one refill runs at a time."""
+    try:
+        refill_pool(*key)
+    except Exception as e:
+        logger.error(f"Error refilling opener pool for {key}: {str(e)}")
+    finally:
+        with _refilling_lock:
+            _refilling.discard(key)
+
+
+def _schedule_refill(key):
+    """Start a background refill for a combination unless one is already running."""
+    with _refilling_lock:
+        if key in _refilling:
+            return
+        _refilling.add(key)
+    submit_background(_refill_in_background, key)
+
+
+@traced('opener')
+def get_opener(scenario, target_language, native_language, proficiency_level):
+    """
+    Get the opening bot message for a new conversation.
+
+    Serves a random opener from the pool when one is available, so starting a
+    conversation makes no upstream calls. Each opener is retired after
+    OPENER_MAX_USES uses and the pool is topped up in the background. When the
+    pool is empty, an opener is generated synchronously for this conversation
+    only; the background refill fills the pool, so it ends up with
+    OPENER_POOL_SIZE openers rather than one more.
+
+    Args:
+        scenario (str): The conversation scenario (e.g., "cafe", "shopping")
+        target_language (str): The language the user is learning
+        native_language (str): The user's native language
+        proficiency_level (str): The user's proficiency level (Beginner, Intermediate, Advanced)
+
+    Returns:
+        tuple: (response_text, translated_text)
+    """
+    key = (scenario, target_language, native_language, proficiency_level)
+    pool_size = current_app.config.get('OPENER_POOL_SIZE', 5)
+    max_uses = current_app.config.get('OPENER_MAX_USES', 20)
+
+    try:
+        opener, remaining = _take_opener(key, max_uses)
+    except Exception as e:
+        logger.warning(f"Opener pool read failed: {str(e)}")
+        opener, remaining = None, pool_size
+
+    if remaining < pool_size:
+        _schedule_refill(key)
+
+    if opener:
+        annotate(cache='pool')
+        return opener
+
+    annotate(cache='miss')
+    return generate_bot_response(
+        None,
+        scenario,
+        target_language,
+        native_language,
+        proficiency_level,
+        is_initial=True
+    )
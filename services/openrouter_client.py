@@ -0,0 +1,469 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from flask import current_app
+from services.circuit_breaker import CircuitOpenError
+from services.model_router import choose_models, model_circuit, record_model_call
+from services.metrics import record_upstream_call, record_upstream_tokens
+from services.rate_limiter import acquire_upstream_slot, aacquire_upstream_slot
+
+# httpx and openai are imported by the functions that use them, keeping them out of cold start
+
+logger = logging.getLogger(__name__)
+
+# Attribution headers sent with every OpenRouter request
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://linguabot.replit.app",
+    "X-Title": "LinguaBot Language Learning Assistant",
+}
+
+# Upstream statuses worth retrying: rate limits, timeouts and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Process-wide client, shared by every service and thread
+_client = None
+_client_settings = None
+_client_lock = threading.Lock()
+
+# Async clients, one per event loop since their connections are bound to the loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _settings_from_config(config):
+    """Collect the settings the shared client is built from."""
+    return (
+        config.get('OPENROUTER_API_KEY'),
+        config.get('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1'),
+        config.get('OPENROUTER_TIMEOUT', 60.0),
+        config.get('OPENROUTER_CONNECT_TIMEOUT', 5.0),
+        config.get('OPENROUTER_MAX_CONNECTIONS', 20),
+        config.get('OPENROUTER_MAX_KEEPALIVE', 10),
+    )
+
+
+def _build_http_settings(settings):
+    """Build the httpx connection limits and timeouts for a settings tuple."""
+    import httpx
+    
+    _, _, timeout, connect_timeout, max_connections, max_keepalive = settings
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+    return limits, httpx.Timeout(timeout, connect=connect_timeout)
+
+
+def get_client():
+    """
+    Get the shared OpenRouter client for this process.
+
+    The client keeps connections alive in a bounded pool, so calls reuse
+    existing TCP and TLS sessions instead of opening new ones. It is rebuilt
+    only if the relevant app config changes.
+
+    Returns:
+        OpenAI: An OpenAI client pointed at the OpenRouter endpoint
+    """
+    import httpx
+    from openai import OpenAI
+    
+    global _client, _client_settings
+    settings = _settings_from_config(current_app.config)
+
+    with _client_lock:
+        if _client is None or _client_settings != settings:
+            api_key, base_url = settings[:2]
+            limits, timeout = _build_http_settings(settings)
+            http_client = httpx.Client(limits=limits, timeout=timeout)
+
+            if _client is not None:
+                _client.close()
+
+            # Retries are handled by create_chat_completion, so the SDK's own are disabled
+            _client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                http_client=http_client,
+                max_retries=0,
+                default_headers=OPENROUTER_HEADERS
+            )
+            _client_settings = settings
+
+        return _client
+
+
+def get_async_client():
+    """
+    Get the async OpenRouter client for the running event loop.
+
+    Like get_client(), the client keeps a bounded pool of live connections and
+    is rebuilt only if the relevant app config changes. Must be called from a
+    coroutine.
+
+    Returns:
+        AsyncOpenAI: An async OpenAI client pointed at the OpenRouter endpoint
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    
+    settings = _settings_from_config(current_app.config)
+    loop = asyncio.get_running_loop()
+
+    entry = _async_clients.get(loop)
+    if entry is None or entry[1] != settings:
+        limits, timeout = _build_http_settings(settings)
+        client = AsyncOpenAI(
+            base_url=settings[1],
+            api_key=settings[0],
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            max_retries=0,
+            default_headers=OPENROUTER_HEADERS
+        )
+        if entry is not None:
+            loop.create_task(entry[0].close())
+        entry = (client, settings)
+        _async_clients[loop] = entry
+
+    return entry[0]
+
+
+def _record_usage(task, model, completion):
+    """Add a completion's reported token counts to the metrics."""
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        return
+
+    record_upstream_tokens(task, model, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+    logger.debug("OpenRouter usage: %s prompt tokens, %s completion tokens", usage.prompt_tokens, usage.completion_tokens)
+
+
+def _parse_retry_after(value):
+    """Parse a Retry-After header given in seconds, or return None."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_delay(attempt, retry_after=None):
+    """
+    Compute how long to wait before the next attempt.
+
+    Uses exponential backoff with full jitter, unless the server asked
+    for a specific delay through Retry-After.
+    """
+    backoff_max = current_app.config.get('OPENROUTER_RETRY_BACKOFF_MAX', 8.0)
+    if retry_after is not None:
+        return min(retry_after, backoff_max)
+
+    backoff = current_app.config.get('OPENROUTER_RETRY_BACKOFF', 0.5)
+    return random.uniform(0, min(backoff_max, backoff * (2 ** attempt)))
+
+
+def _retry_after_failure(error, attempt, max_retries, deadline):
+    """
+    Decide whether a failed request should be retried.
+
+    A retry whose backoff would run past the call's deadline isn't made.
+
+    Returns:
+        tuple: (delay, reason) if the request should be retried, otherwise None
+    """
+    from openai import APIStatusError
+    
+    if attempt >= max_retries:
+        return None
+    if isinstance(error, APIStatusError):
+        if error.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        delay = _retry_delay(attempt, _parse_retry_after(error.response.headers.get('retry-after')))
+        reason = f"status {error.status_code}"
+    else:
+        delay, reason = _retry_delay(attempt), str(error)
+
+    if time.monotonic() + delay >= deadline:
+        logger.warning(f"Not retrying OpenRouter request ({reason}): the call's deadline would pass first")
+        return None
+    return delay, reason
+
+
+def _call_deadline():
+    """Return the monotonic time by which a call, with all its retries and fallbacks, must finish."""
+    return time.monotonic() + current_app.config.get('OPENROUTER_TOTAL_TIMEOUT', 90.0)
+
+
+def _attempt_timeout(deadline):
+    """Build the timeout for an attempt starting now: OPENROUTER_TIMEOUT, cut short by the call's deadline."""
+    import httpx
+    
+    remaining = max(0.001, deadline - time.monotonic())
+    return httpx.Timeout(
+        min(current_app.config.get('OPENROUTER_TIMEOUT', 60.0), remaining),
+        connect=min(current_app.config.get('OPENROUTER_CONNECT_TIMEOUT', 5.0), remaining)
+    )
+
+
+def _get_circuit(model):
+    """Return a model's circuit breaker, or None if circuit breaking is disabled."""
+    if not current_app.config.get('CIRCUIT_BREAKER_ENABLED', True):
+        return None
+    return model_circuit(model)
+
+
+def _is_upstream_failure(error):
+    """Check whether an error means OpenRouter is unhealthy, rather than that the request was bad."""
+    from openai import APIStatusError, APIConnectionError
+    
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, APIConnectionError)
+
+
+def _attempt_status(error):
+    """Describe a failed attempt for the metrics: the HTTP status, or why there was none."""
+    from openai import APIStatusError, APITimeoutError
+    
+    if isinstance(error, APIStatusError):
+        return error.status_code
+    if isinstance(error, APITimeoutError):
+        return 'timeout'
+    return 'connection_error'
+
+
+def _record_attempt(task, model, circuit, started, failed, status):
+    """
+    Record one attempt's outcome with the model's circuit breaker, the router and the metrics.
+
+    An attempt aborted by an unexpected local error says nothing about the
+    model's health, so it only reaches the metrics, and frees its circuit slot.
+    """
+    latency = time.monotonic() - started
+    record_upstream_call(task, model, status, latency)
+    if status == 'aborted':
+        if circuit is not None:
+            circuit.release()
+        return
+    if circuit is not None:
+        circuit.record(latency, failed)
+    record_model_call(task, model, latency, failed)
+
+
+class _SlotHoldingStream:
+    """
+    Wrap an OpenAI stream so it holds its upstream slot until it has been
+    read to the end, closed or garbage collected.
+    """
+
+    def __init__(self, stream, release_slot):
+        self._stream = stream
+        self._release_slot = release_slot
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            await self.aclose()
+
+    def close(self):
+        self._release_slot()
+        self._stream.close()
+
+    async def aclose(self):
+        self._release_slot()
+        await self._stream.close()
+
+    def __del__(self):
+        self._release_slot()
+
+
+def _should_fall_back(error, task, model, fallbacks, deadline):
+    """
+    Decide whether a failed call should move on to the next model.
+
+    Returns:
+        bool: True if there is another model, the failure was upstream's fault
+              and the call's deadline hasn't passed
+    """
+    if not fallbacks or not (isinstance(error, CircuitOpenError) or _is_upstream_failure(error)):
+        return False
+    if time.monotonic() >= deadline:
+        logger.warning(f"{task} call to {model} failed ({str(error)}) and its deadline has passed, not falling back")
+        return False
+    logger.warning(f"{task} call to {model} failed ({str(error)}), falling back to {fallbacks[0]}")
+    return True
+
+
+def create_chat_completion(task, **kwargs):
+    """
+    Create a chat completion on the best model for a task, retrying transient failures.
+
+    The task's models are ranked by choose_models(). If a model fails with a
+    connection error or retryable status, or its circuit is open, the next
+    model is tried straight away. Only the last model is retried: rate limits
+    (429), server errors (5xx) and connection failures are retried with
+    backoff and jitter, up to OPENROUTER_MAX_RETRIES times. With stream=True,
+    only opening the stream is retried. Attempts, backoff and fallbacks
+    together must fit in OPENROUTER_TOTAL_TIMEOUT: each attempt's timeout is
+    cut short to fit, and no retry or fallback starts once it has passed.
+
+    Each attempt holds a slot in the upstream gate while it is in flight, and
+    a stream holds its slot until it has been read or dropped. If the gate
+    is full, UpstreamBusyError is raised without calling OpenRouter.
+
+    Every attempt goes through its model's circuit breaker. While it is open,
+    no request is sent to that model, so when every model's circuit is open
+    CircuitOpenError is raised at once and callers can return a degraded
+    response instead of waiting on a timeout.
+
+    Args:
+        task (str): The kind of call, one of model_router.TASKS, which picks the models
+        **kwargs: Arguments for client.chat.completions.create(), other than model
+
+    Returns:
+        ChatCompletion or Stream: The completion, or a stream of chunks
+
+    Raises:
+        CircuitOpenError: If every model's circuit is open
+        UpstreamBusyError: If the upstream gate has no slot free
+    """
+    models = choose_models(task)
+    deadline = _call_deadline()
+    for index, model in enumerate(models):
+        fallbacks = models[index + 1:]
+        try:
+            return _create_with_retries(task, model, 0 if fallbacks else None, deadline, kwargs)
+        except Exception as e:
+            if not _should_fall_back(e, task, model, fallbacks, deadline):
+                raise
+
+
+def _create_with_retries(task, model, max_retries, deadline, kwargs):
+    """Call one model, retrying transient failures up to max_retries (or OPENROUTER_MAX_RETRIES) times before the deadline."""
+    from openai import APIStatusError, APIConnectionError
+    
+    client = get_client()
+    circuit = _get_circuit(model)
+    if max_retries is None:
+        max_retries = current_app.config.get('OPENROUTER_MAX_RETRIES', 2)
+
+    attempt = 0
+    while True:
+        release_slot = acquire_upstream_slot()
+        if circuit is not None:
+            try:
+                circuit.before_call()
+            except CircuitOpenError:
+                release_slot()
+                raise
+        started = time.monotonic()
+        failed = False
+        status = 'aborted'  # e.g. an unexpected local error
+        try:
+            completion = client.chat.completions.create(model=model, timeout=_attempt_timeout(deadline), **kwargs)
+            if kwargs.get('stream'):
+                completion = _SlotHoldingStream(completion, release_slot)
+            else:
+                _record_usage(task, model, completion)
+            status = 200
+            return completion
+        except (APIStatusError, APIConnectionError) as e:
+            status = _attempt_status(e)
+            failed = _is_upstream_failure(e)
+            retry = _retry_after_failure(e, attempt, max_retries, deadline)
+            if retry is None:
+                raise
+            delay, reason = retry
+        finally:
+            if status != 200 or not kwargs.get('stream'):
+                release_slot()
+            _record_attempt(task, model, circuit, started, failed, status)
+
+        attempt += 1
+        logger.warning(f"OpenRouter request to {model} failed ({reason}), retrying in {delay:.2f}s (attempt {attempt}/{max_retries})")
+        time.sleep(delay)
+
+
+async def acreate_chat_completion(task, **kwargs):
+    """
+    Async version of create_chat_completion, with the same routing and retry behaviour.
+
+    Waiting for OpenRouter, including between retries, doesn't block a thread.
+
+    Args:
+        task (str): The kind of call, one of model_router.TASKS, which picks the models
+        **kwargs: Arguments for client.chat.completions.create(), other than model
+
+    Returns:
+        ChatCompletion or AsyncStream: The completion, or a stream of chunks
+
+    Raises:
+        CircuitOpenError: If every model's circuit is open
+        UpstreamBusyError: If the upstream gate has no slot free
+    """
+    models = choose_models(task)
+    deadline = _call_deadline()
+    for index, model in enumerate(models):
+        fallbacks = models[index + 1:]
+        try:
+            return await _acreate_with_retries(task, model, 0 if fallbacks else None, deadline, kwargs)
+        except Exception as e:
+            if not _should_fall_back(e, task, model, fallbacks, deadline):
+                raise
+
+
+async def _acreate_with_retries(task, model, max_retries, deadline, kwargs):
+    """Async version of _create_with_retries."""
+    from openai import APIStatusError, APIConnectionError
+    
+    client = get_async_client()
+    circuit = _get_circuit(model)
+    if max_retries is None:
+        max_retries = current_app.config.get('OPENROUTER_MAX_RETRIES', 2)
+
+    attempt = 0
+    while True:
+        release_slot = await aacquire_upstream_slot()
+        if circuit is not None:
+            try:
+                circuit.before_call()
+            except CircuitOpenError:
+                release_slot()
+                raise
+        started = time.monotonic()
+        failed = False
+        status = 'aborted'  # e.g. an unexpected local error
+        try:
+            completion = await client.chat.completions.create(model=model, timeout=_attempt_timeout(deadline), **kwargs)
+            if kwargs.get('stream'):
+                completion = _SlotHoldingStream(completion, release_slot)
+            else:
+                _record_usage(task, model, completion)
+            status = 200
+            return completion
+        except asyncio.CancelledError:
+            # Cancelled by a branch timeout: the model didn't answer in time, which is a failure
+            status = 'cancelled'
+            failed = True
+            raise
+        except (APIStatusError, APIConnectionError) as e:
+            status = _attempt_status(e)
+            failed = _is_upstream_failure(e)
+            retry = _retry_after_failure(e, attempt, max_retries, deadline)
+            if retry is None:
+                raise
+            delay, reason = retry
+        finally:
+            if status != 200 or not kwargs.get('stream'):
+                release_slot()
+            _record_attempt(task, model, circuit, started, failed, status)
+
+        attempt += 1
+        logger.warning(f"OpenRouter request to {model} failed ({reason}), retrying in {delay:.2f}s (attempt {attempt}/{max_retries})")
+        await asyncio.sleep(delay)
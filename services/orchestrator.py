@@ -0,0 +1,198 @@
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Process-wide worker pool shared by every request
+_executor = None
+_executor_lock = threading.Lock()
+
+# Process-wide event loop for async branches, run by one background thread
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared thread pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = current_app.config.get('ORCHESTRATOR_MAX_WORKERS', 16)
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='orchestrator'
+                )
+    return _executor
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run a function on the shared thread pool inside the current Flask app context.
+
+    The function also sees the caller's context variables, such as the
+    request's timing spans.
+
+    Args:
+        func (callable): The function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        concurrent.futures.Future: A future for the function's result
+    """
+    app = current_app._get_current_object()
+    context = contextvars.copy_context()
+
+    def run_in_app_context():
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    return _get_executor().submit(context.run, run_in_app_context)
+
+
+def submit_background(func, *args, **kwargs):
+    """
+    Run a function on the shared thread pool without waiting for it, e.g. a cache refill.
+
+    Unlike submit(), the function doesn't see the caller's context variables,
+    so work that outlives a request isn't counted in that request's timings.
+
+    Args:
+        func (callable): The function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        concurrent.futures.Future: A future for the function's result
+    """
+    app = current_app._get_current_object()
+
+    def run_in_app_context():
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    return _get_executor().submit(contextvars.Context().run, run_in_app_context)
+
+
+def _get_loop():
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='orchestrator-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def submit_async(func, *args, **kwargs):
+    """
+    Run a coroutine function on the shared event loop inside the current Flask app context.
+
+    Coroutines waiting on upstream I/O don't hold a thread, so any number of
+    them can be in flight at once. Like submit(), the coroutine sees the
+    caller's context variables.
+
+    Args:
+        func (callable): The coroutine function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        concurrent.futures.Future: A future for the coroutine's result
+    """
+    app = current_app._get_current_object()
+    context = contextvars.copy_context()
+
+    async def run_in_app_context():
+        # The task runs in a copy of the loop thread's context, so carry the caller's values over
+        for var, value in context.items():
+            var.set(value)
+        with app.app_context():
+            return await func(*args, **kwargs)
+
+    return asyncio.run_coroutine_threadsafe(run_in_app_context(), _get_loop())
+
+
+def start_branches(branches):
+    """
+    Start independent branches concurrently on the shared thread pool or event loop.
+
+    Args:
+        branches (dict): Maps a branch name to a dict with the keys:
+            "func" (callable): The function to run. Coroutine functions run on the
+                shared event loop, other functions on the shared thread pool
+            "args" (tuple, optional): Positional arguments for the function
+            "kwargs" (dict, optional): Keyword arguments for the function
+            "timeout" (float, optional): Seconds to wait for the result, or None to wait forever
+            "fallback" (optional): Value used if the branch times out or raises
+
+    Returns:
+        dict: Running branches, to be passed to collect_branches()
+    """
+    started_at = time.monotonic()
+    running = {}
+    for name, branch in branches.items():
+        timeout = branch.get('timeout')
+        func = branch['func']
+        run = submit_async if inspect.iscoroutinefunction(func) else submit
+        running[name] = {
+            'future': run(func, *branch.get('args', ()), **branch.get('kwargs', {})),
+            'deadline': started_at + timeout if timeout is not None else None,
+            'fallback': branch.get('fallback')
+        }
+    return running
+
+
+def collect_branches(running):
+    """
+    Wait for branches started with start_branches() and gather their results.
+
+    Each branch is bounded by its own deadline, measured from when it was started,
+    so a slow branch only ever costs its own timeout.
+
+    Args:
+        running (dict): The value returned by start_branches()
+
+    Returns:
+        dict: Maps each branch name to its result, or to its fallback on timeout or error
+    """
+    results = {}
+    for name, branch in running.items():
+        future = branch['future']
+        remaining = None
+        if branch['deadline'] is not None:
+            remaining = max(0.0, branch['deadline'] - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning(f"Branch '{name}' timed out, using fallback")
+            results[name] = branch['fallback']
+        except Exception as e:
+            logger.error(f"Branch '{name}' failed: {str(e)}")
+            results[name] = branch['fallback']
+    return results
+
+
+def is_branch_ready(running, name):
+    """
+    Check whether a branch started with start_branches() has finished.
+
+    Args:
+        running (dict): The value returned by start_branches()
+        name (str): The branch name
+
+    Returns:
+        bool: True if collecting the branch would not block
+    """
+    return running[name]['future'].done()
+
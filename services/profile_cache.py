@@ -0,0 +1,118 @@
+import threading
+from collections import namedtuple
+from flask import current_app
+from extensions import db
+from models import User, Conversation
+from services.ttl_cache import TTLCache
+
+# Read-only snapshots of the fields requests need, safe to share across threads and sessions
+UserProfile = namedtuple('UserProfile', ['id', 'native_language', 'target_language', 'proficiency_level'])
+ConversationInfo = namedtuple('ConversationInfo', ['id', 'user_id', 'scenario', 'summary', 'summary_through_id'])
+
+# In-process caches, created on first use
+_user_cache = None
+_conversation_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_caches():
+    """Return the user and conversation caches, creating them on first use."""
+    global _user_cache, _conversation_cache
+    if _user_cache is None:
+        with _cache_lock:
+            if _user_cache is None:
+                max_size = current_app.config.get('PROFILE_CACHE_SIZE', 10000)
+                ttl = current_app.config.get('PROFILE_CACHE_TTL', 300)
+                _conversation_cache = TTLCache(max_size=max_size, ttl=ttl)
+                _user_cache = TTLCache(max_size=max_size, ttl=ttl)
+    return _user_cache, _conversation_cache
+
+
+def cache_user(user):
+    """
+    Store a user's profile in the cache, e.g. right after creating the user.
+
+    Returns:
+        UserProfile: The cached profile
+    """
+    profile = UserProfile(user.id, user.native_language, user.target_language, user.proficiency_level)
+    _get_caches()[0].set(user.id, profile)
+    return profile
+
+
+def cache_conversation(conversation):
+    """
+    Store a conversation's metadata in the cache, e.g. right after creating it.
+
+    Returns:
+        ConversationInfo: The cached metadata
+    """
+    info = ConversationInfo(
+        conversation.id,
+        conversation.user_id,
+        conversation.scenario,
+        conversation.summary,
+        conversation.summary_through_id
+    )
+    _get_caches()[1].set(conversation.id, info)
+    return info
+
+
+def get_user_profile(user_id):
+    """
+    Get a user's language preferences, querying the database only on a cache miss.
+
+    Args:
+        user_id (int): The user's ID
+
+    Returns:
+        UserProfile: The user's profile, or None if the user doesn't exist
+    """
+    profile = _get_caches()[0].get(user_id)
+    if profile is not None:
+        return profile
+
+    user = db.session.get(User, user_id)
+    return cache_user(user) if user is not None else None
+
+
+def get_conversation_info(conversation_id):
+    """
+    Get a conversation's scenario and rolling summary, querying the database only on a cache miss.
+
+    Args:
+        conversation_id (int): The conversation's ID
+
+    Returns:
+        ConversationInfo: The conversation's metadata, or None if it doesn't exist
+    """
+    info = _get_caches()[1].get(conversation_id)
+    if info is not None:
+        return info
+
+    conversation = db.session.get(Conversation, conversation_id)
+    return cache_conversation(conversation) if conversation is not None else None
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached profile, so the next lookup reads the database."""
+    _get_caches()[0].delete(user_id)
+
+
+def invalidate_conversation(conversation_id):
+    """Drop a conversation's cached metadata, so the next lookup reads the database."""
+    _get_caches()[1].delete(conversation_id)
+
+
+def get_profile_cache_stats():
+    """
+    Get the profile cache counters.
+
+    Returns:
+        dict: Counters for the "users" and "conversations" caches
+    """
+    user_cache, conversation_cache = _get_caches()
+    return {
+        'users': user_cache.stats(),
+        'conversations': conversation_cache.stats()
+    }
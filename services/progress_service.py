@@ -0,0 +1,148 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from models import ConversationErrorCount, DailyErrorCount, LanguageError
+from services.job_queue import job_handler
+
+
+def _increment(model, keys, amount):
+    """
+    Add to the count of an aggregate row, creating the row if it doesn't exist.
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL,
+    so concurrent requests can't lose updates.
+    """
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(model).values(**keys, count=amount)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={'count': model.count + statement.excluded.count}
+        )
+        db.session.execute(statement)
+        return
+
+    # Other databases: update first, insert if nothing was there yet
+    conditions = [getattr(model, column) == value for column, value in keys.items()]
+    result = db.session.execute(update(model).where(*conditions).values(count=model.count + amount))
+    if result.rowcount == 0:
+        db.session.add(model(**keys, count=amount))
+
+
+def record_error_counts(user_id, conversation_id, error_types, day):
+    """
+    Add newly saved errors to the aggregate count tables.
+
+    Runs in the caller's transaction, so the counts commit together with the errors.
+
+    Args:
+        user_id (int): The user who made the errors
+        conversation_id (int): The conversation the errors belong to
+        error_types (list): The error type of each new error
+        day (date): The day the errors were made
+    """
+    for error_type, amount in Counter(error_types).items():
+        _increment(ConversationErrorCount, {
+            'user_id': user_id,
+            'conversation_id': conversation_id,
+            'error_type': error_type
+        }, amount)
+        _increment(DailyErrorCount, {
+            'user_id': user_id,
+            'error_type': error_type,
+            'day': day
+        }, amount)
+
+
+@job_handler('progress.recount')
+def recount_error_counts(user_id):
+    """
+    Rebuild a user's aggregate counts from their saved errors.
+
+    Repairs counts that drifted from the errors, e.g. after errors were
+    edited or imported outside the app.
+
+    Args:
+        user_id (int): The user whose counts to rebuild
+    """
+    db.session.execute(delete(ConversationErrorCount).where(ConversationErrorCount.user_id == user_id))
+    db.session.execute(delete(DailyErrorCount).where(DailyErrorCount.user_id == user_id))
+
+    db.session.execute(insert(ConversationErrorCount).from_select(
+        ['user_id', 'conversation_id', 'error_type', 'count'],
+        select(
+            LanguageError.user_id,
+            LanguageError.conversation_id,
+            LanguageError.error_type,
+            func.count(LanguageError.id)
+        ).where(LanguageError.user_id == user_id)
+        .group_by(LanguageError.user_id, LanguageError.conversation_id, LanguageError.error_type)
+    ))
+
+    day = func.date(LanguageError.timestamp)
+    db.session.execute(insert(DailyErrorCount).from_select(
+        ['user_id', 'error_type', 'day', 'count'],
+        select(
+            LanguageError.user_id,
+            LanguageError.error_type,
+            day,
+            func.count(LanguageError.id)
+        ).where(LanguageError.user_id == user_id)
+        .group_by(LanguageError.user_id, LanguageError.error_type, day)
+    ))
+
+
+def get_conversation_error_counts(user_id, conversation_id):
+    """
+    Get a user's error counts for one conversation.
+
+    Returns:
+        dict: Maps each error type to its count
+    """
+    rows = db.session.execute(
+        select(ConversationErrorCount.error_type, ConversationErrorCount.count)
+        .where(
+            ConversationErrorCount.user_id == user_id,
+            ConversationErrorCount.conversation_id == conversation_id
+        )
+    ).all()
+    return {error_type: count for error_type, count in rows}
+
+
+def get_progress(user_id, days=30):
+    """
+    Get a user's error counts across all conversations.
+
+    Args:
+        user_id (int): The user to report on
+        days (int): How many days of daily counts to include, ending today
+
+    Returns:
+        dict: "totals" maps each error type to its all-time count, and "daily"
+              lists {"day", "error_type", "count"} for the requested window
+    """
+    totals = db.session.execute(
+        select(DailyErrorCount.error_type, func.sum(DailyErrorCount.count))
+        .where(DailyErrorCount.user_id == user_id)
+        .group_by(DailyErrorCount.error_type)
+    ).all()
+
+    # Days are in UTC, like message timestamps
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = db.session.execute(
+        select(DailyErrorCount.day, DailyErrorCount.error_type, DailyErrorCount.count)
+        .where(DailyErrorCount.user_id == user_id, DailyErrorCount.day >= since)
+        .order_by(DailyErrorCount.day)
+    ).all()
+
+    return {
+        'totals': {error_type: int(count) for error_type, count in totals},
+        'daily': [
+            {'day': day.isoformat(), 'error_type': error_type, 'count': count}
+            for day, error_type, count in daily
+        ]
+    }
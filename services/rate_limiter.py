@@ -0,0 +1,346 @@
+import math
+import time
+import asyncio
+import logging
+import threading
+import functools
+from collections import OrderedDict, deque
+from flask import current_app, request, session, jsonify
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamBusyError(Exception):
+    """Raised instead of calling OpenRouter or gTTS when the upstream gate has no slot to give."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many upstream calls in flight, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets, one per key, refilled continuously at a fixed rate."""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        """
+        Args:
+            rate (float): Tokens added to each bucket per second
+            burst (float): Bucket capacity, i.e. the largest burst allowed after idling
+            max_keys (int): Buckets kept before the least recently used is dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        """
+        Take tokens from a key's bucket if it has enough.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        now = time.monotonic()
+        with self._lock:
+            available, updated_at = self._buckets.get(key, (self.burst, now))
+            available = min(self.burst, available + (now - updated_at) * self.rate)
+
+            if available >= tokens:
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = (tokens - available) / self.rate
+
+            self._buckets[key] = (available, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+class ConcurrencyGate:
+    """
+    Cap how much work runs at once, with a bounded queue of waiters.
+
+    Threads and coroutines share the same slots. A coroutine waits for a slot
+    without blocking its event loop: a released slot is handed straight to
+    the oldest waiting coroutine, or else to a waiting thread.
+    """
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        """
+        Args:
+            max_concurrent (int): Holders allowed at once
+            max_queue (int): Callers allowed to wait for a slot; more are turned away at once
+            queue_timeout (float): Seconds a caller waits for a slot before giving up
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._async_waiters = deque()  # (loop, future)
+        self.rejected = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue if all slots are busy.
+
+        Returns:
+            bool: True if a slot was taken, False if the queue was full or the wait timed out
+        """
+        with self._condition:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return True
+
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+
+            self._waiting += 1
+            try:
+                acquired = self._condition.wait_for(
+                    lambda: self._active < self.max_concurrent,
+                    timeout=self.queue_timeout
+                )
+            finally:
+                self._waiting -= 1
+
+            if not acquired:
+                self.timeouts += 1
+                return False
+
+            self._active += 1
+            return True
+
+    async def aacquire(self):
+        """Async version of acquire(), which waits without blocking the event loop."""
+        with self._condition:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return True
+
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+
+            self._waiting += 1
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+
+        try:
+            # A slot handed over by release() is already counted as active
+            return await asyncio.wait_for(waiter[1], timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._condition:
+                self.timeouts += 1
+            return False
+        except asyncio.CancelledError:
+            # Cancelled just after release() handed the slot over: give it back
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+        finally:
+            with self._condition:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+                    self._waiting -= 1
+
+    def release(self):
+        """Give a slot back, handing it to the next waiting coroutine or waking the next waiting thread."""
+        with self._condition:
+            if self._async_waiters:
+                loop, future = self._async_waiters.popleft()
+                self._waiting -= 1
+                loop.call_soon_threadsafe(self._hand_over, future)
+                return
+            self._active -= 1
+            self._condition.notify()
+
+    def _hand_over(self, future):
+        """Give a released slot to a waiting coroutine, or back to the gate if it stopped waiting."""
+        if future.done():
+            self.release()
+        else:
+            future.set_result(True)
+
+    def stats(self):
+        """
+        Get the gate's state and counters.
+
+        Returns:
+            dict: Active holders, queued waiters, and callers turned away or timed out
+        """
+        with self._condition:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+
+# Process-wide limiters and gate, created on first use
+_session_limiter = None
+_ip_limiter = None
+_upstream_gate = None
+_init_lock = threading.Lock()
+
+
+def _get_limiters():
+    """Return the per-session and per-IP limiters, creating them on first use."""
+    global _session_limiter, _ip_limiter
+    if _ip_limiter is None:
+        with _init_lock:
+            if _ip_limiter is None:
+                config = current_app.config
+                _session_limiter = TokenBucketLimiter(
+                    rate=config.get('RATE_LIMIT_SESSION_RATE', 0.5),
+                    burst=config.get('RATE_LIMIT_SESSION_BURST', 10)
+                )
+                _ip_limiter = TokenBucketLimiter(
+                    rate=config.get('RATE_LIMIT_IP_RATE', 2.0),
+                    burst=config.get('RATE_LIMIT_IP_BURST', 40)
+                )
+    return _session_limiter, _ip_limiter
+
+
+def _get_upstream_gate():
+    """Return the upstream gate, creating it on first use, or None if UPSTREAM_GATE_ENABLED is off."""
+    global _upstream_gate
+    if not current_app.config.get('UPSTREAM_GATE_ENABLED', True):
+        return None
+    if _upstream_gate is None:
+        with _init_lock:
+            if _upstream_gate is None:
+                config = current_app.config
+                _upstream_gate = ConcurrencyGate(
+                    max_concurrent=config.get('UPSTREAM_MAX_CONCURRENT', 32),
+                    max_queue=config.get('UPSTREAM_MAX_QUEUE', 64),
+                    queue_timeout=config.get('UPSTREAM_QUEUE_TIMEOUT', 10.0)
+                )
+    return _upstream_gate
+
+
+def _slot_releaser(gate):
+    """Build a function that gives a gate slot back the first time it is called."""
+    if gate is None:
+        return lambda: None
+
+    released = threading.Lock()
+
+    def release():
+        if released.acquire(blocking=False):
+            gate.release()
+
+    return release
+
+
+def _busy(path):
+    logger.warning(f"Upstream queue full, rejecting a call from {path}")
+    return UpstreamBusyError(current_app.config.get('UPSTREAM_RETRY_AFTER', 2.0))
+
+
+def acquire_upstream_slot():
+    """
+    Take a slot in the process-wide upstream gate, for one call to OpenRouter or gTTS.
+
+    Every upstream call takes a slot, whether it comes from a request, a
+    background job or a worker thread, and holds it only while the call is
+    in flight. Cache hits never take one.
+
+    Returns:
+        callable: Gives the slot back; calling it again does nothing
+
+    Raises:
+        UpstreamBusyError: If the gate's queue is full or the wait timed out
+    """
+    gate = _get_upstream_gate()
+    if gate is not None and not gate.acquire():
+        raise _busy(request.path if request else 'a background task')
+    return _slot_releaser(gate)
+
+
+async def aacquire_upstream_slot():
+    """Async version of acquire_upstream_slot(), which waits without blocking the event loop."""
+    gate = _get_upstream_gate()
+    if gate is not None and not await gate.aacquire():
+        raise _busy(request.path if request else 'a background task')
+    return _slot_releaser(gate)
+
+
+def _too_many_requests(message, retry_after):
+    """Build a 429 response telling the client when to retry."""
+    response = jsonify({'error': message, 'retry_after': math.ceil(retry_after)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def check_rate_limit():
+    """
+    Take a token from the current request's session bucket and client IP bucket.
+
+    For views that only call upstream some of the time, e.g. on a cache miss.
+
+    Returns:
+        Response: A 429 response if either bucket is empty, otherwise None
+    """
+    if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+
+    session_limiter, ip_limiter = _get_limiters()
+
+    session_id = session.get('session_id')
+    wait = max(
+        session_limiter.consume(session_id) if session_id else 0.0,
+        ip_limiter.consume(request.remote_addr)
+    )
+    if wait > 0:
+        logger.info(f"Rate limited {request.path} for session {session_id} from {request.remote_addr}")
+        return _too_many_requests('Too many requests, please slow down', wait)
+    return None
+
+
+def rate_limited(view):
+    """
+    Limit a view that calls OpenRouter or gTTS.
+
+    Each request takes a token from its session's bucket and its client IP's
+    bucket. Over-limit requests get a 429 with Retry-After instead of
+    queueing behind everyone else. How many upstream calls run at once is
+    capped separately, around the calls themselves, by the upstream gate.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        limited = check_rate_limit()
+        if limited is not None:
+            return limited
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_rate_limiting(app):
+    """Answer requests whose upstream call was turned away by the gate with a 429."""
+    @app.errorhandler(UpstreamBusyError)
+    def upstream_busy(error):
+        return _too_many_requests('The server is busy, please try again shortly', error.retry_after)
+
+
+def get_rate_limit_stats():
+    """
+    Get the upstream gate's state and counters.
+
+    Returns:
+        dict: The gate's stats, or None if no upstream call has been made yet
+    """
+    return _upstream_gate.stats() if _upstream_gate is not None else None
@@ -1,14 +1,154 @@
+import asyncio
+import hashlib
 import logging
-import json
+import threading
+import unicodedata
 from flask import current_app
-import requests
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db
+from models import TranslationCache, Message
+from services.openrouter_client import create_chat_completion, acreate_chat_completion
+from services.circuit_breaker import CircuitOpenError
+from services.rate_limiter import UpstreamBusyError
+from services.metrics import traced, annotate
+from services.job_queue import job_handler
+from services.model_router import get_primary_model
+from services.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# In-process tier of the translation cache, created on first use
+_memory_cache = None
+_memory_cache_lock = threading.Lock()
+
+# Counters for the persistent tier; the in-process tier keeps its own
+_db_stats = {'hits': 0, 'misses': 0, 'writes': 0}
+_db_stats_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Normalize text for cache lookups: Unicode NFC and collapsed whitespace."""
+    return unicodedata.normalize('NFC', ' '.join(text.split()))
+
+
+def translation_cache_key(text, source_language, target_language, model):
+    """
+    Build the cache key for a translation.
+    
+    Returns:
+        str: A SHA-256 hex digest of the normalized text, language pair and model
+    """
+    parts = [normalize_text(text), source_language, target_language, model]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def is_cacheable_translation(translation):
+    """Check that a translation is a real result rather than an error or mock string."""
+    return bool(translation) and not translation.startswith('[Translation')
+
+
+def _get_memory_cache():
+    """Return the in-process translation cache, creating it on first use."""
+    global _memory_cache
+    if _memory_cache is None:
+        with _memory_cache_lock:
+            if _memory_cache is None:
+                _memory_cache = TTLCache(
+                    max_size=current_app.config.get('TRANSLATION_CACHE_SIZE', 2048),
+                    ttl=current_app.config.get('TRANSLATION_CACHE_TTL', 86400)
+                )
+    return _memory_cache
+
+
+def _load_persisted_translation(cache_key):
+    """Look up a translation in the database tier, or return None."""
+    try:
+        # A separate session keeps cache reads out of the caller's transaction
+        with Session(db.engine) as cache_session:
+            entry = cache_session.execute(
+                select(TranslationCache.translated_text).where(TranslationCache.cache_key == cache_key)
+            ).scalar_one_or_none()
+    except Exception as e:
+        logger.warning(f"Translation cache read failed: {str(e)}")
+        return None
+    
+    with _db_stats_lock:
+        _db_stats['hits' if entry is not None else 'misses'] += 1
+    return entry
+
+
+def _persist_translation(cache_key, text, source_language, target_language, model, translation):
+    """Store a translation in the database tier, ignoring duplicate writes."""
+    try:
+        with Session(db.engine) as cache_session:
+            cache_session.add(TranslationCache(
+                cache_key=cache_key,
+                source_language=source_language,
+                target_language=target_language,
+                model=model,
+                source_text=normalize_text(text),
+                translated_text=translation
+            ))
+            cache_session.commit()
+        with _db_stats_lock:
+            _db_stats['writes'] += 1
+    except IntegrityError:
+        # Another request stored the same translation first
+        pass
+    except Exception as e:
+        logger.warning(f"Translation cache write failed: {str(e)}")
+
+
+def _copy_db_stats():
+    with _db_stats_lock:
+        return dict(_db_stats)
+
+
+def get_translation_cache_stats():
+    """
+    Get hit, miss and eviction counters for both cache tiers.
+    
+    Returns:
+        dict: Counters for the "memory" and "database" tiers
+    """
+    return {
+        'memory': _get_memory_cache().stats(),
+        'database': _copy_db_stats()
+    }
+
+
+def _translation_settings(text, source_language, target_language):
+    """
+    Work out how a translation is served before any lookup.
+    
+    Returns:
+        tuple: (mock_translation, model, cache_key), where mock_translation is
+               set instead of the others when no API key is configured
+    """
+    # Use OpenRouter API key for translation
+    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    
+    if not api_key:
+        logger.warning("OpenRouter API key not found, using mock translation")
+        return f"[Translation to {target_language}]: {text}", None, None
+    
+    # Key the cache on the primary translation model, whichever model ends up serving the call
+    model = get_primary_model('translation')
+    
+    return None, model, translation_cache_key(text, source_language, target_language, model)
+
+
+@traced('translation')
 def translate_text(text, source_language, target_language):
     """
     Translate text from source language to target language using OpenRouter API with Google Gemini model.
     
+    Translations are cached in process and in the database, keyed by the
+    normalized text, the language pair and the model. Error results are
+    never cached.
+    
     Args:
         text (str): The text to translate
         source_language (str): The language of the original text
@@ -17,72 +157,184 @@ def translate_text(text, source_language, target_language):
     Returns:
         str: The translated text
     """
-    # Use OpenRouter API key for translation
-    api_key = current_app.config.get('OPENROUTER_API_KEY')
+    mock_translation, model, cache_key = _translation_settings(text, source_language, target_language)
+    if mock_translation is not None:
+        return mock_translation
     
-    if not api_key:
-        logger.warning("OpenRouter API key not found, using mock translation")
-        return f"[Translation to {target_language}]: {text}"
+    memory_cache = _get_memory_cache()
     
-    try:
-        # Create a translation prompt
-        translation_prompt = f"""Translate the following text from {source_language} to {target_language}:
+    translation = memory_cache.get(cache_key)
+    if translation is not None:
+        annotate(cache='memory')
+        return translation
+    
+    persist = current_app.config.get('TRANSLATION_CACHE_PERSIST', True)
+    if persist:
+        translation = _load_persisted_translation(cache_key)
+        if translation is not None:
+            memory_cache.set(cache_key, translation)
+            annotate(cache='database')
+            return translation
+    
+    annotate(cache='miss')
+    translation = _translate_upstream(text, source_language, target_language)
+    
+    if is_cacheable_translation(translation):
+        memory_cache.set(cache_key, translation)
+        if persist:
+            _persist_translation(cache_key, text, source_language, target_language, model, translation)
+    
+    return translation
+
+
+@job_handler('translation.backfill')
+def backfill_translation(message_id, source_language, target_language):
+    """
+    Retry the translation of a message whose translation failed when it was sent.
+    
+    Raises while the translation still fails, so the job is retried later.
+    
+    Args:
+        message_id (int): The message to translate
+        source_language (str): The language of the message
+        target_language (str): The language to translate to
+    """
+    message = db.session.get(Message, message_id)
+    if message is None or is_cacheable_translation(message.translated_content):
+        return
+    
+    translation = translate_text(message.content, source_language, target_language)
+    if not is_cacheable_translation(translation):
+        raise RuntimeError(f"Translation of message {message_id} still failing: {translation}")
+    
+    message.translated_content = translation
+
+
+@traced('translation')
+async def atranslate_text(text, source_language, target_language):
+    """
+    Async version of translate_text, sharing its cache.
+    
+    Database cache reads and writes run in a worker thread, so they never
+    block the event loop.
+    
+    Args:
+        text (str): The text to translate
+        source_language (str): The language of the original text
+        target_language (str): The language to translate to
+        
+    Returns:
+        str: The translated text
+    """
+    mock_translation, model, cache_key = _translation_settings(text, source_language, target_language)
+    if mock_translation is not None:
+        return mock_translation
+    
+    memory_cache = _get_memory_cache()
+    
+    translation = memory_cache.get(cache_key)
+    if translation is not None:
+        annotate(cache='memory')
+        return translation
+    
+    persist = current_app.config.get('TRANSLATION_CACHE_PERSIST', True)
+    if persist:
+        translation = await asyncio.to_thread(_load_persisted_translation, cache_key)
+        if translation is not None:
+            memory_cache.set(cache_key, translation)
+            annotate(cache='database')
+            return translation
+    
+    annotate(cache='miss')
+    translation = await _atranslate_upstream(text, source_language, target_language)
+    
+    if is_cacheable_translation(translation):
+        memory_cache.set(cache_key, translation)
+        if persist:
+            await asyncio.to_thread(_persist_translation, cache_key, text, source_language, target_language, model, translation)
+    
+    return translation
+
+
+def _translation_messages(text, source_language, target_language):
+    """Build the chat messages for a translation request."""
+    # Create a translation prompt
+    translation_prompt = f"""Translate the following text from {source_language} to {target_language}:
 
 Text to translate: "{text}"
 
 Translation:"""
-        
-        # Get the model from the config or use the default one
-        model = current_app.config.get('OPENROUTER_MODEL', 'google/gemini-2.5-pro-exp-03-25:free')
-        
-        # Prepare the request data
-        request_data = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": f"You are a professional translator. Translate the given text from {source_language} to {target_language} accurately. Respond with only the translated text, no commentary."},
-                {"role": "user", "content": translation_prompt}
-            ]
-        }
-        
-        # Make the API request directly with requests
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-                "HTTP-Referer": "https://linguabot.replit.app",
-                "X-Title": "LinguaBot Language Learning Assistant"
-            },
-            json=request_data
-        )
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Parse the response JSON
-            response_data = response.json()
+    
+    return [
+        {"role": "system", "content": f"You are a professional translator. Translate the given text from {source_language} to {target_language} accurately. Respond with only the translated text, no commentary."},
+        {"role": "user", "content": translation_prompt}
+    ]
+
+
+def _parse_translation(completion):
+    """Extract the translated text from a completion, or a "[Translation error: ...]" string."""
+    # Formatted only if the record survives the level check and debug sampling
+    logger.debug("OpenRouter translation response: %r", completion)
+    
+    # Extract the translation
+    if completion.choices:
+        if completion.choices[0].message and completion.choices[0].message.content:
+            translation = completion.choices[0].message.content.strip()
             
-            # Log the complete response for debugging
-            logger.debug(f"OpenRouter translation response: {json.dumps(response_data, indent=2)}")
+            # Clean up quotation marks if the model included them
+            translation = translation.strip('"')
             
-            # Extract the translation
-            if 'choices' in response_data and len(response_data['choices']) > 0:
-                if 'message' in response_data['choices'][0] and 'content' in response_data['choices'][0]['message']:
-                    translation = response_data['choices'][0]['message']['content'].strip()
-                    
-                    # Clean up quotation marks if the model included them
-                    translation = translation.strip('"')
-                    
-                    return translation
-                else:
-                    logger.error(f"Missing message content in response: {response_data}")
-                    return f"[Translation error: Unexpected response format]"
-            else:
-                logger.error(f"Missing choices in response: {response_data}")
-                return f"[Translation error: No translation provided]"
+            return translation
         else:
-            logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-            return f"[Translation error: API status {response.status_code}]"
+            logger.error(f"Missing message content in response: {completion}")
+            return f"[Translation error: Unexpected response format]"
+    else:
+        logger.error(f"Missing choices in response: {completion}")
+        return f"[Translation error: No translation provided]"
+
+
+def _translation_error(error):
+    """Log a failed translation request and build its "[Translation error: ...]" string."""
+    from openai import APIStatusError
+    
+    if isinstance(error, (CircuitOpenError, UpstreamBusyError)):
+        logger.warning(f"Skipping translation: {str(error)}")
+        return "[Translation unavailable: service temporarily degraded]"
+    
+    if isinstance(error, APIStatusError):
+        logger.error(f"OpenRouter API error: {error.status_code} - {error.message}")
+        return f"[Translation error: API status {error.status_code}]"
+    
+    logger.error(f"Error in translation service: {str(error)}")
+    return f"[Translation error: {str(error)}]"
+
+
+def _translate_upstream(text, source_language, target_language):
+    """
+    Translate text with the fastest healthy translation model, without consulting the cache.
+    
+    Returns:
+        str: The translated text, or a "[Translation error: ...]" string on failure
+    """
+    try:
+        completion = create_chat_completion(
+            task='translation',
+            messages=_translation_messages(text, source_language, target_language)
+        )
+        return _parse_translation(completion)
+        
+    except Exception as e:
+        return _translation_error(e)
+
+
+async def _atranslate_upstream(text, source_language, target_language):
+    """Async version of _translate_upstream."""
+    try:
+        completion = await acreate_chat_completion(
+            task='translation',
+            messages=_translation_messages(text, source_language, target_language)
+        )
+        return _parse_translation(completion)
         
     except Exception as e:
-        logger.error(f"Error in translation service: {str(e)}")
-        return f"[Translation error: {str(e)}]"
+        return _translation_error(e)
@@ -1,64 +1,505 @@
+import io
 import os
+import re
+import uuid
 import base64
+import shutil
+import hashlib
 import tempfile
-from gtts import gTTS
+import threading
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import current_app
 import logging
+from extensions import db
+from models import Message
+from services.metrics import traced, annotate
+from services.job_queue import job_handler
+from services.rate_limiter import acquire_upstream_slot
 
 logger = logging.getLogger(__name__)
 
+# Map language names to gTTS language codes
+LANGUAGE_CODES = {
+    "English": "en",
+    "Spanish": "es",
+    "French": "fr",
+    "German": "de",
+    "Italian": "it",
+    "Portuguese": "pt",
+    "Chinese": "zh-CN",
+    "Japanese": "ja",
+    "Korean": "ko",
+    "Russian": "ru",
+    "Arabic": "ar",
+    "Hindi": "hi",
+    "Dutch": "nl",
+    "Swedish": "sv",
+    "Polish": "pl",
+    "Turkish": "tr"
+}
+
+# Sentence ends: closing punctuation then whitespace, or CJK closing punctuation, which takes no space
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?\u2026])\s+|(?<=[\u3002\uff01\uff1f])\s*')
+
+# Bounded pool that synthesizes sentences in parallel, created on first use
+_synthesis_pool = None
+_synthesis_pool_lock = threading.Lock()
+
+# Futures for the chunks being synthesized, by cache key, so concurrent requests share one synthesis
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Striped locks so concurrent requests for the same audio synthesize it only once
+_synthesis_locks = [threading.Lock() for _ in range(64)]
+_eviction_lock = threading.Lock()
+
+# Running estimate of the cache size in bytes, or None until the directory is first scanned
+_cache_size = None
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_tts_language(language_code):
+    """Get the gTTS language code for a language name, defaulting to English."""
+    return LANGUAGE_CODES.get(language_code, "en")
+
+
+def speech_cache_key(text, language_code):
+    """
+    Build the content address of the audio for a text.
+
+    Returns:
+        str: A SHA-256 hex digest of the gTTS language code and the text
+    """
+    tts_lang = get_tts_language(language_code)
+    return hashlib.sha256(f"{tts_lang}\x1f{text}".encode('utf-8')).hexdigest()
+
+
+def _get_cache_dir():
+    """Return the audio cache directory, creating it if needed."""
+    cache_dir = current_app.config.get('TTS_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'linguabot_tts')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _evict_if_needed(cache_dir, added_bytes):
+    """Delete the least recently used audio files until the cache fits its size limit."""
+    global _cache_size
+    max_bytes = current_app.config.get('TTS_CACHE_MAX_BYTES', 100 * 1024 * 1024)
+
+    with _eviction_lock:
+        # Only scan the directory when the running estimate says the cache may be full
+        if _cache_size is not None:
+            _cache_size += added_bytes
+            if _cache_size <= max_bytes:
+                return
+
+        entries = []
+        total_size = 0
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.mp3'):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+        # Oldest access first
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                _count('evictions')
+            except FileNotFoundError:
+                pass
+
+        _cache_size = total_size
+
+
+def split_sentences(text, min_chars=None):
+    """
+    Split text into sentence chunks for synthesis.
+
+    Fragments shorter than min_chars (TTS_MIN_CHUNK_CHARS by default) are
+    joined to the sentence after them, so short interjections don't each
+    cost a request.
+
+    Args:
+        text (str): The text to split
+        min_chars (int, optional): The shortest chunk worth synthesizing alone
+
+    Returns:
+        list: The chunks in order; a single chunk for a one-sentence text
+    """
+    if min_chars is None:
+        min_chars = current_app.config.get('TTS_MIN_CHUNK_CHARS', 20)
+
+    chunks = []
+    current = ''
+    for sentence in _SENTENCE_BOUNDARY.split(text.strip()):
+        if not sentence:
+            continue
+        # CJK sentences run on without a space
+        separator = '' if not current or current.endswith(('\u3002', '\uff01', '\uff1f')) else ' '
+        current = f"{current}{separator}{sentence}"
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _cached_file(key, cache_dir):
+    """
+    Return the path of a cached audio file and mark it recently used, or None if it isn't cached.
+    """
+    path = os.path.join(cache_dir, f"{key}.mp3")
+    try:
+        # Mark the file as recently used, keeping its modification time
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+        return path
+    except FileNotFoundError:
+        return None
+
+
+def _synthesis_lock(key):
+    return _synthesis_locks[int(key[:8], 16) % len(_synthesis_locks)]
+
+
+def _get_synthesis_pool():
+    """Return the sentence synthesis pool, creating it on first use."""
+    global _synthesis_pool
+    if _synthesis_pool is None:
+        with _synthesis_pool_lock:
+            if _synthesis_pool is None:
+                _synthesis_pool = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('TTS_MAX_WORKERS', 4),
+                    thread_name_prefix='tts'
+                )
+    return _synthesis_pool
+
+
+def _cached_chunk(text, language_code):
+    """
+    Look a chunk up in the disk cache on the calling thread.
+
+    Returns:
+        str: The path of the cached MP3 file, or None if it isn't cached yet
+    """
+    path = _cached_file(speech_cache_key(text, language_code), _get_cache_dir())
+    if path:
+        _count('hits')
+        annotate(cache='hit')
+    return path
+
+
+def _claim_synthesis(key):
+    """
+    Find the in-flight synthesis of some audio, or register a new one.
+
+    Returns:
+        concurrent.futures.Future: The future for the audio's file path, which
+            the caller may take over with _take_synthesis()
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight[key] = Future()
+        return future
+
+
+def _take_synthesis(future):
+    """
+    Take over a synthesis that hasn't started yet, e.g. one still queued on the pool.
+
+    Returns:
+        bool: True if the caller must now run it with _run_synthesis()
+    """
+    with _inflight_lock:
+        if future.running() or future.done():
+            return False
+        return future.set_running_or_notify_cancel()
+
+
+def _run_synthesis(key, future, text, language_code):
+    """Synthesize a chunk taken with _take_synthesis(), and hand the result to everyone waiting on it."""
+    try:
+        path = _synthesize(text, language_code)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(path)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return path
+
+
+def _start_synthesis(text, language_code, context):
+    """
+    Start synthesizing one chunk on the pool, unless it is cached or already being synthesized.
+
+    Args:
+        text (str): The chunk
+        language_code (str): The language name for the text (e.g., "Spanish")
+        context (contextvars.Context): The context variables the synthesis runs in
+
+    Returns:
+        concurrent.futures.Future: A future for the chunk's file path
+    """
+    path = _cached_chunk(text, language_code)
+    if path:
+        future = Future()
+        future.set_result(path)
+        return future
+
+    key = speech_cache_key(text, language_code)
+    future = _claim_synthesis(key)
+    if not future.running() and not future.done():
+        app = current_app._get_current_object()
+
+        def run_in_app_context():
+            # A request may have taken the chunk over while this task was queued
+            if _take_synthesis(future):
+                with app.app_context():
+                    _run_synthesis(key, future, text, language_code)
+
+        _get_synthesis_pool().submit(context.run, run_in_app_context)
+    return future
+
+
+def get_chunk_files(chunks, language_code):
+    """
+    Synthesize sentence chunks in parallel on the bounded pool, and wait for all of them.
+
+    Cached chunks are served without touching the pool, and chunks already
+    being synthesized are waited on rather than queued again.
+
+    Args:
+        chunks (list): The chunks, as returned by split_sentences()
+        language_code (str): The language name for the text (e.g., "Spanish")
+
+    Returns:
+        list: The path of each chunk's MP3 file, in order, with None for chunks that failed
+    """
+    futures = [_start_synthesis(chunk, language_code, contextvars.copy_context()) for chunk in chunks]
+    return [future.result() for future in futures]
+
+
+def start_chunk_synthesis(chunks, language_code):
+    """
+    Start synthesizing sentence chunks in the background, without waiting.
+
+    Requests for the chunks that arrive while they are being synthesized
+    wait for that synthesis instead of starting their own.
+    """
+    for chunk in chunks:
+        # A fresh context, so the work isn't counted in the calling request's timings
+        _start_synthesis(chunk, language_code, contextvars.Context())
+
+
+def needs_synthesis(text, language_code):
+    """
+    Check whether fetching some audio would call gTTS, i.e. it is neither cached nor being synthesized.
+
+    Returns:
+        bool: True on a cache miss with no synthesis in flight
+    """
+    key = speech_cache_key(text, language_code)
+    with _inflight_lock:
+        if key in _inflight:
+            return False
+    return _cached_file(key, _get_cache_dir()) is None
+
+
+def get_chunk_file(text, language_code):
+    """
+    Get the path of the MP3 file for one sentence chunk.
+
+    A cached chunk is served straight from disk. A chunk already being
+    synthesized is waited on. Otherwise, including when the chunk is still
+    queued on the pool, the caller synthesizes it on its own thread, so a
+    chunk being played never waits behind unrelated work on the pool.
+
+    Returns:
+        str: The path of the MP3 file, or None if synthesis failed
+    """
+    path = _cached_chunk(text, language_code)
+    if path:
+        return path
+
+    key = speech_cache_key(text, language_code)
+    future = _claim_synthesis(key)
+    if _take_synthesis(future):
+        return _run_synthesis(key, future, text, language_code)
+    return future.result()
+
+
+@traced('tts.sentence')
+def _synthesize(text, language_code):
+    """
+    Get the path of an MP3 file for text synthesized in a single gTTS call, from the cache when possible.
+
+    Returns:
+        str: The path of the MP3 file, or None if synthesis failed
+    """
+    key = speech_cache_key(text, language_code)
+    cache_dir = _get_cache_dir()
+    path = os.path.join(cache_dir, f"{key}.mp3")
+
+    with _synthesis_lock(key):
+        if _cached_file(key, cache_dir):
+            _count('hits')
+            annotate(cache='hit')
+            return path
+        _count('misses')
+        annotate(cache='miss')
+
+        # Raises UpstreamBusyError, rather than failing quietly, so callers can ask the client to retry
+        release_slot = acquire_upstream_slot()
+        try:
+            try:
+                # Imported here so cold starts don't pay for gTTS and requests
+                from gtts import gTTS
+                
+                # Generate speech in memory, then publish the file atomically
+                buffer = io.BytesIO()
+                tts = gTTS(text=text, lang=get_tts_language(language_code), slow=False)
+                tts.write_to_fp(buffer)
+            finally:
+                release_slot()
+
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as audio_file:
+                audio_file.write(buffer.getbuffer())
+            os.replace(temp_path, path)
+        except Exception as e:
+            _count('errors')
+            logger.error(f"Error generating speech: {str(e)}")
+            return None
+
+    _evict_if_needed(cache_dir, buffer.getbuffer().nbytes)
+    return path
+
+
+@traced('tts')
+def get_speech_file(text, language_code):
+    """
+    Get the path of an MP3 file with speech audio for the given text.
+
+    The text is split into sentences, which are synthesized in parallel and
+    cached one by one, so a sentence repeated across messages is only
+    synthesized once. The sentences' MP3 frames are then joined into one
+    file for the whole text, which is cached too. Audio is cached on disk
+    under a hash of the text and language, bounded by TTS_CACHE_MAX_BYTES,
+    evicting the least recently used files first.
+
+    Args:
+        text (str): The text to convert to speech
+        language_code (str): The language name for the text (e.g., "Spanish")
+
+    Returns:
+        str: The path of the MP3 file, or None if synthesis failed
+    """
+    chunks = split_sentences(text)
+    if len(chunks) <= 1:
+        return _synthesize(text, language_code)
+
+    key = speech_cache_key(text, language_code)
+    cache_dir = _get_cache_dir()
+    path = _cached_file(key, cache_dir)
+    if path:
+        _count('hits')
+        annotate(cache='hit')
+        return path
+
+    chunk_paths = get_chunk_files(chunks, language_code)
+    if None in chunk_paths:
+        return None
+
+    path = os.path.join(cache_dir, f"{key}.mp3")
+    with _synthesis_lock(key):
+        if _cached_file(key, cache_dir):
+            return path
+
+        try:
+            # MP3 frames are self-contained, so the sentences' files can simply be joined
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as audio_file:
+                for chunk_path in chunk_paths:
+                    with open(chunk_path, "rb") as chunk_file:
+                        shutil.copyfileobj(chunk_file, audio_file)
+            os.replace(temp_path, path)
+        except Exception as e:
+            _count('errors')
+            logger.error(f"Error joining speech chunks: {str(e)}")
+            return None
+
+    _evict_if_needed(cache_dir, os.path.getsize(path))
+    return path
+
+
+@job_handler('tts.prerender')
+def prerender_speech(message_id, language_code):
+    """
+    Synthesize a message's audio ahead of its first play, so the play is a cache hit.
+
+    Args:
+        message_id (int): The message to synthesize
+        language_code (str): The language name for the text (e.g., "Spanish")
+    """
+    message = db.session.get(Message, message_id)
+    if message is None:
+        return
+
+    if get_speech_file(message.content, language_code) is None:
+        raise RuntimeError(f"Speech synthesis failed for message {message_id}")
+
+
 def generate_speech(text, language_code):
     """
     Generate speech audio for the given text in the specified language.
-    
+
     Args:
         text (str): The text to convert to speech
         language_code (str): The language code for the text
-        
+
     Returns:
         str: Base64-encoded audio data
     """
+    path = get_speech_file(text, language_code)
+    if not path:
+        return None
+
     try:
-        # Map language names to gTTS language codes
-        language_map = {
-            "English": "en",
-            "Spanish": "es",
-            "French": "fr",
-            "German": "de",
-            "Italian": "it",
-            "Portuguese": "pt",
-            "Chinese": "zh-CN",
-            "Japanese": "ja",
-            "Korean": "ko",
-            "Russian": "ru",
-            "Arabic": "ar",
-            "Hindi": "hi",
-            "Dutch": "nl",
-            "Swedish": "sv",
-            "Polish": "pl",
-            "Turkish": "tr"
-        }
-        
-        # Get the appropriate language code
-        tts_lang = language_map.get(language_code, "en")
-        
-        # Create temporary file for audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            temp_filename = temp_file.name
-            
-        # Generate speech
-        tts = gTTS(text=text, lang=tts_lang, slow=False)
-        tts.save(temp_filename)
-        
         # Read the file and encode to base64
-        with open(temp_filename, "rb") as audio_file:
-            audio_data = audio_file.read()
-            encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-            
-        # Clean up temporary file
-        os.unlink(temp_filename)
-        
-        return encoded_audio
-        
+        with open(path, "rb") as audio_file:
+            return base64.b64encode(audio_file.read()).decode('utf-8')
     except Exception as e:
         logger.error(f"Error generating speech: {str(e)}")
         return None
+
+
+def get_tts_cache_stats():
+    """
+    Get the audio cache counters.
+
+    Returns:
+        dict: Hit, miss, eviction and synthesis error counts, counting sentence
+              files and whole-text files alike
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -121,12 +121,191 @@ function startConversation(scenarioId) {
 }
 
 /**
- * Send a message to the chatbot
+ * Send a message to the chatbot, streaming the reply as it is generated
  * @param {string} message - The user's message
  */
 function sendMessage(message) {
     if (isProcessing || !activeConversationId) return;
     
+    // Fall back to a single JSON response on browsers without streaming fetch
+    if (!window.ReadableStream || !window.TextDecoder) {
+        sendMessageBlocking(message);
+        return;
+    }
+    
+    isProcessing = true;
+    
+    // Add user message to the UI immediately
+    const userMessage = {
+        id: 'temp-' + Date.now(),
+        content: message,
+        is_user: true,
+        timestamp: new Date().toISOString()
+    };
+    
+    addMessage(userMessage);
+    const userMessageElement = document.getElementById('message-' + userMessage.id);
+    
+    // Add a placeholder for the bot message that tokens are written into
+    const messagesContainer = document.getElementById('chat-messages');
+    const streamingElement = document.createElement('div');
+    streamingElement.className = 'message message-bot loading-message';
+    streamingElement.innerHTML = `
+        <div class="loading"><div></div><div></div><div></div><div></div></div>
+    `;
+    messagesContainer.appendChild(streamingElement);
+    
+    // Scroll to the bottom
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    
+    let streamedText = '';
+    let contentElement = null;
+    let botMessageReceived = false;
+    
+    // Make API request to stream the response
+    fetch('/api/send_message/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ message: message })
+    })
+    .then(response => {
+        if (response.status === 429) {
+            throw rateLimitError(response);
+        }
+        if (!response.ok || !response.body) {
+            throw new Error('Network response was not ok');
+        }
+        
+        return readEventStream(response, (event, data) => {
+            if (event === 'user_message') {
+                userMessageElement.id = 'message-' + data.id;
+            } else if (event === 'token') {
+                // Replace the loading indicator with the text on the first token
+                if (!contentElement) {
+                    streamingElement.classList.remove('loading-message');
+                    streamingElement.innerHTML = '<div class="message-content"></div>';
+                    contentElement = streamingElement.querySelector('.message-content');
+                }
+                
+                streamedText += data.text;
+                contentElement.textContent = streamedText;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            } else if (event === 'corrections') {
+                if (data.errors && data.errors.length > 0) {
+                    appendErrors(userMessageElement, data.errors);
+                }
+            } else if (event === 'translation') {
+                if (data.translated) {
+                    const translationDiv = document.createElement('div');
+                    translationDiv.className = 'message-translation bot-translation';
+                    translationDiv.textContent = data.translated;
+                    streamingElement.appendChild(translationDiv);
+                }
+            } else if (event === 'bot_message') {
+                // Swap the placeholder for the saved message, with its actions
+                streamingElement.replaceWith(createMessageElement(data));
+                botMessageReceived = true;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }
+        });
+    })
+    .then(() => {
+        if (!botMessageReceived) {
+            throw new Error('Stream ended before the message was saved');
+        }
+    })
+    .catch(error => {
+        console.error('Error sending message:', error);
+        
+        // Remove the partial response
+        streamingElement.remove();
+        
+        // Add error message
+        const errorMessage = {
+            id: 'error-' + Date.now(),
+            content: error.userMessage || 'Sorry, I encountered an error. Please try again.',
+            is_user: false,
+            timestamp: new Date().toISOString()
+        };
+        
+        addMessage(errorMessage);
+    })
+    .finally(() => {
+        isProcessing = false;
+    });
+}
+
+/**
+ * Build an error for a rate-limited (429) response
+ * @param {Response} response - The fetch response
+ * @returns {Error} An error with a message for the user saying when to retry
+ */
+function rateLimitError(response) {
+    const seconds = parseInt(response.headers.get('Retry-After'), 10) || 1;
+    const error = new Error('Rate limited');
+    error.userMessage = `Too many requests right now. Please wait ${seconds} second${seconds === 1 ? '' : 's'} and try again.`;
+    return error;
+}
+
+/**
+ * Read a Server-Sent Events stream from a fetch response
+ * @param {Response} response - The streaming fetch response
+ * @param {function} onEvent - Called with (eventName, data) for each event
+ * @returns {Promise} - Resolves when the stream ends
+ */
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    function processFrames() {
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+    
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                buffer += decoder.decode();
+                processFrames();
+                return;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            processFrames();
+            return pump();
+        });
+    }
+    
+    return pump();
+}
+
+/**
+ * Send a message to the chatbot and wait for the complete response
+ * @param {string} message - The user's message
+ */
+function sendMessageBlocking(message) {
+    if (isProcessing || !activeConversationId) return;
+    
     isProcessing = true;
     
     // Add user message to the UI immediately
@@ -160,6 +339,9 @@ function sendMessage(message) {
         body: JSON.stringify({ message: message })
     })
     .then(response => {
+        if (response.status === 429) {
+            throw rateLimitError(response);
+        }
         if (!response.ok) {
             throw new Error('Network response was not ok');
         }
@@ -177,20 +359,7 @@ function sendMessage(message) {
                 userMessageElement.id = 'message-' + data.user_message.id;
                 
                 // Add error highlighting
-                const errorsContainer = document.createElement('div');
-                errorsContainer.className = 'message-errors';
-                
-                data.user_message.errors.forEach(error => {
-                    const errorDiv = document.createElement('div');
-                    errorDiv.className = 'message-error';
-                    errorDiv.innerHTML = `
-                        <div class="error-text">${escapeHtml(error.error_text)}</div>
-                        <div class="message-correction">✓ ${escapeHtml(error.correction)}</div>
-                    `;
-                    errorsContainer.appendChild(errorDiv);
-                });
-                
-                userMessageElement.appendChild(errorsContainer);
+                appendErrors(userMessageElement, data.user_message.errors);
             }
         }
         
@@ -206,7 +375,7 @@ function sendMessage(message) {
         // Add error message
         const errorMessage = {
             id: 'error-' + Date.now(),
-            content: 'Sorry, I encountered an error. Please try again.',
+            content: error.userMessage || 'Sorry, I encountered an error. Please try again.',
             is_user: false,
             timestamp: new Date().toISOString()
         };
@@ -224,6 +393,19 @@ function sendMessage(message) {
  */
 function addMessage(message) {
     const messagesContainer = document.getElementById('chat-messages');
+    
+    messagesContainer.appendChild(createMessageElement(message));
+    
+    // Scroll to the bottom
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+/**
+ * Build the DOM element for a chat message
+ * @param {object} message - The message object to display
+ * @returns {HTMLElement} - The message element
+ */
+function createMessageElement(message) {
     const messageElement = document.createElement('div');
     
     messageElement.id = 'message-' + message.id;
@@ -261,24 +443,9 @@ function addMessage(message) {
     
     // Add errors if message has them
     if (message.errors && message.errors.length > 0) {
-        const errorsContainer = document.createElement('div');
-        errorsContainer.className = 'message-errors';
-        
-        message.errors.forEach(error => {
-            const errorDiv = document.createElement('div');
-            errorDiv.className = 'message-error';
-            errorDiv.innerHTML = `
-                <div class="error-text">${escapeHtml(error.error_text)}</div>
-                <div class="message-correction">✓ ${escapeHtml(error.correction)}</div>
-            `;
-            errorsContainer.appendChild(errorDiv);
-        });
-        
-        messageElement.appendChild(errorsContainer);
+        appendErrors(messageElement, message.errors);
     }
     
-    messagesContainer.appendChild(messageElement);
-    
     // Add event listener to speak button
     if (!message.is_user) {
         const speakButton = messageElement.querySelector('.speak-button');
@@ -290,8 +457,29 @@ function addMessage(message) {
         }
     }
     
-    // Scroll to the bottom
-    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    return messageElement;
+}
+
+/**
+ * Append error highlighting to a user message element
+ * @param {HTMLElement} messageElement - The user message element
+ * @param {Array} errors - The errors detected in the message
+ */
+function appendErrors(messageElement, errors) {
+    const errorsContainer = document.createElement('div');
+    errorsContainer.className = 'message-errors';
+    
+    errors.forEach(error => {
+        const errorDiv = document.createElement('div');
+        errorDiv.className = 'message-error';
+        errorDiv.innerHTML = `
+            <div class="error-text">${escapeHtml(error.error_text)}</div>
+            <div class="message-correction">✓ ${escapeHtml(error.correction)}</div>
+        `;
+        errorsContainer.appendChild(errorDiv);
+    });
+    
+    messageElement.appendChild(errorsContainer);
 }
 
 /**
@@ -310,31 +498,7 @@ function speakMessage(messageId) {
         `;
     }
     
-    // Make API request to get TTS audio
-    fetch('/api/get_tts', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({ message_id: messageId })
-    })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error('Network response was not ok');
-        }
-        return response.json();
-    })
-    .then(data => {
-        if (data.audio_data) {
-            // Play the audio
-            const audio = new Audio(`data:audio/mp3;base64,${data.audio_data}`);
-            audio.play();
-        }
-    })
-    .catch(error => {
-        console.error('Error getting TTS:', error);
-    })
-    .finally(() => {
+    const restoreButton = () => {
         if (speakButton) {
             speakButton.disabled = false;
             speakButton.innerHTML = `
@@ -346,7 +510,10 @@ function speakMessage(messageId) {
                 Listen
             `;
         }
-    });
+    };
+    
+    // Play sentence by sentence, so playback starts once the first sentence is ready
+    playMessageSpeech(messageId, { onStart: restoreButton, onEnd: restoreButton });
 }
 
 /**
@@ -450,7 +617,7 @@ function renderReview(reviewData) {
                 <div class="error-category">
                     <h3 class="error-category-title">
                         ${categoryIcon}
-                        ${capitalizeFirstLetter(category)} Errors (${errors.length})
+                        ${capitalizeFirstLetter(category)} Errors (${(reviewData.error_counts && reviewData.error_counts[category]) || errors.length})
                     </h3>
                     <div class="error-list">
                         ${errorListHTML}
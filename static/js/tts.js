@@ -1,4 +1,4 @@
-// tts.js - Text-to-speech functionality using the Web Speech API
+// tts.js - Text-to-speech playback of server-side speech, with the Web Speech API as a fallback
 
 // Check if browser supports Web Speech API (as a fallback option)
 const speechSynthesisSupported = 'speechSynthesis' in window;
@@ -76,3 +76,111 @@ if (speechSynthesisSupported) {
         console.log('Voices loaded for Web Speech API');
     };
 }
+
+// The message currently being played sentence by sentence, so a new play can stop it
+let currentSpeech = null;
+
+/**
+ * Stop the server-side speech that is playing, if any
+ */
+function stopSpeech() {
+    if (currentSpeech) {
+        currentSpeech.stopped = true;
+        currentSpeech.audios.forEach(audio => {
+            audio.pause();
+            audio.removeAttribute('src');
+        });
+        currentSpeech = null;
+    }
+}
+
+/**
+ * Play a message's server-side speech sentence by sentence
+ * 
+ * Fetches the list of sentence chunks, then plays them in order, loading
+ * the next chunk while the current one plays. Playback starts as soon as
+ * the first sentence is ready rather than after the whole message. If a
+ * chunk can't be played, the rest of the message falls back to the
+ * Web Speech API.
+ * 
+ * @param {string} messageId - The ID of the message to speak
+ * @param {Object} callbacks - Optional onStart (first chunk playing) and onEnd (finished, stopped or failed) handlers
+ */
+function playMessageSpeech(messageId, { onStart = () => {}, onEnd = () => {} } = {}) {
+    stopSpeech();
+    const speech = { stopped: false, audios: [] };
+    currentSpeech = speech;
+    
+    let started = false;
+    let finished = false;
+    const finish = () => {
+        if (!finished) {
+            finished = true;
+            if (currentSpeech === speech) {
+                currentSpeech = null;
+            }
+            onEnd();
+        }
+    };
+    
+    fetch(`/api/tts/${encodeURIComponent(messageId)}/chunks`)
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Chunk list request failed with status ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        const chunks = data.chunks;
+        if (speech.stopped || chunks.length === 0) {
+            finish();
+            return;
+        }
+        
+        // Created on demand, so at most the current chunk and the next are loading
+        const audioFor = index => {
+            if (!speech.audios[index]) {
+                const audio = new Audio(chunks[index].url);
+                audio.preload = 'auto';
+                speech.audios[index] = audio;
+            }
+            return speech.audios[index];
+        };
+        
+        const fallBack = (index, error) => {
+            console.error('Error playing TTS chunk:', error);
+            if (!speech.stopped) {
+                speakTextFallback(chunks.slice(index).map(chunk => chunk.text).join(' '), data.language);
+            }
+            finish();
+        };
+        
+        const playChunk = index => {
+            if (speech.stopped || index >= chunks.length) {
+                finish();
+                return;
+            }
+            
+            const audio = audioFor(index);
+            audio.addEventListener('playing', () => {
+                if (!started) {
+                    started = true;
+                    onStart();
+                }
+                // Start loading the next sentence while this one plays
+                if (index + 1 < chunks.length) {
+                    audioFor(index + 1);
+                }
+            }, { once: true });
+            audio.addEventListener('ended', () => playChunk(index + 1), { once: true });
+            audio.addEventListener('error', () => fallBack(index, audio.error), { once: true });
+            audio.play().catch(error => fallBack(index, error));
+        };
+        
+        playChunk(0);
+    })
+    .catch(error => {
+        console.error('Error getting TTS:', error);
+        finish();
+    });
+}
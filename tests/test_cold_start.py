@@ -0,0 +1,32 @@
+"""Creating the app must not import the OpenRouter or gTTS clients."""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only needed once a request calls OpenRouter or gTTS
+LAZY_MODULES = ("openai", "gtts", "httpx")
+
+COLD_START = """
+import json, sys
+from app import create_app
+create_app()
+print(json.dumps([name for name in sys.argv[1:] if name in sys.modules]))
+"""
+
+
+def test_create_app_leaves_clients_unimported(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'cold.db'}", JOB_WORKERS="0")
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START, *LAZY_MODULES],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    assert json.loads(result.stdout.splitlines()[-1]) == []
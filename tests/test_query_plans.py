@@ -0,0 +1,37 @@
+"""The hot queries must search an index once the migrations have run."""
+
+import pytest
+from sqlalchemy import create_engine
+
+import models  # noqa: F401  (registers the tables)
+from extensions import db
+from migrations import upgrade, hot_queries, explain, plan_problem, check_query_plans
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", sorted(hot_queries()))
+def test_hot_query_uses_index(engine, name):
+    with engine.connect() as connection:
+        plan = explain(connection, hot_queries()[name])
+
+    assert any("USING INDEX" in step or "USING COVERING INDEX" in step for step in plan), plan
+    assert not any(step.startswith("SCAN") for step in plan), plan
+
+
+def test_check_query_plans_passes(engine):
+    assert check_query_plans(engine) == []
+
+
+def test_plan_problem_flags_scans():
+    assert plan_problem(["SCAN message"]) == "SCAN message"
+    assert plan_problem(["SCAN message USING COVERING INDEX ix_message_conversation_id_id"])
+    assert plan_problem(["SEARCH message USING INTEGER PRIMARY KEY (rowid=?)"]).startswith("no index used")
+    assert plan_problem(["SEARCH message USING INDEX ix_message_conversation_id_id (conversation_id=?)"]) is None